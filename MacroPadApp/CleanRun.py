@@ -1,17 +1,17 @@
+import argparse
 import os
 import sys
 import shutil
-import subprocess
+import runpy
 
 project_root = os.path.dirname(os.path.abspath(__file__))
-gui_folder = os.path.join(project_root, "gui")
-sys.path.insert(0, gui_folder)
+sys.path.insert(0, project_root)
 
 '''
-Clears the old pycache if it exists then runs the main program "MacroPadGUI.py"
+Clears the old pycache if it exists
 
 Parameters:
-    root_dir: 
+    root_dir:
         The directory of the root folder
 '''
 def clearCache(root_dir):
@@ -23,9 +23,20 @@ def clearCache(root_dir):
                 shutil.rmtree(full_path, ignore_errors=True) # recursively delete "__pycache__" directory and all its contents, suppress errors as well
 
 if __name__ == "__main__":
-    project_root = os.path.dirname(os.path.abspath(__file__)) # get the absolute path the project is at 
-    gui_folder = os.path.join(project_root, "gui") # set the gui folder to the project root
-    clearCache(project_root) # call clearCache on project_root to delete all "__pycache__" folders inside project
+    parser = argparse.ArgumentParser(description="Run the MacroPad app") # command line options
+    parser.add_argument("--clean", action="store_true", help="delete every __pycache__ first (forces a full recompile)") # only when asked, it slows the start
+    parser.add_argument("--headless", action="store_true", help="run without a window or tray icon") # service mode
+    parser.add_argument("--profile-startup", action="store_true", help="report how long each module took to import and set up") # startup profile
+    args, rest = parser.parse_known_args() # anything else goes to the program being run
 
-    print("\nLaunching MacroPadGUI...\n") # output that gui is about to launch
-    subprocess.run(["python", "-m", "gui.MacroPadGUI"], cwd=project_root) # run "MacroPadGUI.py" as a new python process
\ No newline at end of file
+    if args.clean: # stale bytecode is suspected
+        clearCache(project_root) # call clearCache on project_root to delete all "__pycache__" folders inside project
+
+    if args.profile_startup: # startup profile wanted
+        os.environ["MACROPAD_PROFILE_STARTUP"] = "1" # picked up by logic.StartupProfile when the app imports it
+
+    module = "logic.MacroPadService" if args.headless else "gui.MacroPadGUI" # what to run
+    print(f"\nLaunching {module}...\n") # output what is about to launch
+    os.chdir(project_root) # run from the project folder like before
+    sys.argv = [module] + rest # pass the remaining options on
+    runpy.run_module(module, run_name="__main__", alter_sys=True) # run it in this process, no second interpreter start
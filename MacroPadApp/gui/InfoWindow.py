@@ -1,4 +1,6 @@
 import tkinter as tk
+from tkinter import messagebox
+from logic.LatencyStats import LatencyStats
 from logic.Logger import Logger
 from logic.AutoStartManager import AutoStartManager
 
@@ -26,7 +28,7 @@ class InfoWindow:
         self.master = master # Tkinter as parent class
         self.top_level = tk.Toplevel(self.master) # creates new window that is child of the main window
         self.top_level.title("MacroPad Info") # title of the new window
-        self.top_level.geometry("500x525") # size of the new window
+        self.top_level.geometry("500x720") # size of the new window
         self.centerWindow() # call center window function to center the window when created and displayed
         self.toggle_autostart = toggle_autostart # create the toggle autostart widget
         self.check_autostart = check_autostart # create the check autostart widget
@@ -48,7 +50,7 @@ class InfoWindow:
         try: # handle errors with grace
             self.top_level = tk.Toplevel(self.master) # creates new window that is child of the main window
             self.top_level.title("MacroPad Info") # title of the new window
-            self.top_level.geometry("500x525") # size of the new window
+            self.top_level.geometry("500x720") # size of the new window
             self.centerWindow() # call center window function to center the window when created and displayed
             self.createWidgets() # call create widgets to put them onto the new window
         except Exception as e: # gracefully handle errors so program doesnt crash
@@ -103,8 +105,16 @@ class InfoWindow:
                 label.pack(padx=20, pady=2, fill="x") # add label to window
                 self.button_status_dict[f"Button {i} pressed"] = label # map status key to label widget
 
+            latency_label = tk.Label(self.top_level, text="Key Press Latency") # create label for the latency section
+            latency_label.pack(padx=20, pady=(10, 2), anchor="w") # add label to window with padding
+            self.latency_text = tk.Label(self.top_level, text="", font=("Courier", 9), justify="left", anchor="w") # table of p50/p99/max per stage
+            self.latency_text.pack(padx=20, pady=2, fill="x") # add table to window
+            dump_button = tk.Button(self.top_level, text="Dump Latency", command=self.dumpLatency) # writes the histograms to a file
+            dump_button.pack(padx=20, pady=5) # add button to window
+
             if self.button_status: # if a button status function is provided
                 self.updateButtonStatus() # call it to update status in real-time
+            self.updateLatency() # show the latency stats and keep them current
         except Exception as e: # gracefully handle errors so program doesnt crash
             Logger.error(f"Error creating widgets {e}") # log error if widget creation fails
             self.top_level = None # ensure toplevel is None
@@ -132,6 +142,38 @@ class InfoWindow:
             self.top_level.after(1000, self.updateButtonStatus) # if so then update the buttons status again after 1s
 
 
+    '''
+    Shows the latest latency stats and refreshes them every second.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def updateLatency(self):
+        if not (self.top_level and self.top_level.winfo_exists()): # window was closed
+            return # stop refreshing
+        try: # handle errors with grace
+            self.latency_text.config(text=LatencyStats.formatSummary(LatencyStats.summary())) # refresh the table
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error updating latency stats: {e}") # log error if update fails
+        self.top_level.after(1000, self.updateLatency) # update again after 1s
+
+    '''
+    Writes the latency histograms to the dump file.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def dumpLatency(self):
+        try: # handle errors with grace
+            path = LatencyStats.dump() # write the dump
+            Logger.info(f"Latency stats written to {path}") # log where it went
+            messagebox.showinfo("Latency", f"Latency stats written to\n{path}") # tell the user
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error dumping latency stats: {e}") # log error if the dump fails
+            messagebox.showerror("Error", "Failed to write latency stats.") # show error popup to user
+
     '''
     Toggles whether or not the auto start is set.
     
@@ -1,9 +1,12 @@
 # log_analyzer_window.py
+import queue
+import threading
 import tkinter as tk
+from collections import deque
 from tkinter import messagebox
-import os
-import subprocess
+from logic.LogAnalyzer import LogAnalyzer
 from logic.Logger import Logger
+from logic.Settings import Settings
 
 '''
 Handles the logic and viewing of the log analyzer window and functionality
@@ -23,8 +26,11 @@ class LogAnalyzerWindow:
         self.master = master # set instance of parent class
         self.top_level = tk.Toplevel(self.master) # child window floating above main window
         self.top_level.title("Log Analyzer") # title of the popup window
-        self.top_level.geometry("300x200") # size of the popup window
+        self.top_level.geometry("600x500") # size of the popup window
         self.top_level.protocol("WM_DELETE_WINDOW",self.onClose)
+        self.results = queue.Queue() # progress and results passed from the analysis thread to the Tk thread
+        self.cancel_event = threading.Event() # stops a running analysis when the window closes
+        self.analysis_thread = None # thread running the current analysis
         self.createWidgets() # helper method to build buttons and textboxes
 
     '''
@@ -35,6 +41,7 @@ class LogAnalyzerWindow:
             instance of object
     '''
     def onClose(self):
+        self.cancel_event.set() # stop any analysis still running
         self.top_level.destroy() # destory the window
         Logger.info("Closing Analyzer window.")
 
@@ -55,43 +62,106 @@ class LogAnalyzerWindow:
         self.date_filter_entry = tk.Entry(self.top_level) # textbox where user can type
         self.date_filter_entry.pack() # stick it into the window
 
+        tk.Label(self.top_level, text="Date End (YYYY-MM-DD):").pack() # text label for the end date
+        self.date_end_entry = tk.Entry(self.top_level) # textbox where user can type
+        self.date_end_entry.pack() # stick it into the window
+
         tk.Label(self.top_level, text="Keyword:").pack() # text label for keyword
         self.keyword = tk.Entry(self.top_level) # textbox where user can type
         self.keyword.pack() # stick it into the window
 
-        analyze_button = tk.Button(self.top_level, text="Analyze", command=self.runRustAnalysis) # add button that when pressed runs the rust log analysis
-        analyze_button.pack(pady=10) # add to window and add padding
+        self.analyze_button = tk.Button(self.top_level, text="Analyze", command=self.runAnalysis) # add button that when pressed runs the log analysis
+        self.analyze_button.pack(pady=10) # add to window and add padding
+
+        self.progress_label = tk.Label(self.top_level, text="") # shows how far along the analysis is
+        self.progress_label.pack() # stick it into the window
+
+        self.output = tk.Text(self.top_level, height=15, wrap="none") # matching lines and the summary
+        self.output.pack(fill="both", expand=True, padx=5, pady=5) # fill the rest of the window
 
     '''
-    Runs the rustc program executable
+    Starts the log analysis on a background thread so the window stays responsive.
 
     Parameters:
         self:
             instance of object
     '''
-    def runRustAnalysis(self):
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        exe_path = os.path.join(project_root, "log_analyzer.exe") # creates full path to executable file of the log analyzer
-        if not os.path.isfile(exe_path): # if the executable is not found
-            Logger.error(f"Executable not found: {exe_path}") # log the error
-            messagebox.showerror("Executable Not Found", f"Could not find:\n{exe_path}\n\nMake sure the file exists.") # tell the user
+    def runAnalysis(self):
+        if self.analysis_thread and self.analysis_thread.is_alive(): # one analysis at a time
             return # return early
-
         log_type = self.log_type_entry.get() # gets the value the user typed into the log type text field
         date_filter = self.date_filter_entry.get() # gets the value the user typed into the date entry start text field
+        date_end = self.date_end_entry.get() # gets the value the user typed into the date entry end text field
         keyword = self.keyword.get() # gets the value the user typed into the keyword text field
 
-        cmd = [exe_path] # list with executable fiel path is the first element, will contain full command line argument to run
-        if log_type: # if there is a log type entered
-            cmd.extend(["--type", log_type]) # add it to the cmd argument
-        if date_filter: # if there is a start date entered
-            cmd.extend(["--date", date_filter]) # add it to the cmd argument
-        if keyword: # if there is a key word that was entered
-            cmd.extend(["--keyword", keyword]) # add it to the cmd argument
+        self.cancel_event.clear() # allow the new analysis to run
+        self.analyze_button.config(state="disabled") # no second analysis while this one runs
+        self.output.delete("1.0", tk.END) # clear the last results
+        self.progress_label.config(text="Analyzing...") # tell the user it started
+        self.analysis_thread = threading.Thread(target=self.analysisWorker, args=(log_type, date_filter, date_end, keyword), daemon=True) # create the analysis thread
+        self.analysis_thread.start() # run it
+        self.top_level.after(100, self.pollResults) # start checking for progress
+        Logger.info(f"Log analysis ran with: type={log_type!r} date={date_filter!r}..{date_end!r} keyword={keyword!r}") # log the filters used
 
+    '''
+    Runs the analysis, only ever talks to the Tk thread through the results queue.
+
+    Parameters:
+        self:
+            instance of object
+        log_type:
+            level filter
+        date_filter:
+            start date filter
+        date_end:
+            end date filter
+        keyword:
+            keyword filter
+    '''
+    def analysisWorker(self, log_type, date_filter, date_end, keyword):
+        lines = deque(maxlen=Settings.ANALYZER_MAX_LINES) # keep only the newest matching lines so memory stays bounded
         try: # handle errors with grace
-            subprocess.run(cmd, check=True) # try to run executable file passing the cmd argument line
-            Logger.info(f"Log analysis ran with: {' '.join(cmd)}") # log that the process was successfully executed
-        except subprocess.CalledProcessError as e: # gracefully handle errors as to not crash program
-            Logger.error(f"Log analysis failed: {e}") # log that the processes was unsuccessful
-            messagebox.showerror("Analysis Failed", f"Log analysis failed to run.\nError: {e}") # tell the user of the failed execution
+            summary = LogAnalyzer().analyze(log_type, date_filter, date_end, keyword,
+                progress_callback=lambda done, total: self.results.put(("progress", (done, total))), # report progress
+                line_callback=lines.append, # collect matching lines
+                cancel_event=self.cancel_event, # stop when the window closes
+                max_lines=Settings.ANALYZER_MAX_LINES) # only the newest lines are shown, lets a keyword search run in parallel
+            self.results.put(("done", (summary, list(lines)))) # hand the results to the Tk thread
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Log analysis failed: {e}") # log that the analysis was unsuccessful
+            self.results.put(("error", e)) # tell the Tk thread
+
+    '''
+    Shows progress and results sent by the analysis thread, runs on the Tk thread.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def pollResults(self):
+        if not self.top_level.winfo_exists(): # window was closed
+            return # stop polling
+        finished = False # whether the analysis has ended
+        while True: # take everything waiting
+            try: # handle errors with grace
+                kind, value = self.results.get_nowait() # next message from the thread
+            except queue.Empty: # nothing more waiting
+                break # done for now
+            if kind == "progress": # progress update
+                done, total = value # bytes read and total bytes
+                self.progress_label.config(text=f"Analyzing... {done * 100 // max(total, 1)}%") # show the percentage
+            elif kind == "done": # analysis finished
+                summary, lines = value # counts and the newest matching lines
+                if summary['total'] > len(lines): # not every line is shown
+                    self.output.insert(tk.END, f"(showing the last {len(lines)} of {summary['total']} matching lines)\n") # say so
+                self.output.insert(tk.END, "\n".join(lines) + "\n\n" + LogAnalyzer.formatSummary(summary)) # show the lines and the summary
+                self.progress_label.config(text="Done") # tell the user it finished
+                finished = True # stop polling
+            elif kind == "error": # analysis failed
+                self.progress_label.config(text="Failed") # tell the user it failed
+                messagebox.showerror("Analysis Failed", f"Log analysis failed to run.\nError: {value}") # tell the user of the failed analysis
+                finished = True # stop polling
+        if finished: # nothing more will arrive
+            self.analyze_button.config(state="normal") # allow another analysis
+        else: # still running
+            self.top_level.after(100, self.pollResults) # check again shortly
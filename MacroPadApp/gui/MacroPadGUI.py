@@ -1,13 +1,14 @@
+from logic.StartupProfile import StartupProfile
 import tkinter as tk
-import threading
-import subprocess
-import time
 from gui.UIController import UIController
+from logic.ActionExecutor import ActionExecutor
 from logic.AutoStartManager import AutoStartManager
 from logic.ConnectionManager import ConnectionManager
+from logic.DeviceManager import DeviceManager
 from logic.Logger import Logger
 from logic.MacroManager import MacroManager
 from logic.SerialManager import SerialManager
+from logic.Settings import Settings
 from gui.SystemTrayIcon import SystemTrayIcon
 import sys
 
@@ -28,30 +29,52 @@ class MacroPadApp:
     def __init__(self, master):
         try: # handle errors with grace
             self.master = master # main Tkinter window
-            self.stop_event = threading.Event() # event to signal background threads to stop
+            self.status_dots = 0 # dots shown after "Connecting", minus one
             self.serial_manager = SerialManager() # initialize the serial manager
             self.macro_manager = MacroManager() # initialize the macro manager
+            self.action_executor = ActionExecutor() # initialize the action executor that runs macro commands
             self.auto_start_manager = AutoStartManager() # initialize the auto-start manager
             self.logger = Logger() # initialize the logger
-            self.connection_manager = ConnectionManager(self.serial_manager, self.macro_manager, self.updateStatus, self.toggleButtons, self.runAction) # initialize ConnectionManager
+            self.connection_manager = (DeviceManager if Settings.MULTI_DEVICE else ConnectionManager)(self.serial_manager, self.macro_manager, self.updateStatus, self.toggleButtons, self.runAction) # initialize ConnectionManager
             self.ui_controller = UIController(master, self.serial_manager, self.macro_manager, self.auto_start_manager, self.connection_manager) # initialize UIController
             self.ui_controller.master.hideWindow = self.hideWindow # pass method from uicontroller of hideWindow
-            self.tray_icon = SystemTrayIcon(self.restoreWindow, self.ui_controller.quitApplication) # initialize SystemTrayIcon
-            self.tray_icon.setupIcon() # setup the icon for the systems tray
+            self.tray_icon = SystemTrayIcon(self.restoreWindow, self.quitFromTray) # initialize SystemTrayIcon, the icon itself is set up once the window is drawn
+            StartupProfile.mark("managers") # time to set up the managers
         except Exception as e: # gracefully handle errors so program doesnt crash
             Logger.error(f"Error during initialization: {e}") # log error
         try: # handle errors with grace
             self.ui_controller.createWidgets() # create widgets for the GUI
+            StartupProfile.mark("widgets") # time to create the widgets
         except Exception as e: # gracefully handle errors so program doesnt crash
             Logger.error(f"Error creating widgets: {e}") # log error
         try: # handle errors with grace
-            threading.Thread(target=self.connection_manager.connectionManager, daemon=True).start() # start the connection manager in the background thread
+            self.master.after_idle(self.startBackground) # queued behind the first draw, so the window shows before the serial stack and tray start
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error scheduling background start: {e}") # log error
+
+    '''
+    Starts the connection and status threads and sets up the tray icon, run once the main window has been drawn.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def startBackground(self):
+        self.master.update_idletasks() # finish drawing the window before the slower setup below
+        StartupProfile.mark("first frame") # time until the window was drawn
+        try: # handle errors with grace
+            self.connection_manager.start() # connect, listen and reconnect on the runtime's event loop
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error starting connection manager: {e}") # log error
+        try: # handle errors with grace
+            self.tray_icon.setupIcon() # setup the icon for the systems tray
         except Exception as e: # gracefully handle errors so program doesnt crash
-            Logger.error(f"Error starting connection manager thread: {e}") # log error
+            Logger.error(f"Error setting up tray icon: {e}") # log error
         try: # handle errors with grace
-            self.master.after(10, lambda: threading.Thread(target=self.animateStatus, daemon=True).start()) # animate the status after a short delay
+            self.master.after(10, self.animateStatus) # animate the status after a short delay
         except Exception as e: # gracefully handle errors so program doesnt crash
-            Logger.error(f"Error starting animation thread: {e}") # log error
+            Logger.error(f"Error starting status animation: {e}") # log error
+        StartupProfile.finish("tray icon") # report the start if profiling
 
     '''
     Handles the hidding of the gui.
@@ -63,7 +86,7 @@ class MacroPadApp:
     def hideWindow(self):
         try: # handle errors with grace
             self.master.withdraw() # hide the main window
-            threading.Thread(target=self.tray_icon.run, daemon=True).start() # show tray icon
+            self.tray_icon.run() # show tray icon
         except Exception as e: # gracefully handle errors so program doesnt crash
             Logger.error(f"Error hiding window: {e}") # log error
 
@@ -76,29 +99,37 @@ class MacroPadApp:
     '''
     def restoreWindow(self):
         try: # handle errors with grace
-            self.master.deiconify() # show the main window
+            self.ui_controller.dispatcher.post('window', self.master.deiconify) # show the main window, called from the tray thread so Tk does it on its next tick
             self.tray_icon.setVisible(False) # hide the tray icon
         except Exception as e: # gracefully handle errors so program doesnt crash
             Logger.error(f"Error restoring window: {e}") # log error
 
     '''
-    Animates the trailing dots in connecting.
+    Quits from the tray menu, which runs on the tray thread.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def quitFromTray(self):
+        self.ui_controller.dispatcher.post('quit', self.ui_controller.quitApplication) # Tk closes the window on its next tick
+
+    '''
+    Animates the trailing dots in connecting, runs on a Tk timer every half second.
 
     Parameters:
         self:
             intance of object
     '''
     def animateStatus(self):
-        dots = 0 # default to 0 dots
-        while True: # activate while unbroken
-            if not self.serial_manager.isConnected(): # if not already connected
-                text = "Connecting" + "." * (dots + 1) # update status with dots
+        try: # handle errors with grace
+            if not self.connection_manager.isConnected(): # if not already connected
+                text = "Connecting" + "." * (self.status_dots + 1) # update status with dots
                 self.ui_controller.updateStatus(text) # pass the new status to the UIController
-                dots = (dots + 1) % 3 # cycle through 1, 2, 3 dots
-            try: # handle errors with grace
-                time.sleep(0.5) # pause for half a second before updating again
-            except Exception as e: # gracefully handle errors so program doesnt crash
-                Logger.error(f"Error in animateStatus: {e}") # log error
+                self.status_dots = (self.status_dots + 1) % 3 # cycle through 1, 2, 3 dots
+            self.master.after(500, self.animateStatus) # update again in half a second
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error in animateStatus: {e}") # log error, the window is most likely gone
 
     '''
     Updates the status of the device connection to controller.
@@ -138,11 +169,18 @@ class MacroPadApp:
             instance of object
         command:
             the system command to be run
+        arrival:
+            time.perf_counter_ns when the key press arrived, for the latency stats (optional)
+        on_exit:
+            called once the command has finished (optional)
+    Returns:
+        future of the command, None if it was not started
     '''
-    def runAction(self, command):
+    def runAction(self, command, arrival=None, on_exit=None):
         try: # handle errors with grace
-            subprocess.Popen(command, shell=True) # execute the command
+            future = self.action_executor.submit(command, arrival=arrival, on_exit=on_exit) # hand the command to the executor so it starts off this thread
             Logger.info(f"Running command: {command}") # log the action
+            return future # return the future
         except Exception as e: # gracefully handle errors so program doesnt crash
             Logger.error(f"Failed to run command {command}: {e}") # log error if the command fails
 
@@ -151,6 +189,7 @@ class MacroPadApp:
 if __name__ == "__main__":
     try: # handle errors with grace
         root = tk.Tk() # create the main Tkinter window
+        StartupProfile.mark("imports and Tk") # time to load the modules and start Tk
         app = MacroPadApp(root) # initialize the MacroPadApp with the root window
         root.mainloop() # start the Tkinter event loop to keep the window open
     except Exception as e: # gracefully handle errors so program doesnt crash
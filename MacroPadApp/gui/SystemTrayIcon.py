@@ -1,6 +1,3 @@
-import pystray
-from pystray import MenuItem as item
-from PIL import Image, ImageDraw
 from logic.Logger import Logger
 import threading
 
@@ -33,6 +30,13 @@ class SystemTrayIcon:
             instance of object
     '''
     def setupIcon(self):
+        try: # handle errors with grace
+            import pystray # imported on first use, pystray and PIL are slow to load and the main window does not need them
+            from pystray import MenuItem as item
+            from PIL import Image, ImageDraw
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error loading system tray support: {e}") # log the error
+            return # no tray icon without them
         try: # handle errors with grace
             icon_image = Image.new('RGB', (64, 64), color=(255, 255, 255)) # create new image for system tray (blue square)
             draw = ImageDraw.Draw(icon_image) # draw object for the icon_image
@@ -89,7 +93,9 @@ class SystemTrayIcon:
             instance of object
     '''
     def run(self):
-        if self.icon: # if icon exists
+        if self.icon_thread and self.icon_thread.is_alive(): # already running from an earlier hide
+            self.setVisible(True) # just show it again
+        elif self.icon: # if icon exists
             '''
             Tries to run the icon on the system tray.
             '''
@@ -1,8 +1,8 @@
 import tkinter as tk
 from tkinter import simpledialog
+from gui.UIDispatcher import UIDispatcher
 from logic.Logger import Logger
-from gui.InfoWindow import InfoWindow
-from gui.LogAnalyzerWindow import LogAnalyzerWindow
+from logic.Protocol import Protocol
 
 '''
 Controlls the UI functionality and handles the updating of the GUI
@@ -36,6 +36,8 @@ class UIController:
         self.button_states = {f"Button {i} pressed": "Disabled" for i in range(1, 10)} # track each button's state
         self.status_label = tk.Label(self.master, text="Connecting.") # label to show status
         self.status_label.grid(row=0, column=0, columnspan=3) # place status label on the window grid
+        self.dispatcher = UIDispatcher(self.master) # background threads post their updates here
+        self.dispatcher.start() # the Tk loop applies them on every tick
 
     '''
     Creates, handles and manages widgets on the screen
@@ -81,7 +83,7 @@ class UIController:
 
 
     '''
-    Updates status of the GUI based on passed message.
+    Updates status of the GUI based on passed message, safe to call from any thread.
 
     Parameters:
         self:
@@ -90,10 +92,10 @@ class UIController:
             status of the device
     '''
     def updateStatus(self, message):
-        self.master.after(0, lambda: self.status_label.config(text=message)) # sets the status label as the passed status message
+        self.dispatcher.post('status', self.status_label.config, text=message) # only the latest status is shown on the next tick
 
     '''
-    Toggles the editablility of the main buttons.
+    Toggles the editablility of the main buttons, safe to call from any thread.
 
     Parameters:
         self:
@@ -102,6 +104,18 @@ class UIController:
             True/False of whether buttons can be edited or not
     '''
     def toggleButtons(self, toggled):
+        self.dispatcher.post('buttons', self.applyButtons, toggled) # only the latest state is applied on the next tick
+
+    '''
+    Enables or disables the main buttons, runs on the Tk thread.
+
+    Parameters:
+        self:
+            instance of object
+        toggled:
+            True/False of whether buttons can be edited or not
+    '''
+    def applyButtons(self, toggled):
         state = 'normal' if toggled else 'disabled' # set button state to 'normal' or 'disabled'
         status = "Connected" if toggled else "Disconnected" # set the status message accordingly
         for btn_name, button in self.buttons.items(): # loop through each button
@@ -131,9 +145,8 @@ class UIController:
             self.macro_manager.setActions(button_name, action_to_save) # save the new action to the manager
 
             button_number = int(button_name.split()[1]) # extract button number from the name
-            if self.serial_manager.isConnected(): # check if the device is connected
-                command_to_send = f"SET{button_number}{action_to_save}\n" # prepare the command to send
-                self.serial_manager.write(command_to_send.encode('utf-8')) # send the command via serial
+            if self.connection_manager.isConnected(): # check if a device is connected
+                self.connection_manager.write(Protocol.setCommand(button_number, action_to_save), self.macro_manager) # send the command via serial from the runtime loop, to every pad using these macros
 
     '''
     Quits out the application safely.
@@ -144,8 +157,11 @@ class UIController:
     '''
     def quitApplication(self):
         Logger.info("Quit button pressed. Closing application.") # log quit action
+        self.macro_manager.flushPending() # write any macro edits still waiting to be saved
+        self.connection_manager.stop() # cancel the connection tasks and wait for them
         if self.serial_manager.isConnected(): # checks to see if there is a serial connection
             self.serial_manager.close() # close the serial connection if so
+        self.dispatcher.stop() # no more UI updates
         self.master.destroy() # destroy the main window (exit the application)
 
     '''
@@ -156,6 +172,7 @@ class UIController:
             instance of object
     '''
     def openInfoWindow(self):
+        from gui.InfoWindow import InfoWindow # imported on first use so it is not loaded before the main window draws
         if not hasattr(self, 'info_window') or not self.info_window.top_level.winfo_exists(): # if the window is not open or not at the top of the window
             self.info_window = InfoWindow(self.master,self.auto_start_manager.setAutostart,self.auto_start_manager.isAutostartEnabled,self.getButtonStatus) # create info window
 
@@ -167,6 +184,7 @@ class UIController:
             instance of object
     '''
     def openAnalyzerWindow(self):
+        from gui.LogAnalyzerWindow import LogAnalyzerWindow # imported on first use, it pulls in the whole log analyzer
         if not hasattr(self, 'log_analyzer_window') or not self.log_analyzer_window.top_level.winfo_exists(): # if the log analyzer window is not open or doesnt exist
             self.log_analyzer_window = LogAnalyzerWindow(self.master) # create new window
         else: # if it does exist
@@ -0,0 +1,113 @@
+import threading
+import tkinter as tk
+from logic.Logger import Logger
+from logic.Settings import Settings
+
+'''
+Hands UI updates from background threads to the Tk thread.
+
+Tk widgets must only be touched from the thread running mainloop, so the connection and tray threads post
+their updates here instead. Updates are kept under a key and only the latest one per key is applied, so a
+status that changes several times between ticks costs one label update. The Tk loop drains everything on a
+timer tick, which means posting never touches Tk and never floods its event queue.
+'''
+class UIDispatcher:
+
+    '''
+    Default constructor for UIDispatcher.
+
+    Parameters:
+        self:
+            instance of object
+        master:
+            Tkinter window whose loop runs the updates
+        interval:
+            seconds between ticks (default from Settings)
+    '''
+    def __init__(self, master, interval=None):
+        self.master = master # Tkinter window the updates are for
+        self.interval = int((interval or Settings.UI_TICK_INTERVAL) * 1000) # tick in milliseconds for after
+        self.lock = threading.Lock() # guards pending, posted to from any thread
+        self.pending = {} # key -> (callback, args, kwargs) of the latest update per key, in posting order
+        self.timer = None # id of the scheduled tick, None when stopped
+
+    '''
+    Queues an update, replacing any update with the same key that has not run yet.
+
+    Safe to call from any thread.
+
+    Parameters:
+        self:
+            instance of object
+        key:
+            what the update is for, e.g. 'status'
+        callback:
+            function to run on the Tk thread
+        args, kwargs:
+            passed to the callback
+    '''
+    def post(self, key, callback, *args, **kwargs):
+        with self.lock: # shared with the Tk thread
+            self.pending.pop(key, None) # an older update for the same thing is stale
+            self.pending[key] = (callback, args, kwargs) # latest one goes last so updates keep their order
+
+    '''
+    Runs every queued update, must be called on the Tk thread.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        number of updates run
+    '''
+    def drain(self):
+        with self.lock: # shared with the posting threads
+            pending, self.pending = self.pending, {} # take everything queued so far
+        for key, (callback, args, kwargs) in pending.items(): # each update in posting order
+            try: # handle errors with grace
+                callback(*args, **kwargs) # apply it
+            except Exception as e: # gracefully handle errors so program doesnt crash
+                Logger.error(f"Error applying UI update {key}: {e}") # log error
+        return len(pending) # return how many were run
+
+    '''
+    Starts draining on a timer tick.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def start(self):
+        if self.timer is None: # not already ticking
+            self.timer = self.master.after(self.interval, self.tick) # first tick
+
+    '''
+    Drains the queue and schedules the next tick.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def tick(self):
+        self.drain() # apply what the other threads posted
+        if self.timer is None: # an update stopped the dispatcher
+            return # no next tick
+        try: # handle errors with grace
+            self.timer = self.master.after(self.interval, self.tick) # next tick
+        except tk.TclError: # window has been destroyed
+            self.timer = None # nothing left to update
+
+    '''
+    Stops the tick, updates still queued are dropped.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def stop(self):
+        if self.timer is not None: # ticking
+            try: # handle errors with grace
+                self.master.after_cancel(self.timer) # cancel the next tick
+            except tk.TclError: # window already destroyed
+                pass # the tick went with it
+            self.timer = None # stopped
@@ -0,0 +1,312 @@
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logic.ActionRegistry import ActionRegistry
+from logic.LatencyStats import LatencyStats
+from logic.Logger import Logger
+from logic.Settings import Settings
+
+'''
+Runs macro commands off the calling thread with a cap on how many can run at once.
+
+Typed actions known to ActionRegistry run in process on a worker, only external commands spawn a process.
+'''
+class ActionExecutor:
+    WINDOWS_BUILTINS = {'assoc', 'call', 'cd', 'cls', 'copy', 'date', 'del', 'dir', 'echo', 'erase', 'md', 'mkdir', 'move', 'ren', 'rename', 'rd', 'rmdir', 'set', 'start', 'time', 'type', 'ver'} # cmd.exe commands that have no executable
+
+    '''
+    Default constructor for ActionExecutor.
+
+    Parameters:
+        self:
+            instance of object
+        max_running:
+            most commands allowed to be starting, or running with a timeout, at once (default from Settings)
+    '''
+    def __init__(self, max_running=None):
+        self.max_running = max_running or Settings.ACTION_MAX_RUNNING # cap on starting plus timed commands
+        self.pool = ThreadPoolExecutor(max_workers=Settings.ACTION_WORKERS, thread_name_prefix="ActionWorker") # threads that start the processes
+        self.lock = threading.Condition() # guards the counters below and signals changes to them
+        self.pending = 0 # commands handed to the pool but not started yet
+        self.running = [] # (process, deadline, command, on_exit) of every child that has not been reaped
+        self.reaper_thread = None # thread that reaps finished children and enforces timeouts
+
+    '''
+    Queues a command to run.
+
+    Parameters:
+        self:
+            instance of object
+        command:
+            the system command to be run
+        timeout:
+            seconds after which the command is killed, None lets it run (default from Settings)
+        arrival:
+            time.perf_counter_ns when the key press arrived, for the total latency (optional)
+        on_exit:
+            called with no arguments once the action has finished, or failed to start (optional, not called when skipped)
+    Returns:
+        future of the started process (or of the handler result for typed actions), None if too many commands are already starting or timed
+    '''
+    def submit(self, command, timeout=None, arrival=None, on_exit=None):
+        with self.lock: # counters are shared with the workers and the reaper
+            timed = sum(1 for _, deadline, _, _ in self.running if deadline is not None) # apps left open have no timeout and do not hold a slot
+            if self.pending + timed >= self.max_running: # no room for another command
+                Logger.warning(f"Too many actions running ({self.max_running}), skipped: {command}") # log the skipped command
+                return None # drop the press
+            self.pending += 1 # reserve a slot for this command
+        queued = time.perf_counter_ns() # start of the spawn stage
+        resolved = ActionRegistry.resolve(command) # in-app handler, if the action has one
+        try: # handle errors with grace
+            if resolved: # typed action
+                future = self.pool.submit(self.runInProcess, command, *resolved, queued, arrival, on_exit) # call it on a worker, no process needed
+            else: # external command
+                future = self.pool.submit(self.startCommand, command, Settings.ACTION_TIMEOUT if timeout is None else timeout, queued, arrival, on_exit) # start it on a worker
+        except RuntimeError: # pool already shut down
+            self.releaseSlot() # the reserved slot will never be used
+            return None # nothing was started
+        future.add_done_callback(lambda done: self.releaseCancelled(done, on_exit)) # shutdown may cancel it before a worker picks it up
+        return future # return the future
+
+    '''
+    Works out whether a command needs a shell or can be started directly.
+
+    Parameters:
+        self:
+            instance of object
+        command:
+            the system command to be run
+    Returns:
+        (arguments to Popen, whether to use the shell)
+    '''
+    def buildArgs(self, command):
+        if any(char in ActionRegistry.SHELL_CHARACTERS for char in command): # pipes, redirects, globs, variables...
+            return command, True # let the shell handle them
+        try: # handle errors with grace
+            args = shlex.split(command, posix=os.name != 'nt') # split the command like the shell would
+        except ValueError: # unbalanced quotes and the like
+            return command, True # let the shell report it
+        if not args or (os.name == 'nt' and args[0].lower() in self.WINDOWS_BUILTINS): # builtins only exist inside cmd.exe
+            return command, True # run through the shell
+        return args, False # plain program with arguments, no shell needed
+
+    '''
+    Runs a typed action inside the app.
+
+    Parameters:
+        self:
+            instance of object
+        command:
+            the action as configured
+        handler:
+            function registered for the action's scheme
+        argument:
+            text passed to the handler
+        queued:
+            time.perf_counter_ns when the action was submitted (optional)
+        arrival:
+            time.perf_counter_ns when the key press arrived (optional)
+        on_exit:
+            called once the handler has returned (optional)
+    Returns:
+        whatever the handler returns
+    '''
+    def runInProcess(self, command, handler, argument, queued=None, arrival=None, on_exit=None):
+        try: # handle errors with grace
+            result = handler(argument) # run the action
+            self.recordLatency(queued, arrival) # the action has done its work
+            return result # return what the handler returned
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Failed to run action {command}: {e}") # log error if the action fails
+        finally: # whether it worked or not
+            self.releaseSlot() # slot is free again
+            self.notifyExit(on_exit) # the action is over
+
+    '''
+    Frees the slot of a command that will not start or has finished in process.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def releaseSlot(self):
+        with self.lock: # counters are shared with submit
+            self.pending -= 1 # slot is free again
+            self.lock.notify_all() # wake anyone draining
+
+    '''
+    Frees the slot of a queued command that shutdown cancelled, since no worker will ever run it.
+
+    Parameters:
+        self:
+            instance of object
+        future:
+            future of the queued command, done
+        on_exit:
+            called with no arguments as the action is over (optional)
+    '''
+    def releaseCancelled(self, future, on_exit):
+        if future.cancelled(): # never reached a worker
+            self.releaseSlot() # free its slot
+            self.notifyExit(on_exit) # the action is over
+
+    '''
+    Starts a command and hands the process to the reaper.
+
+    Parameters:
+        self:
+            instance of object
+        command:
+            the system command to be run
+        timeout:
+            seconds after which the command is killed, None lets it run
+        queued:
+            time.perf_counter_ns when the command was submitted (optional)
+        arrival:
+            time.perf_counter_ns when the key press arrived (optional)
+        on_exit:
+            called once the process has exited or failed to start (optional)
+    Returns:
+        the started process or None if it failed to start
+    '''
+    def startCommand(self, command, timeout, queued=None, arrival=None, on_exit=None):
+        process = None # process once it has started
+        try: # handle errors with grace
+            args, shell = self.buildArgs(command) # decide how to start it
+            try: # handle errors with grace
+                process = subprocess.Popen(args, shell=shell) # execute the command
+            except FileNotFoundError: # not a program on the path (alias, shell function...)
+                if shell: # the shell itself is missing, nothing else to try
+                    raise # report it below
+                process = subprocess.Popen(command, shell=True) # give the shell a go
+            self.recordLatency(queued, arrival) # Popen has returned
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Failed to run command {command}: {e}") # log error if the command fails
+        with self.lock: # counters are shared with submit and the reaper
+            self.pending -= 1 # no longer waiting to start
+            if process is not None: # started fine
+                deadline = time.monotonic() + timeout if timeout else None # when to kill it, if ever
+                self.running.append((process, deadline, command, on_exit)) # reaper takes it from here
+                self.startReaper() # make sure someone will reap it
+            self.lock.notify_all() # wake the reaper and anyone draining
+        if process is None: # never started
+            self.notifyExit(on_exit) # so it is already over
+        return process # return the started process
+
+    '''
+    Records the spawn and total latency once an action has been started.
+
+    Parameters:
+        self:
+            instance of object
+        queued:
+            time.perf_counter_ns when the action was submitted, or None
+        arrival:
+            time.perf_counter_ns when the key press arrived, or None
+    '''
+    def recordLatency(self, queued, arrival):
+        now = time.perf_counter_ns() # one clock read for both stages
+        if queued is not None: # submitted through submit
+            LatencyStats.record('spawn', now - queued) # hand off until started
+        if arrival is not None: # came from a key press
+            LatencyStats.record('total', now - arrival) # wire until started
+
+    '''
+    Starts the reaper thread if it is not already running.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def startReaper(self):
+        if self.reaper_thread is None or not self.reaper_thread.is_alive(): # only one reaper
+            self.reaper_thread = threading.Thread(target=self.reapLoop, name="ActionReaper", daemon=True) # create the reaper thread
+            self.reaper_thread.start() # start reaping
+
+    '''
+    Reaps finished children and kills the ones past their timeout, exits once nothing is left running.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def reapLoop(self):
+        with self.lock: # counters are shared with submit and the workers
+            while self.running: # as long as a child is alive
+                now = time.monotonic() # time of this pass
+                still_running = [] # children to check again
+                for process, deadline, command, on_exit in self.running: # go through each child
+                    if process.poll() is not None: # finished, poll has reaped it
+                        self.notifyLater(on_exit) # tell whoever is waiting for it, off this thread
+                        continue # forget about it
+                    if deadline is not None and now >= deadline: # ran past its timeout
+                        Logger.warning(f"Command timed out, stopping it: {command}") # log the timeout
+                        process.kill() # stop it, it is reaped on the next pass
+                    still_running.append((process, deadline, command, on_exit)) # check again next pass
+                self.running = still_running # keep only the live children
+                self.lock.notify_all() # wake anyone draining
+                self.lock.wait(Settings.ACTION_REAP_INTERVAL) # sleep until the next pass or a new child
+
+    '''
+    Calls an action's exit callback, logging instead of raising if it fails.
+
+    Parameters:
+        self:
+            instance of object
+        on_exit:
+            callback to call, or None
+    '''
+    def notifyExit(self, on_exit):
+        if on_exit is None: # nobody is waiting for this action
+            return # nothing to do
+        try: # handle errors with grace
+            on_exit() # the action is over
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error in action exit callback: {e}") # log error
+
+    '''
+    Calls an action's exit callback on a worker, used by the reaper so the callback never runs under the lock.
+
+    Parameters:
+        self:
+            instance of object
+        on_exit:
+            callback to call, or None
+    '''
+    def notifyLater(self, on_exit):
+        if on_exit is None: # nobody is waiting for this action
+            return # nothing to do
+        try: # handle errors with grace
+            self.pool.submit(self.notifyExit, on_exit) # the callback may start the next action, which takes the lock
+        except RuntimeError: # pool already shut down
+            pass # the app is closing, nothing will run anyway
+
+    '''
+    Waits until every queued command has started.
+
+    Parameters:
+        self:
+            instance of object
+        timeout:
+            longest time to wait in seconds
+    Returns:
+        whether everything started in time
+    '''
+    def drain(self, timeout=None):
+        with self.lock: # counters are shared with the workers
+            return self.lock.wait_for(lambda: self.pending == 0, timeout) # wait for the workers to catch up
+
+    '''
+    Stops accepting work and lets already running children carry on.
+
+    Commands still queued are cancelled, their slots freed and their on_exit called, so drain returns.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True) # drop anything not started yet
@@ -0,0 +1,144 @@
+import importlib
+from logic.Logger import Logger
+from logic.Settings import Settings
+
+'''
+Holds the typed macro actions that run inside the app instead of spawning a process.
+
+An action is typed when it starts with a registered scheme, e.g. "type:hello" or "py:module:function".
+'''
+class ActionRegistry:
+    SHELL_CHARACTERS = set('|&;<>()$`*?[]{}~!%^#=\n') # characters that need a shell to mean what the user wrote
+    handlers = {} # scheme to function taking the text after the scheme
+    cache = {} # action string to its resolved (handler, argument), or None for external commands
+    plugins_loaded = False # whether Settings.ACTION_PLUGINS have been imported
+
+    '''
+    Registers a function for a scheme, plugins call this when they are imported.
+
+    Parameters:
+        scheme:
+            prefix before the ':' that selects the handler
+        handler:
+            function called with the text after the scheme
+    '''
+    @staticmethod
+    def register(scheme, handler):
+        ActionRegistry.handlers[scheme.lower()] = handler # add or replace the handler
+        ActionRegistry.cache.clear() # earlier lookups may resolve differently now
+
+    '''
+    Imports every plugin module listed in Settings so they can register their schemes.
+    '''
+    @staticmethod
+    def loadPlugins():
+        ActionRegistry.plugins_loaded = True # only ever try once
+        for module_name in Settings.ACTION_PLUGINS: # go through each configured plugin
+            try: # handle errors with grace
+                importlib.import_module(module_name) # importing the module registers its schemes
+                Logger.info(f"Loaded action plugin {module_name}") # log the loaded plugin
+            except Exception as e: # gracefully handle errors so program doesnt crash
+                Logger.error(f"Failed to load action plugin {module_name}: {e}") # log the error with the error message
+
+    '''
+    Finds the in-app handler for an action.
+
+    Parameters:
+        action:
+            macro assigned to a button
+    Returns:
+        (handler, argument) or None when the action is an external command
+    '''
+    @staticmethod
+    def resolve(action):
+        if action in ActionRegistry.cache: # resolved before
+            return ActionRegistry.cache[action] # skip parsing again
+        if not ActionRegistry.plugins_loaded: # first lookup
+            ActionRegistry.loadPlugins() # give plugins a chance to register
+        resolved = None # assume an external command
+        scheme, separator, argument = action.partition(':') # split off a possible scheme
+        if separator and scheme.lower() in ActionRegistry.handlers: # a registered scheme
+            resolved = (ActionRegistry.handlers[scheme.lower()], argument) # handler and its argument
+        ActionRegistry.cache[action] = resolved # remember the answer
+        return resolved # return the handler and argument
+
+    '''
+    Types text on the keyboard, needs the optional pynput package.
+
+    Parameters:
+        text:
+            text to type
+    '''
+    @staticmethod
+    def typeAction(text):
+        try: # handle errors with grace
+            from pynput.keyboard import Controller # only imported when a type action is used
+        except ImportError: # package not installed
+            Logger.error("Typing actions need the pynput package (pip install pynput)") # tell the user what is missing
+            return # nothing else to do
+        Controller().type(text) # type the text into the focused window
+
+    '''
+    Writes text to a file, replacing what was there.
+
+    Parameters:
+        argument:
+            "path|text"
+    '''
+    @staticmethod
+    def writeAction(argument):
+        path, _, text = argument.partition('|') # split the path from the text
+        with open(path.strip(), 'w') as f: # open the file for writing
+            f.write(text + '\n') # write the text
+
+    '''
+    Appends text to a file.
+
+    Parameters:
+        argument:
+            "path|text"
+    '''
+    @staticmethod
+    def appendAction(argument):
+        path, _, text = argument.partition('|') # split the path from the text
+        with open(path.strip(), 'a') as f: # open the file for appending
+            f.write(text + '\n') # add the text
+
+    '''
+    Sends a GET request to a URL.
+
+    Parameters:
+        url:
+            full URL to request
+    '''
+    @staticmethod
+    def httpAction(url):
+        import urllib.request # only imported when an http action is used, it is slow to import
+        with urllib.request.urlopen(url, timeout=Settings.ACTION_HTTP_TIMEOUT) as response: # request the URL
+            Logger.info(f"Requested {url}: {response.status}") # log the response status
+
+    '''
+    Calls a Python function, "module:function" or "module:function:argument".
+
+    Parameters:
+        argument:
+            text after the "py:" scheme
+    '''
+    @staticmethod
+    def pythonAction(argument):
+        parts = argument.split(':', 2) # module, function and an optional argument
+        if len(parts) < 2: # function name is missing
+            raise ValueError(f"expected module:function, got {argument}") # report the mistake
+        function = getattr(importlib.import_module(parts[0]), parts[1]) # look up the function
+        if len(parts) == 3: # an argument was given
+            function(parts[2]) # call the function with it
+        else: # no argument
+            function() # call the function
+
+
+ActionRegistry.register('type', ActionRegistry.typeAction) # type:text
+ActionRegistry.register('write', ActionRegistry.writeAction) # write:path|text
+ActionRegistry.register('append', ActionRegistry.appendAction) # append:path|text
+ActionRegistry.register('http', lambda rest: ActionRegistry.httpAction('http:' + rest)) # http://...
+ActionRegistry.register('https', lambda rest: ActionRegistry.httpAction('https:' + rest)) # https://...
+ActionRegistry.register('py', ActionRegistry.pythonAction) # py:module:function[:argument]
@@ -1,4 +1,3 @@
-import winreg
 import os
 from logic.Logger import Logger
 
@@ -17,10 +16,11 @@ class AutoStartManager:
     '''
     @staticmethod
     def setAutostart(enabled):
-        key = winreg.HKEY_CURRENT_USER # defines the registry key that contains settings for the currently logged-in user
         path = r"SOFTWARE/Microsoft/Windows/CurrentVersion/Run" # registry path where auto-start entries are stored
         app_path = os.path.abspath(__file__) # absolute path of script
         try: # handle errors with grace
+            import winreg # Windows only, imported on first use so starting the app does not load it
+            key = winreg.HKEY_CURRENT_USER # defines the registry key that contains settings for the currently logged-in user
             with winreg.OpenKey(key, path, 0, winreg.KEY_WRITE) as registry_key: # opens the registry key for writing
                 if enabled: # checks if auto start is enabled
                     winreg.SetValueEx(registry_key, AutoStartManager.APP_NAME, 0, winreg.REG_SZ, app_path) # set the value in registry to enabled auto start
@@ -38,9 +38,10 @@ class AutoStartManager:
     '''
     @staticmethod
     def isAutostartEnabled():
-        key = winreg.HKEY_CURRENT_USER # defines the registry key that contains settings for the currently logged-in user 
         path = r"SOFTWARE/Microsoft/Windows/CurrentVersion/Run" # registry path where auto-start entries are stored
         try: # handle errors with grace
+            import winreg # Windows only, imported on first use so starting the app does not load it
+            key = winreg.HKEY_CURRENT_USER # defines the registry key that contains settings for the currently logged-in user
             with winreg.OpenKey(key, path, 0, winreg.KEY_READ) as registry_key: # opens the registry key for reading
                 winreg.QueryValueEx(registry_key, AutoStartManager.APP_NAME) # queries the registry for the application entry
                 return True # then return true 
@@ -0,0 +1,430 @@
+import json
+import os
+from logic.Logger import Logger
+from logic.Protocol import Protocol
+from logic.Settings import Settings
+
+'''
+One binding: the steps that trigger it and what it runs.
+'''
+class Binding:
+
+    '''
+    Default constructor for Binding.
+
+    Parameters:
+        self:
+            instance of object
+        steps:
+            tuple of frozensets of button numbers, one set per step (a chord has several buttons in one step)
+        tap:
+            action run when the last step is pressed and released, or None
+        hold:
+            action run when the last step is held for the hold time, or None
+        label:
+            name shown in the log and used for the dispatch policy
+    '''
+    def __init__(self, steps, tap, hold, label):
+        self.steps = steps # what has to be pressed
+        self.tap = tap or None # action on a tap
+        self.hold = hold or None # action on a hold
+        self.label = label # name of the binding
+
+
+'''
+Chords, tap/hold, sequences and layers compiled into a transition table.
+
+Every layer becomes a set of numbered states. Each state maps the event tokens that can happen next
+("Button 1 pressed", "Button 1 released"...) straight to (next state, actions to run, whether to replay the
+token from the start), and may have a timeout that fires a hold or finishes a sequence. Matching an event
+is one dictionary lookup however many bindings there are. The table never changes once built, so a
+recompile swaps a whole new table in (see MacroManager.buildIndex).
+
+Bindings come from the macro config (each "Button N pressed" is a tap of that button on the base layer) and
+from Settings.BINDINGS_FILE next to it:
+
+    {
+        "hold_time": 0.2,
+        "sequence_timeout": 0.4,
+        "layers": {
+            "base": {"1+2": "echo chord", "3": {"tap": "echo tap", "hold": "layer:media"}, "4 5 6": "echo sequence"},
+            "media": {"1": "echo play", "2": ""}
+        }
+    }
+
+Buttons in a step are joined with "+" and steps are separated by spaces. An action of "layer:NAME" switches
+to that layer when tapped, or while the button is held when used as a hold. Every layer starts with the
+base layer's bindings, and an empty action removes one of them.
+'''
+class BindingTable:
+    LAYER_PREFIX = 'layer:' # actions that switch layers instead of running
+
+    '''
+    Default constructor for BindingTable, compiles the bindings.
+
+    Parameters:
+        self:
+            instance of object
+        button_actions:
+            button name -> action from the macro config
+        config:
+            parsed bindings file, or None
+    '''
+    def __init__(self, button_actions, config=None):
+        config = config or {} # no bindings file means taps only
+        self.hold_time = float(config.get('hold_time', Settings.BINDING_HOLD_TIME)) # seconds before a press counts as a hold
+        self.sequence_timeout = float(config.get('sequence_timeout', Settings.BINDING_SEQUENCE_TIMEOUT)) # seconds allowed between the steps of a sequence
+        self.press_tokens = {token: button for (kind, button), token in Protocol.TOKENS.items() if kind == Protocol.PRESS} # press token -> button
+        self.release_tokens = {button: Protocol.TOKENS[(Protocol.RELEASE, button)] for button in self.press_tokens.values()} # button -> release token
+        self.release_for = {token: self.release_tokens[button] for token, button in self.press_tokens.items()} # press token -> release token of the same button
+        self.transitions = [] # state -> {token: (next state, actions, replay)}
+        self.timeouts = [] # state -> (seconds, next state, actions, held buttons) or None
+        self.roots = {} # layer name -> its starting state
+        for name, bindings in self.collectLayers(button_actions, config.get('layers', {})).items(): # every layer
+            self.roots[name] = self.compileLayer(bindings) # numbered states of that layer
+
+    '''
+    Reads the bindings file.
+
+    Parameters:
+        path:
+            path of the bindings file
+    Returns:
+        the parsed file, or None if there is none or it cannot be read
+    '''
+    @staticmethod
+    def loadConfig(path):
+        if not os.path.exists(path): # no chords, sequences or layers configured
+            return None # taps only
+        try: # handle errors with grace
+            with open(path, 'r') as f: # open file for reading
+                return json.load(f) # return the parsed file
+        except (ValueError, OSError) as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Could not read {path}, using button taps only: {e}") # log the error with the error message
+            return None # taps only
+
+    '''
+    Turns a trigger such as "1+2 3" into its steps.
+
+    Parameters:
+        self:
+            instance of object
+        trigger:
+            buttons joined by "+" within a step, steps separated by spaces
+    Returns:
+        tuple of frozensets of button numbers
+    '''
+    def parseTrigger(self, trigger):
+        steps = [] # parsed steps
+        for part in str(trigger).split(): # each step
+            step = frozenset(int(button) for button in part.split('+')) # buttons pressed together
+            if not step <= set(self.release_tokens): # button the protocol has no token for
+                raise ValueError(f"unknown button in {trigger!r}") # report it
+            steps.append(step) # keep it
+        if not steps: # empty trigger
+            raise ValueError("empty trigger") # report it
+        return tuple(steps) # return the steps
+
+    '''
+    Gathers the bindings of every layer, base layer bindings included in each.
+
+    Parameters:
+        self:
+            instance of object
+        button_actions:
+            button name -> action from the macro config
+        layers:
+            layer name -> {trigger: action or {"tap": action, "hold": action}} from the bindings file
+    Returns:
+        layer name -> list of Binding
+    '''
+    def collectLayers(self, button_actions, layers):
+        base = {} # steps -> Binding of the base layer
+        for button_name, action in button_actions.items(): # every configured button
+            if action and button_name in self.press_tokens: # mapped to something
+                steps = (frozenset([self.press_tokens[button_name]]),) # a single tap
+                base[steps] = Binding(steps, action, None, button_name) # named like before
+        collected = {'base': base} # base always exists
+        for name, entries in sorted(layers.items(), key=lambda item: item[0] != 'base'): # every layer in the file, base first so the others start from it
+            layer = collected.setdefault(name, dict(base)) # starts with the base bindings
+            for trigger, value in entries.items(): # every binding in it
+                try: # handle errors with grace
+                    steps = self.parseTrigger(trigger) # what has to be pressed
+                    tap, hold = (value.get('tap'), value.get('hold')) if isinstance(value, dict) else (value, None) # what it runs
+                except (ValueError, AttributeError) as e: # gracefully handle errors so program doesnt crash
+                    Logger.error(f"Ignoring binding {trigger!r} in layer {name}: {e}") # log the bad binding
+                    continue # next binding
+                if not tap and not hold: # empty action
+                    layer.pop(steps, None) # removes the binding
+                    continue # next binding
+                label = Protocol.TOKENS[(Protocol.PRESS, next(iter(steps[0])))] if len(steps) == 1 and len(steps[0]) == 1 else ' '.join('+'.join(str(button) for button in sorted(step)) for step in steps) # single buttons keep their button name
+                layer[steps] = Binding(steps, tap, hold, label) # add or replace it
+        for name, layer in collected.items(): # drop switches to layers that do not exist
+            for steps, binding in list(layer.items()): # every binding
+                if any(action and action.startswith(self.LAYER_PREFIX) and action[len(self.LAYER_PREFIX):] not in collected for action in (binding.tap, binding.hold)): # unknown layer
+                    Logger.error(f"Ignoring binding {binding.label!r} in layer {name}: unknown layer") # log the bad binding
+                    del layer[steps] # skip it
+        return {name: list(layer.values()) for name, layer in collected.items()} # return the bindings of every layer
+
+    '''
+    Adds a state with no transitions yet.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        number of the new state
+    '''
+    def addState(self):
+        self.transitions.append({}) # filled in by compileLayer
+        self.timeouts.append(None) # no timeout unless compileLayer adds one
+        return len(self.transitions) - 1 # return its number
+
+    '''
+    Compiles the bindings of one layer into states.
+
+    A state is the steps completed so far plus the buttons pressed in the current step. A press that can only
+    complete a binding with nothing longer to wait for runs it straight away, so plain taps are as quick as a
+    single lookup. Otherwise the step ends on the first release (tap), after the hold time (hold) or, between
+    steps, after the sequence timeout.
+
+    Parameters:
+        self:
+            instance of object
+        bindings:
+            list of Binding of the layer
+    Returns:
+        number of the layer's starting state
+    '''
+    def compileLayer(self, bindings):
+        states = {} # (completed steps, current step) -> state number
+        waiting = [] # states whose transitions are not filled in yet
+
+        def stateFor(prefix, down): # number of a state, added the first time it is needed
+            if (prefix, down) not in states: # new state
+                states[(prefix, down)] = self.addState() # number it
+                waiting.append((prefix, down)) # fill it in below
+            return states[(prefix, down)] # return its number
+
+        def tapOf(binding): # actions run when a binding is tapped
+            return ((binding.label, binding.tap),) if binding and binding.tap else () # nothing for hold only bindings
+
+        complete = {binding.steps: binding for binding in bindings} # steps -> binding, for finding exact matches
+        root = stateFor((), frozenset()) # nothing pressed yet
+        while waiting: # until every reachable state is filled in
+            prefix, down = waiting.pop() # next state
+            state = states[(prefix, down)] # its number
+            depth = len(prefix) # steps completed
+            following = [binding for binding in bindings if len(binding.steps) > depth and binding.steps[:depth] == prefix] # bindings still possible
+            for token, button in self.press_tokens.items(): # pressing any button
+                if button in down: # already down, a repeat without a release
+                    continue # ignored
+                grown = down | {button} # buttons of the step so far
+                candidates = [binding for binding in following if grown <= binding.steps[depth]] # bindings it can still become
+                if not candidates: # matches nothing
+                    if down: # stray button in the middle of a chord, e.g. keys rolled while typing fast
+                        self.transitions[state][token] = (root, tapOf(complete.get(prefix + (down,))), True) # run what is down if it is a binding and start over with this press
+                    elif prefix: # sequence broken
+                        self.transitions[state][token] = (root, tapOf(complete.get(prefix)), True) # run what matched so far and start over with this press
+                    continue # in the starting state it is simply unmapped
+                exact = complete.get(prefix + (grown,)) # binding ending with this step
+                if exact and candidates == [exact] and not exact.hold: # nothing longer to wait for
+                    self.transitions[state][token] = (root, tapOf(exact), False) # run it on the press
+                else: # could still become something else
+                    self.transitions[state][token] = (stateFor(prefix, grown), (), False) # wait for more
+            if down: # a step is in progress
+                reached = prefix + (down,) # steps once it ends
+                longer = any(len(binding.steps) > depth + 1 and binding.steps[:depth + 1] == reached for binding in following) # a sequence continues from here
+                for button in down: # releasing any of its buttons ends the step
+                    self.transitions[state][self.release_tokens[button]] = (stateFor(reached, frozenset()), (), False) if longer else (root, tapOf(complete.get(reached)), False) # wait for the next step or run the tap
+                exact = complete.get(reached) # binding ending with this step
+                if exact and exact.hold: # holding it does something
+                    self.timeouts[state] = (self.hold_time, root, ((exact.label, exact.hold),), down) # run the hold
+            elif prefix: # between the steps of a sequence
+                self.timeouts[state] = (self.sequence_timeout, root, tapOf(complete.get(prefix)), frozenset()) # run what matched if nothing follows
+        return root # return the starting state
+
+    '''
+    Counts the states of every layer.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        number of states
+    '''
+    def size(self):
+        return len(self.transitions) # one entry per state
+
+
+'''
+Follows the events of one device through the BindingTable of its macro profile.
+
+Kept per device so pads sharing a profile do not mix their key presses. Only ever used from one thread
+(the runtime loop).
+'''
+class BindingMatcher:
+
+    '''
+    Default constructor for BindingMatcher.
+
+    Parameters:
+        self:
+            instance of object
+        macro_manager:
+            macro profile whose bindings are followed
+        releases:
+            whether the device reports releases, without them every press is treated as a tap
+    '''
+    def __init__(self, macro_manager, releases=True):
+        self.macro_manager = macro_manager # profile with the compiled table
+        self.releases = releases # binary protocol devices send releases, text ones do not
+        self.timer = None # handle of the scheduled timeout, managed by ConnectionManager
+        self.reset() # start on the base layer
+
+    '''
+    Starts over on the base layer with the profile's current table.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def reset(self):
+        self.table = self.macro_manager.bindings # table being followed, swapped in whole by a recompile
+        self.layer = 'base' # layer chosen by tapping a layer switch
+        self.active = 'base' # layer in use, differs while a layer button is held
+        self.momentary = frozenset() # release tokens that end the held layer
+        self.state = self.table.roots['base'] # nothing pressed yet
+        self.deadline = None # time.monotonic when the state times out, None if it never does
+
+    '''
+    Follows one event.
+
+    Parameters:
+        self:
+            instance of object
+        token:
+            event token from the device
+        now:
+            time.monotonic of the event
+    Returns:
+        (list of (label, action) to run, whether the token meant anything)
+    '''
+    def feed(self, token, now):
+        if self.macro_manager.bindings is not self.table: # recompiled since the last event
+            self.reset() # follow the new table from the start
+        fired = self.expire(now) # a timeout that is already due comes first
+        mapped = self.step(token, now, fired) # follow the token
+        if not self.releases and token in self.table.release_for: # device never reports releases
+            self.step(self.table.release_for[token], now, fired) # so every press is also a release
+        return fired, mapped # return what to run
+
+    '''
+    Follows one token through the table.
+
+    Parameters:
+        self:
+            instance of object
+        token:
+            event token
+        now:
+            time.monotonic of the event
+        fired:
+            list the actions to run are added to
+    Returns:
+        whether the token meant anything
+    '''
+    def step(self, token, now, fired):
+        if token in self.momentary: # a held layer button was released
+            self.switch(self.layer, now) # back to the chosen layer
+            return True # handled
+        transition = self.table.transitions[self.state].get(token) # one lookup
+        if transition is None: # nothing bound
+            return False # unmapped press, or a release nothing waits for
+        state, actions, replay = transition # what to do
+        self.enter(state, now) # move on
+        self.fire(actions, fired, now) # run what it completed
+        if replay: # the token starts something new
+            self.step(token, now, fired) # follow it again from the start
+        return True # handled
+
+    '''
+    Runs the timeout of the current state if it is due.
+
+    Parameters:
+        self:
+            instance of object
+        now:
+            time.monotonic
+    Returns:
+        list of (label, action) to run
+    '''
+    def expire(self, now):
+        fired = [] # actions to run
+        if self.deadline is not None and now >= self.deadline: # timed out
+            seconds, state, actions, held = self.table.timeouts[self.state] # what to do
+            self.enter(state, now) # move on
+            self.fire(actions, fired, now, held) # run the hold or the finished sequence
+        return fired # return what to run
+
+    '''
+    Moves to a state.
+
+    Parameters:
+        self:
+            instance of object
+        state:
+            state number
+        now:
+            time.monotonic
+    '''
+    def enter(self, state, now):
+        self.state = state # current state
+        timeout = self.table.timeouts[state] # what happens if nothing else does
+        self.deadline = now + timeout[0] if timeout else None # when it happens
+
+    '''
+    Runs actions, switching layers for layer actions.
+
+    Parameters:
+        self:
+            instance of object
+        actions:
+            tuple of (label, action)
+        fired:
+            list the actions to run are added to
+        now:
+            time.monotonic
+        held:
+            buttons being held when the actions are a hold
+    '''
+    def fire(self, actions, fired, now, held=frozenset()):
+        for label, action in actions: # every action
+            if not action.startswith(BindingTable.LAYER_PREFIX): # a normal action
+                fired.append((label, action)) # run it
+                continue # next one
+            layer = action[len(BindingTable.LAYER_PREFIX):] # layer to switch to
+            if held: # held layer button
+                self.switch(layer, now, frozenset(self.table.release_tokens[button] for button in held)) # until one of them is released
+            else: # tapped layer switch
+                self.layer = layer # stays until switched again
+                self.switch(layer, now) # use it
+            Logger.info(f"Switched to layer {layer}", event='layer', button=label) # log the switch
+
+    '''
+    Makes a layer the one in use.
+
+    Parameters:
+        self:
+            instance of object
+        layer:
+            layer name
+        now:
+            time.monotonic
+        momentary:
+            release tokens that end the layer, empty if it stays
+    '''
+    def switch(self, layer, now, momentary=frozenset()):
+        self.active = layer # layer in use
+        self.momentary = momentary # what ends it
+        self.enter(self.table.roots[layer], now) # start of that layer
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import struct
+import sys
+from logic.Logger import Logger
+from logic.Settings import Settings
+
+'''
+Watches the macro config files for changes made outside the app and reports them.
+
+On Linux the folders holding the files are watched with inotify (through ctypes, no extra package), so
+nothing runs until a file is written. Elsewhere, or if inotify cannot be used, the files' modification
+times are checked every Settings.CONFIG_POLL_INTERVAL. Editors often write a file in several steps, so
+changes are only reported once the files have been quiet for Settings.CONFIG_RELOAD_DELAY.
+'''
+class ConfigWatcher:
+    IN_CLOSE_WRITE = 0x00000008 # a file opened for writing was closed
+    IN_MOVED_TO = 0x00000080 # a file was renamed into the folder, how atomic saves land
+    IN_Q_OVERFLOW = 0x00004000 # events were lost, everything has to be checked
+    EVENT = struct.Struct('iIII') # inotify_event header: watch, mask, cookie, length of the name
+
+    '''
+    Default constructor for ConfigWatcher.
+
+    Parameters:
+        self:
+            instance of object
+        files:
+            called with no arguments, returns the paths of the files to watch (checked again on every change)
+        on_changed:
+            coroutine function called with the set of absolute paths that changed
+    '''
+    def __init__(self, files, on_changed):
+        self.files = files # files worth reporting
+        self.on_changed = on_changed # callback for changed files
+        self.pending = set() # changed paths not reported yet
+        self.changed = None # asyncio.Event set whenever a file changes, made on the loop
+        self.libc = None # C library, when inotify is used
+        self.watches = {} # inotify watch descriptor -> folder it watches
+        self.stamps = {} # path -> (mtime, size) when polling
+
+    '''
+    Gets the absolute paths of the watched files.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        set of paths
+    '''
+    def watchedFiles(self):
+        return {os.path.abspath(path) for path in self.files()} # compared against what inotify and stat report
+
+    '''
+    Reports changed files until the task is cancelled.
+
+    Runs as a task on the Runtime loop, so on_changed runs on the loop too, one change at a time.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    async def watch(self):
+        loop = asyncio.get_running_loop() # loop this task runs on
+        self.changed = asyncio.Event() # made here so it belongs to this loop
+        fd = self.openInotify() # None when inotify cannot be used
+        if fd is not None: # watch the folders
+            try: # handle errors with grace
+                loop.add_reader(fd, self.onReadable, fd) # read events as they arrive
+            except NotImplementedError: # a loop that cannot watch descriptors
+                os.close(fd) # give it up
+                fd = None # poll instead
+        if fd is None: # polling
+            self.stamps = {path: self.stamp(path) for path in self.watchedFiles()} # starting point
+        try: # until cancelled
+            while True: # runs until the task is cancelled
+                if fd is None: # polling
+                    await asyncio.sleep(Settings.CONFIG_POLL_INTERVAL) # check again every poll interval
+                    self.pollFiles() # compare modification times
+                else: # inotify
+                    self.addWatches(fd) # folders of files added since, e.g. a new device profile
+                    await self.changed.wait() # sleep until a file is written
+                if not self.pending: # nothing of interest
+                    continue # keep watching
+                await self.settle() # let the editor finish writing
+                paths, self.pending = self.pending, set() # take the changes
+                try: # handle errors with grace
+                    await self.on_changed(paths) # reload them
+                except Exception as e: # gracefully handle errors so program doesnt crash
+                    Logger.error(f"Error reloading {', '.join(sorted(paths))}: {e}") # log error
+        finally: # stopping
+            if fd is not None: # inotify was used
+                loop.remove_reader(fd) # stop watching it
+                os.close(fd) # release it
+
+    '''
+    Waits until no file has changed for Settings.CONFIG_RELOAD_DELAY.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    async def settle(self):
+        while True: # until quiet
+            self.changed.clear() # only count changes from now on
+            try: # handle errors with grace
+                await asyncio.wait_for(self.changed.wait(), Settings.CONFIG_RELOAD_DELAY) # another write came in
+            except asyncio.TimeoutError: # quiet for long enough
+                return # report the changes
+
+    '''
+    Opens an inotify instance through the C library.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        its file descriptor, or None if inotify is not available
+    '''
+    def openInotify(self):
+        if not sys.platform.startswith('linux'): # inotify is Linux only
+            return None # poll instead
+        try: # handle errors with grace
+            import ctypes # only needed here
+            libc = ctypes.CDLL(None, use_errno=True) # the C library the interpreter uses
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC) # IN_NONBLOCK and IN_CLOEXEC share these values
+            if fd < 0: # failed, e.g. the watch limit is reached
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno())) # report why
+        except (OSError, AttributeError) as e: # gracefully handle errors so program doesnt crash
+            Logger.warning(f"Cannot watch the config with inotify, checking it every {Settings.CONFIG_POLL_INTERVAL} s instead: {e}") # log the fallback
+            return None # poll instead
+        self.libc = libc # used to add watches
+        self.addWatches(fd) # watch the folders there are files in
+        return fd # return the descriptor
+
+    '''
+    Watches the folder of every watched file that is not watched yet.
+
+    Parameters:
+        self:
+            instance of object
+        fd:
+            inotify file descriptor
+    '''
+    def addWatches(self, fd):
+        for folder in {os.path.dirname(path) for path in self.watchedFiles()} - set(self.watches.values()): # folders not watched yet
+            wd = self.libc.inotify_add_watch(fd, os.fsencode(folder), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) # writes and renames into it
+            if wd < 0: # e.g. the folder does not exist
+                Logger.warning(f"Cannot watch {folder} for config changes") # log it
+                continue # next folder
+            self.watches[wd] = folder # remember what it watches
+
+    '''
+    Reads the waiting inotify events and notes the watched files they touch, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        fd:
+            inotify file descriptor
+    '''
+    def onReadable(self, fd):
+        try: # handle errors with grace
+            data = os.read(fd, 64 * 1024) # every waiting event
+        except BlockingIOError: # nothing waiting after all
+            return # wait for the next wake up
+        except OSError as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error reading config changes: {e}") # log error
+            return # wait for the next wake up
+        files = self.watchedFiles() # paths worth reporting
+        offset = 0 # start of the next event
+        while offset + self.EVENT.size <= len(data): # every whole event
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset) # its header
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0') # file name, padded with zeros
+            offset += self.EVENT.size + length # next event
+            if mask & self.IN_Q_OVERFLOW: # events were lost
+                self.pending |= files # check every file
+            elif wd in self.watches: # one of our folders
+                path = os.path.join(self.watches[wd], os.fsdecode(name)) # file it is about
+                if path in files: # a config file, not the log or a temporary file
+                    self.pending.add(path) # report it
+        if self.pending: # something of interest changed
+            self.changed.set() # wake watch
+
+    '''
+    Gets what identifies the current version of a file.
+
+    Parameters:
+        self:
+            instance of object
+        path:
+            path of the file
+    Returns:
+        (modification time, size), or None if it is missing
+    '''
+    def stamp(self, path):
+        try: # handle errors with grace
+            info = os.stat(path) # file details
+            return (info.st_mtime_ns, info.st_size) # changes whenever the file is written
+        except OSError: # missing or unreadable
+            return None # nothing to compare
+
+    '''
+    Compares the modification times of the watched files with the last check and notes the changed ones.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def pollFiles(self):
+        for path in self.watchedFiles(): # every watched file
+            stamp = self.stamp(path) # its current version
+            if path in self.stamps and stamp != self.stamps[path] and stamp is not None: # written since the last check, and not deleted
+                self.pending.add(path) # report it
+            self.stamps[path] = stamp # remember for the next check
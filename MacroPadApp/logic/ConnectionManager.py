@@ -1,6 +1,16 @@
-import threading
+import asyncio
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from logic.BindingEngine import BindingMatcher
+from logic.ConfigWatcher import ConfigWatcher
+from logic.DeviceWatcher import DeviceWatcher
+from logic.DispatchPolicy import DispatchPolicy
+from logic.LatencyStats import LatencyStats
 from logic.Logger import Logger
+from logic.Protocol import Protocol
+from logic.Runtime import Runtime
+from logic.Settings import Settings
 
 '''
     Handles the connection process and serial communication with the device.
@@ -20,88 +30,462 @@ class ConnectionManager:
             toggle_buttons_callback:
                 instance of toggle buttons to enable/disable GUI buttons
             run_action_callback:
-                instance of run action callback to execute received commands
+                instance of run action callback to execute received commands, called as (command, arrival, on_exit)
+            runtime:
+                Runtime whose event loop runs the connection tasks (default is a new one)
         '''
-    def __init__(self, serial_manager, macro_manager, update_status_callback, toggle_buttons_callback, run_action_callback):
+    def __init__(self, serial_manager, macro_manager, update_status_callback, toggle_buttons_callback, run_action_callback, runtime=None):
         self.serial_manager = serial_manager # initialize serial manager
         self.macro_manager = macro_manager # initialize macro manager
         self.update_status = update_status_callback # initialize update status callback
         self.toggle_buttons = toggle_buttons_callback # initialize toggle buttons callback
         self.run_action = run_action_callback # initialize run action callback
+        self.dispatch_policy = DispatchPolicy(self.run_action) # debounces and rate limits presses before they run
+        self.matcher = BindingMatcher(self.macro_manager) # follows the device's events through the compiled bindings
 
-        self.stop_event = threading.Event() # initialize new threading even
-        self.listening = False # ensure listening is set to False by default
-        self.running = True # ensure running is True by default
+        self.runtime = runtime or Runtime() # event loop the connection, watcher and listener run on
+        self.device_event = None # asyncio.Event set when a serial device is plugged in or removed, made on the loop
+        self.device_watcher = DeviceWatcher(self.onDevicesAdded, self.onDevicesRemoved, self.isConnected) # reports hot-plug changes, scans less often while connected
+        self.config_watcher = ConfigWatcher(self.configFiles, self.reloadConfig) # reports macro config edits made outside the app
+        self.listener_task = None # task reading from the device while connected
 
     '''
-    Attempts to auto-connect to device and retries until connection is successful.
+    Starts the connection handling on the runtime's event loop in a background thread.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        concurrent.futures.Future of the connection loop
+    '''
+    def start(self):
+        self.runtime.start() # event loop thread
+        return self.runtime.spawn(self.connectionLoop()) # connect, listen and reconnect as a task
+
+    '''
+    Runs the connection handling on the calling thread until stop is called.
 
     Parameters:
         self:
             pass instance object
     '''
     def connectionManager(self):
+        self.runtime.run(self.connectionLoop()) # the caller's thread runs the event loop
+
+    '''
+    Attempts to auto-connect to device and retries until connection is successful.
+
+    Waits between attempts are cut short by device hot-plug events, so a replugged pad reconnects right away
+    instead of after the backoff. While connected it sleeps until the listener ends or the pad is unplugged.
+
+    Parameters:
+        self:
+            pass instance object
+    '''
+    async def connectionLoop(self):
         retry_interval = 2 # increase after failed attempt
         max_interval = 60 # maximum interval retry can reach (1 min)
+        loop = asyncio.get_running_loop() # loop the tasks run on
+        self.device_event = asyncio.Event() # made here so it belongs to this loop
+        watcher_task = loop.create_task(self.device_watcher.watch()) # watch for devices being plugged in or removed
+        config_task = self.watchConfig(loop) # reload the macros when they are edited
+        try: # whatever ends the loop, cancellation included
+            while True: # runs until the task is cancelled
+                self.device_event.clear() # only react to device changes from here on
+                if not self.serial_manager.isConnected(): # if not currently connected to device
+                    Logger.info("Attempting auto-connect...") # log that there is an attempt to auto connect
+                    if await loop.run_in_executor(None, self.serial_manager.autoConnect): # probing blocks, so it runs on a thread while the loop carries on
+                        port = self.serial_manager.getPort() # gets the port to what the device is connected to
+                        self.update_status(f"Connected: {port}") # update status to connected to port number
+                        self.createListener() # start listening for data from device
+                        self.toggle_buttons(True) # allow user to edit buttons macros
+                        retry_interval = 2 # reset interval to 2 for future
+                    else: # if failed connection to device
+                        Logger.warning(f"Auto-connect failed. Retrying in {retry_interval} seconds...") # log the failed connection
+                        self.toggle_buttons(False) # ensure user cannot edit buttons
+                        self.update_status("Disconnected") # update status to disconnected
+                        if await self.waitForDevice(retry_interval): # wait before retrying, unless a device is plugged in first
+                            retry_interval = 2 # a new device gets a fresh backoff
+                        else: # nothing changed while waiting
+                            retry_interval = min(retry_interval * 2, max_interval) # double retry interval, cap at max
+                else: # if device is connected already
+                    await self.device_event.wait() # sleep until the listener ends or a device is removed
+        finally: # stopping
+            watcher_task.cancel() # stop watching for devices
+            if config_task: # watching the config
+                config_task.cancel() # stop it
+            if self.listener_task: # a listener was started
+                self.listener_task.cancel() # stop reading
+
+    '''
+    Starts watching the macro config if Settings.WATCH_CONFIG is on, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        loop:
+            running event loop
+    Returns:
+        the watcher task, or None
+    '''
+    def watchConfig(self, loop):
+        return loop.create_task(self.config_watcher.watch()) if Settings.WATCH_CONFIG else None # edits outside the app need no restart
+
+    '''
+    Gets the macro profiles in use.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        list of MacroManager
+    '''
+    def macroManagers(self):
+        return [self.macro_manager] # the one profile
+
+    '''
+    Gets the config files of the macro profiles in use, for the config watcher.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        list of paths
+    '''
+    def configFiles(self):
+        return [path for macro_manager in self.macroManagers() for path in (macro_manager.config_file, macro_manager.bindings_file)] # macros and bindings of each profile
+
+    '''
+    Reloads the profiles whose files changed and sends only the changed buttons to the device, runs on the loop.
+
+    The file is read on a worker thread while the listener carries on, and the connection is never touched.
+
+    Parameters:
+        self:
+            instance of object
+        paths:
+            set of absolute paths that changed
+    '''
+    async def reloadConfig(self, paths):
+        loop = asyncio.get_running_loop() # loop this runs on
+        for macro_manager in self.macroManagers(): # every profile in use
+            config_changed = os.path.abspath(macro_manager.config_file) in paths # its macros were edited
+            bindings_changed = os.path.abspath(macro_manager.bindings_file) in paths # its bindings were edited
+            if not config_changed and not bindings_changed: # not this profile
+                continue # next one
+            changed = await loop.run_in_executor(None, macro_manager.reloadActions, bindings_changed) if config_changed else {} # diff and swap in the new actions off the loop
+            if bindings_changed and not config_changed: # only the bindings were edited
+                await loop.run_in_executor(None, macro_manager.compileBindings) # recompile off the loop
+            for button_name, action in changed.items(): # only what changed
+                parts = button_name.split() # e.g. "Button 3 pressed"
+                if len(parts) == 3 and parts[1].isdigit(): # a button the device stores actions for
+                    self.write(Protocol.setCommand(int(parts[1]), action), macro_manager) # update it on the device
+
+    '''
+    Waits for a device to be plugged in or removed.
+
+    Parameters:
+        self:
+            instance of object
+        timeout:
+            longest time to wait in seconds
+    Returns:
+        True if a device changed, False if the time ran out
+    '''
+    async def waitForDevice(self, timeout):
+        try: # handle errors with grace
+            await asyncio.wait_for(self.device_event.wait(), timeout) # wake on a device change
+            return True # something changed
+        except asyncio.TimeoutError: # nothing happened
+            return False # time ran out
+
+    '''
+    Wakes the connection loop when a serial device is plugged in.
 
-        while not self.stop_event.is_set(): # runs until stop event is flagged
-            if not self.serial_manager.isConnected(): # if not currently connected to device
-                Logger.info("Attempting auto-connect...") # log that there is an attempt to auto connect
-                if self.serial_manager.autoConnect(): # calls autoConnect and if successful connection...
-                    port = self.serial_manager.getPort() # gets the port to what the device is connected to
-                    #Logger.info(f"Connected to {port}") # log the connected port
-                    self.update_status(f"Connected: {port}") # update status to connected to port number
-                    self.startSerialListener() # start listening for data from device
-                    self.toggle_buttons(True) # allow user to edit buttons macros
-                    retry_interval = 2 # reset interval to 2 for future
-                else: # if failed connection to device
-                    Logger.warning(f"Auto-connect failed. Retrying in {retry_interval} seconds...") # log the failed connection
-                    self.toggle_buttons(False) # ensure user cannot edit buttons
-                    self.update_status("Disconnected") # update status to disconnected
-                    time.sleep(retry_interval) # wait time before retrying 
-                    retry_interval = min(retry_interval * 2, max_interval) # double retry interval, cap at max
-            else: # if device is connected already
-                time.sleep(2) # wait 2 seconds before checking again
+    Parameters:
+        self:
+            instance of object
+        ports:
+            set of ports that appeared
+    '''
+    def onDevicesAdded(self, ports):
+        if not self.serial_manager.isConnected(): # only matters while looking for the pad
+            self.device_event.set() # try to connect right away
+
+    '''
+    Marks the link down as soon as the connected device is unplugged.
+
+    Parameters:
+        self:
+            instance of object
+        ports:
+            set of ports that disappeared
+    '''
+    def onDevicesRemoved(self, ports):
+        if self.serial_manager.getPort() in ports: # if the connected pad was the one removed
+            Logger.warning(f"Device on {self.serial_manager.getPort()} was unplugged") # log the removal
+            self.serial_manager.markDisconnected() # flag the link as down and wake a blocked read
+            if self.listener_task: # listener may be waiting for data that will never come
+                self.listener_task.cancel() # stop it
+            self.device_event.set() # let the connection loop update the status and start reconnecting
 
     '''
-    Listens for data sent from device.
-    
+    Starts listening for data sent from device, safe to call from any thread.
+
     Parameters:
         self:
             instance of object
     '''
     def startSerialListener(self):
-        if not self.listening and self.serial_manager.isConnected(): # if serial listener isn't running and device is currently connected
-            threading.Thread(target=self.serialListener, daemon=True).start() # create new thread that has serialListener running
-            self.listening = True # set listening to true since thread for listening is created
+        self.runtime.callSoon(self.createListener) # the task is created on the loop
+
+    '''
+    Starts the listener task if none is running and the device is connected, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def createListener(self):
+        if not self.isListening() and self.serial_manager.isConnected(): # if serial listener isn't running and device is currently connected
+            self.matcher = BindingMatcher(self.macro_manager, bool(self.serial_manager.protocol)) # fresh state, text firmware sends no releases
+            self.listener_task = asyncio.get_running_loop().create_task(self.serialListener()) # read as a task
+
+    '''
+    Checks whether the listener task is running.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        True if it is
+    '''
+    def isListening(self):
+        return self.listener_task is not None and not self.listener_task.done() # started and not finished
+
+    '''
+    Listens for input data from device until it disconnects.
+
+    Where the port has a file descriptor the loop watches it and reads only when bytes are waiting, so nothing
+    wakes while the pad is idle. Elsewhere (Windows) each read blocks on a reader thread of its own. Either way the
+    connection loop is woken once the listener ends so it can reconnect.
+
+    Parameters:
+        self:
+            instance of object
+        serial_manager:
+            connection to read from (default is this manager's)
+        on_event:
+            called with every event token (default is handleEvent)
+    '''
+    async def serialListener(self, serial_manager=None, on_event=None):
+        serial_manager = serial_manager or self.serial_manager # device to read
+        on_event = on_event or self.handleEvent # what to do with each event
+        loop = asyncio.get_running_loop() # loop this task runs on
+        try: # whatever ends the listener
+            fd = serial_manager.fileno() # descriptor the loop can watch, if any
+            if fd is not None: # POSIX port
+                try: # handle errors with grace
+                    await self.watchPort(loop, fd, serial_manager, on_event) # read when the port is readable
+                    return # connection dropped
+                except NotImplementedError: # a loop that cannot watch descriptors
+                    pass # fall back to blocking reads
+            await self.pollPort(loop, serial_manager, on_event) # blocking reads on a thread
+        finally: # listener is done
+            if self.device_event: # connection loop is running
+                self.device_event.set() # let it notice the disconnect
+
+    '''
+    Reads from the port whenever the loop reports it readable, until the connection drops.
+
+    Parameters:
+        self:
+            instance of object
+        loop:
+            running event loop
+        fd:
+            file descriptor of the port
+        serial_manager:
+            connection to read from
+        on_event:
+            called with every event token
+    '''
+    async def watchPort(self, loop, fd, serial_manager, on_event):
+        finished = loop.create_future() # resolved once the connection is gone
+
+        '''
+        Reads what is waiting and handles every complete event in it.
+        '''
+        def onReadable():
+            try: # handle errors with grace
+                if serial_manager.fillBuffer(): # took the waiting bytes
+                    line = serial_manager.readEvent() # first complete event, if any
+                    while line: # every complete event
+                        on_event(line) # look it up and run it
+                        line = serial_manager.readEvent() # next one
+            except Exception as e: # gracefully handle errors so program doesnt crash
+                Logger.error(f"Error handling serial data: {e}") # log error
+            if not serial_manager.isConnected() and not finished.done(): # connection dropped
+                finished.set_result(None) # end the listener
+
+        loop.add_reader(fd, onReadable) # call it whenever bytes arrive
+        try: # until the connection drops or the task is cancelled
+            await finished # sleep meanwhile
+        finally: # either way
+            loop.remove_reader(fd) # stop watching the port
+
+    '''
+    Reads from the port with blocking reads on a reader thread, until the connection drops.
+
+    Parameters:
+        self:
+            instance of object
+        loop:
+            running event loop
+        serial_manager:
+            connection to read from
+        on_event:
+            called with every event token
+    '''
+    async def pollPort(self, loop, serial_manager, on_event):
+        read_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SerialReader") # reads stay in order on one thread
+        try: # until the connection drops or the task is cancelled
+            while serial_manager.isConnected(): # while the device is still attached
+                line = await loop.run_in_executor(read_pool, serial_manager.readEvent, True) # waits for the next event sent by the device
+                if line: # if there is data in the line
+                    on_event(line) # look it up and run it
+        finally: # either way
+            read_pool.shutdown(wait=False) # let the last read finish on its own, stop cancels it
+
+    '''
+    Follows an event through the compiled bindings and runs whatever it completes.
+
+    Parameters:
+        self:
+            instance of object
+        line:
+            event token from the device
+        arrival:
+            time.perf_counter_ns the event was read (default is the last read of this manager's device)
+        matcher:
+            BindingMatcher of the device (default is this manager's)
+        port:
+            port the event came from, for the log (default is this manager's device)
+    '''
+    def handleEvent(self, line, arrival=None, matcher=None, port=None):
+        arrival = arrival if arrival is not None else self.serial_manager.event_arrival # when the event came off the wire
+        matcher = matcher or self.matcher # bindings state of the device
+        port = port or self.serial_manager.getPort() # where the press came from
+        started = time.perf_counter_ns() # time the lookup
+        fired, mapped = matcher.feed(line, time.monotonic()) # one table lookup, plus any timeout already due
+        LatencyStats.record('lookup', time.perf_counter_ns() - started) # how long the lookup took
+        self.runBindings(fired, line, arrival, port) # run what the event completed
+        self.scheduleTimeout(matcher, port) # a hold or an unfinished sequence may fire later
+        if not mapped and line not in Protocol.RELEASE_TOKENS: # if there is no matching binding (releases never need one)
+            Logger.warning(f"No action mapped for {line}") # log warning that command doesn't exist
+
+    '''
+    Runs the actions of completed bindings.
+
+    Parameters:
+        self:
+            instance of object
+        fired:
+            list of (label, action) from the matcher
+        line:
+            event that completed them, for the log
+        arrival:
+            time.perf_counter_ns the event was read
+        port:
+            port the event came from
+    '''
+    def runBindings(self, fired, line, arrival, port):
+        for label, command in fired: # every completed binding
+            started = time.perf_counter_ns() # time the hand off to the action runner
+            result = self.dispatch_policy.dispatch(label, command, arrival, key=(port, label)) # run that command unless its policy skips it, passing the arrival time on for the total latency
+            dispatch = time.perf_counter_ns() - started # how long the hand off took
+            if result == 'run': # skipped presses are logged by the policy, rejected ones by the action runner
+                LatencyStats.record('dispatch', dispatch) # add it to the stats
+                Logger.info(f"Executed action for {line} (mapped to {label})", event='executed', button=label, port=port, duration=round(dispatch / 1e9, 6)) # log that command was run
+
+    '''
+    Arms a timer for the matcher's next timeout, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        matcher:
+            BindingMatcher of the device
+        port:
+            port of the device
+    '''
+    def scheduleTimeout(self, matcher, port):
+        if matcher.timer is not None: # timer of an earlier state
+            matcher.timer.cancel() # no longer wanted
+            matcher.timer = None # forget it
+        if matcher.deadline is None: # nothing pending
+            return # no timer needed
+        try: # handle errors with grace
+            loop = asyncio.get_running_loop() # the runtime loop the events arrive on
+        except RuntimeError: # called outside the loop
+            return # the timeout runs with the next event instead
+        matcher.timer = loop.call_later(max(matcher.deadline - time.monotonic(), 0), self.onTimeout, matcher, port) # fire it on time
+
+    '''
+    Runs a hold or finished sequence once its timeout is reached, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        matcher:
+            BindingMatcher of the device
+        port:
+            port of the device
+    '''
+    def onTimeout(self, matcher, port):
+        matcher.timer = None # this timer has fired
+        try: # handle errors with grace
+            fired = matcher.expire(time.monotonic()) # what timed out
+            self.runBindings(fired, "timeout", time.perf_counter_ns(), port) # run it, the latency counts from now
+            self.scheduleTimeout(matcher, port) # in case the new state times out too
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error running binding timeout: {e}", port=port) # log error
 
     '''
-    Continuously listens for input data from device.
+    Checks whether a device is connected.
 
     Parameters:
         self:
             instance of object
+    Returns:
+        True if one is
     '''
-    def serialListener(self):
-        while self.running: # while app is running
-            line = self.serial_manager.readLine() # reads the line of the sent data and assigns it to a variable
-            if line: # if there is data in the line
-                for button_name, command in self.macro_manager.getAllActions().items(): # iterate over all buttons and check all their actions
-                    if command == line: # if the command is the same as the line
-                        self.run_action(command) # if it matches, then run that command
-                        Logger.info(f"Executed action for {line} (mapped to {button_name})") # log that command was run
-                        break # break out of the loop
-                else: # if there is no matching command
-                    Logger.warning(f"No action mapped for {line}") # log warning that command doesn't exist
-            time.sleep(0.01) # allow time between checks
+    def isConnected(self):
+        return self.serial_manager.isConnected() # the one connection
 
     '''
-    Gracefully stops connection handling and serial listener.
-    
+    Sends data to the device from the runtime loop, safe to call from any thread.
+
+    Parameters:
+        self:
+            instance of object
+        data:
+            bytes to send, e.g. a SET command
+        macro_manager:
+            only send to devices using this macro profile (ignored with a single device)
+    '''
+    def write(self, data, macro_manager=None):
+        self.runtime.callSoon(self.serial_manager.write, data) # written on the loop, not the caller's thread
+
+    '''
+    Stops connection handling and the serial listener, cancelling their tasks and waiting for them to finish.
+
+    Safe to call from any thread, and from a signal handler on the thread running the loop.
+
     Parameters:
         self:
             instance of object
     '''
     def stop(self):
-        self.running = False # ensure that the running boolean is set to false
-        self.stop_event.set() # call stop even and set it
+        self.serial_manager.cancelRead() # wake a blocking read so the reader thread is free straight away
+        self.runtime.stop() # cancel every task and wait for the loop to finish
@@ -0,0 +1,350 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from logic.BindingEngine import BindingMatcher
+from logic.ConnectionManager import ConnectionManager
+from logic.Logger import Logger
+from logic.MacroManager import MacroManager
+from logic.SerialManager import SerialManager
+from logic.Settings import Settings
+
+'''
+One connected MacroPad.
+'''
+class Device:
+
+    '''
+    Default constructor for Device.
+
+    Parameters:
+        self:
+            instance of object
+        device_id:
+            USB serial number of the board, or its port when it has none
+        serial_manager:
+            SerialManager connected to the board
+        macro_manager:
+            macro profile the board's buttons use
+    '''
+    def __init__(self, device_id, serial_manager, macro_manager):
+        self.device_id = device_id # stable name of the board
+        self.serial_manager = serial_manager # its connection
+        self.port = serial_manager.getPort() # port it is on, kept after the connection closes
+        self.macro_manager = macro_manager # its macros
+        self.matcher = BindingMatcher(macro_manager, bool(serial_manager.protocol)) # its own bindings state, text firmware sends no releases
+        self.task = None # listener task reading from it
+
+    '''
+    Puts an event from this device on the shared dispatch queue, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        queue:
+            asyncio.Queue the dispatcher reads
+        line:
+            event token from the device
+    '''
+    def queueEvent(self, queue, line):
+        queue.put_nowait((self, line, self.serial_manager.event_arrival)) # tagged with the device it came from
+
+
+'''
+Keeps every MacroPad that is plugged in connected at once.
+
+Each pad gets its own SerialManager and a listener task on the shared Runtime loop, so more pads cost no more
+threads or polling (see ConnectionManager.serialListener). Every listener puts its events on one dispatch
+queue tagged with the device, and a single dispatcher looks each one up in that device's macro profile
+(Settings.DEVICE_PROFILES) and runs it. Used instead of ConnectionManager when Settings.MULTI_DEVICE is on.
+'''
+class DeviceManager(ConnectionManager):
+
+    '''
+    Default constructor for DeviceManager.
+
+    Parameters:
+        serial_manager:
+            SerialManager used to probe ports, its baudrate and read timeout are used for every device
+        macro_manager:
+            macro profile of devices without one in Settings.DEVICE_PROFILES
+        update_status_callback, toggle_buttons_callback, run_action_callback, runtime:
+            same as ConnectionManager
+    '''
+    def __init__(self, serial_manager, macro_manager, update_status_callback, toggle_buttons_callback, run_action_callback, runtime=None):
+        super().__init__(serial_manager, macro_manager, update_status_callback, toggle_buttons_callback, run_action_callback, runtime) # shared setup
+        self.devices = {} # device id -> Device, only touched on the loop
+        self.profiles = {} # config file -> MacroManager of the per device profiles loaded so far
+        self.queue = None # asyncio.Queue of (device, token, arrival) from every listener, made on the loop
+
+    '''
+    Finds MacroPads on the ports that are not in use yet and connects to them, runs on a worker thread.
+
+    Free ports reporting a known MacroPad VID/PID (every free port with Settings.PROBE_ALL_PORTS) are probed at
+    the same time, so unknown devices are never written to. A port is used if it answers the ident request or
+    its VID/PID matches, so pads on older firmware are kept next to ones that identify themselves.
+
+    Parameters:
+        self:
+            instance of object
+        in_use:
+            set of ports already connected
+    Returns:
+        list of (device id, connected SerialManager)
+    '''
+    def discover(self, in_use):
+        import serial.tools.list_ports # imported on first use, it is slow to load
+        ports = [port for port in serial.tools.list_ports.comports() if port.device not in in_use] # free ports with their USB metadata
+        known = {port.device for port in ports if (port.vid, port.pid) in Settings.DEVICE_IDS} # ports that look like a MacroPad board
+        ports = [port for port in ports if Settings.PROBE_ALL_PORTS or port.device in known] # never write to unknown devices unless asked to
+        if not ports: # nothing new plugged in
+            return [] # nothing to connect
+        with ThreadPoolExecutor(max_workers=min(len(ports), Settings.PROBE_WORKERS)) as pool: # probe ports side by side
+            results = dict(zip((port.device for port in ports), pool.map(self.serial_manager.probePort, (port.device for port in ports)))) # port to probe result
+        chosen = {name for name, result in results.items() if result and (result[1].startswith(Settings.IDENT_REPLY) or name in known)} # ports that identified themselves or look like a pad
+        found = [] # newly connected devices
+        for port in ports: # every probed port, in system order
+            result = results[port.device] # what probing it gave
+            if not result: # could not be opened
+                continue # nothing to release
+            if port.device not in chosen: # opened but not a MacroPad
+                result[0].close() # release it
+                continue # next port
+            serial_manager = SerialManager(self.serial_manager.baudrate, self.serial_manager.read_timeout) # a connection of its own
+            serial_manager.usePort(port.device, *result) # take over the probed port and negotiate the protocol
+            found.append((port.serial_number or port.device, serial_manager)) # named by serial number so its profile follows it between ports
+        return found # return the new devices
+
+    '''
+    Connects to every MacroPad plugged in and keeps looking for more until stopped.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    async def connectionLoop(self):
+        retry_interval = 2 # increase after failed attempt
+        max_interval = 60 # maximum interval retry can reach (1 min)
+        loop = asyncio.get_running_loop() # loop the tasks run on
+        self.device_event = asyncio.Event() # made here so it belongs to this loop
+        self.queue = asyncio.Queue() # shared by every device
+        watcher_task = loop.create_task(self.device_watcher.watch()) # watch for devices being plugged in or removed
+        config_task = self.watchConfig(loop) # reload the macros when they are edited
+        dispatcher_task = loop.create_task(self.dispatchLoop()) # runs the actions of every device
+        try: # whatever ends the loop, cancellation included
+            while True: # runs until the task is cancelled
+                self.device_event.clear() # only react to device changes from here on
+                in_use = {device.port for device in self.devices.values()} # ports already connected
+                found = await loop.run_in_executor(None, self.discover, in_use) # probing blocks, so it runs on a thread while the loop carries on
+                for device_id, serial_manager in found: # each new pad
+                    self.addDevice(device_id, serial_manager) # start reading it
+                self.reportStatus() # show what is connected
+                if self.devices: # at least one pad
+                    retry_interval = 2 # reset interval to 2 for future
+                    await self.device_event.wait() # sleep until a pad is plugged in, removed or drops
+                else: # nothing found
+                    Logger.warning(f"No MacroPad found. Retrying in {retry_interval} seconds...") # log the failed connection
+                    if await self.waitForDevice(retry_interval): # wait before retrying, unless a device is plugged in first
+                        retry_interval = 2 # a new device gets a fresh backoff
+                    else: # nothing changed while waiting
+                        retry_interval = min(retry_interval * 2, max_interval) # double retry interval, cap at max
+        finally: # stopping
+            watcher_task.cancel() # stop watching for devices
+            if config_task: # watching the config
+                config_task.cancel() # stop it
+            dispatcher_task.cancel() # stop running actions
+            for device in list(self.devices.values()): # every pad still connected
+                device.task.cancel() # stop reading it, its port is closed when the task ends
+
+    '''
+    Starts reading a newly connected device, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        device_id:
+            USB serial number or port of the board
+        serial_manager:
+            SerialManager connected to it
+    '''
+    def addDevice(self, device_id, serial_manager):
+        if device_id in self.devices: # two boards with the same serial number
+            device_id = f"{device_id}@{serial_manager.getPort()}" # tell them apart by port
+        device = Device(device_id, serial_manager, self.profileFor(device_id)) # the new pad
+        self.devices[device_id] = device # remember it
+        device.task = asyncio.get_running_loop().create_task(self.serialListener(serial_manager, lambda line: device.queueEvent(self.queue, line))) # read it as a task
+        device.task.add_done_callback(lambda task: self.removeDevice(device)) # forget it once reading ends
+        Logger.info(f"MacroPad {device_id} connected on {device.port}", event='connect', port=device.port) # log the new pad
+
+    '''
+    Forgets a device whose listener has ended and releases its port, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        device:
+            the Device
+    '''
+    def removeDevice(self, device):
+        if self.devices.get(device.device_id) is device: # still the one under that id
+            del self.devices[device.device_id] # forget it
+            Logger.info(f"MacroPad {device.device_id} on {device.port} disconnected", port=device.port) # log it
+        device.serial_manager.close() # release the port
+        if self.device_event: # connection loop is running
+            self.device_event.set() # let it update the status and look for the pad again
+
+    '''
+    Gets the macro profile of a device.
+
+    Parameters:
+        self:
+            instance of object
+        device_id:
+            USB serial number or port of the board
+    Returns:
+        its MacroManager, the default one unless Settings.DEVICE_PROFILES names another config
+    '''
+    def profileFor(self, device_id):
+        config = Settings.DEVICE_PROFILES.get(device_id) # config file of the device, if it has its own
+        if not config: # no profile of its own
+            return self.macro_manager # default macros
+        if config not in self.profiles: # first device with this profile
+            self.profiles[config] = MacroManager(os.path.join(Settings.RESOURCES_DIR, config)) # load it once, shared by every device using it
+        return self.profiles[config] # return the profile
+
+    '''
+    Gets the macro profiles in use.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        list of MacroManager, the default one and every per device profile loaded so far
+    '''
+    def macroManagers(self):
+        return [self.macro_manager, *self.profiles.values()] # every profile a device may use
+
+    '''
+    Runs the action of every queued event in the order the events arrived.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    async def dispatchLoop(self):
+        while True: # until cancelled
+            device, line, arrival = await self.queue.get() # next event from any device
+            try: # handle errors with grace
+                self.handleEvent(line, arrival, device.matcher, device.port) # follow it through the device's profile and run it
+            except Exception as e: # gracefully handle errors so program doesnt crash
+                Logger.error(f"Error dispatching {line} from {device.device_id}: {e}", port=device.port) # log error
+            finally: # either way
+                self.queue.task_done() # one less event waiting
+
+    '''
+    Updates the status and buttons to match the connected devices.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def reportStatus(self):
+        if self.devices: # at least one pad
+            self.update_status(f"Connected: {', '.join(sorted(device.port for device in self.devices.values()))}") # every port in use
+            self.toggle_buttons(True) # allow user to edit buttons macros
+        else: # nothing connected
+            self.update_status("Disconnected") # update status to disconnected
+            self.toggle_buttons(False) # ensure user cannot edit buttons
+
+    '''
+    Wakes the connection loop to probe a newly plugged in device, even while other pads are connected.
+
+    Parameters:
+        self:
+            instance of object
+        ports:
+            set of ports that appeared
+    '''
+    def onDevicesAdded(self, ports):
+        self.device_event.set() # probe the new ports right away
+
+    '''
+    Stops reading the devices that were unplugged.
+
+    Parameters:
+        self:
+            instance of object
+        ports:
+            set of ports that disappeared
+    '''
+    def onDevicesRemoved(self, ports):
+        for device in list(self.devices.values()): # every connected pad
+            if device.port in ports: # this one was removed
+                Logger.warning(f"MacroPad {device.device_id} on {device.port} was unplugged") # log the removal
+                device.serial_manager.markDisconnected() # flag the link as down
+                device.task.cancel() # stop reading, removeDevice runs once it ends
+
+    '''
+    Checks whether any device is connected.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        True if at least one is
+    '''
+    def isConnected(self):
+        return bool(self.devices) # any pad at all
+
+    '''
+    Checks whether any listener task is running.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        True if one is
+    '''
+    def isListening(self):
+        return any(not device.task.done() for device in list(self.devices.values())) # any pad still being read
+
+    '''
+    Sends data to the devices using a macro profile, safe to call from any thread.
+
+    Parameters:
+        self:
+            instance of object
+        data:
+            bytes to send, e.g. a SET command
+        macro_manager:
+            only send to devices using this profile (default is every device)
+    '''
+    def write(self, data, macro_manager=None):
+        self.runtime.callSoon(self.writeDevices, data, macro_manager) # devices are only touched on the loop
+
+    '''
+    Sends data to the devices using a macro profile, runs on the loop.
+
+    Parameters:
+        self:
+            instance of object
+        data:
+            bytes to send
+        macro_manager:
+            only send to devices using this profile, or None for every device
+    '''
+    def writeDevices(self, data, macro_manager):
+        for device in self.devices.values(): # every connected pad
+            if macro_manager is None or device.macro_manager is macro_manager: # uses the profile being edited
+                device.serial_manager.write(data) # send it
+
+    '''
+    Stops every device's listener and the connection handling, waiting for them to finish.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def stop(self):
+        for device in list(self.devices.values()): # every connected pad
+            device.serial_manager.cancelRead() # wake a blocking read so its reader thread is free straight away
+        super().stop() # cancel every task and wait for the loop to finish
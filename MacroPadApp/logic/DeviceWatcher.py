@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+from logic.Logger import Logger
+from logic.Settings import Settings
+
+'''
+Watches for serial devices being plugged in or removed and reports the changes.
+
+Off Linux each check is a full comports() scan, so while a device is connected the ports are only listed every
+Settings.DEVICE_POLL_INTERVAL_CONNECTED. An unplugged device is noticed by its failing reads in the meantime.
+'''
+class DeviceWatcher:
+
+    '''
+    Default constructor for DeviceWatcher.
+
+    Parameters:
+        self:
+            instance of object
+        on_added:
+            called with the set of ports that appeared
+        on_removed:
+            called with the set of ports that disappeared
+        is_connected:
+            called with no arguments, whether a device is connected so scans can slow down (optional)
+    '''
+    def __init__(self, on_added, on_removed, is_connected=None):
+        self.on_added = on_added # callback for new ports
+        self.on_removed = on_removed # callback for removed ports
+        self.is_connected = is_connected # connection state, None always scans at the fast rate
+
+    '''
+    Takes a snapshot of the serial ports currently present.
+
+    On Linux this only lists the matching /dev entries, which is far cheaper than a full list_ports scan.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        set of port names
+    '''
+    def snapshot(self):
+        if sys.platform.startswith('linux'): # device nodes show up in /dev as soon as the pad is plugged in
+            with os.scandir('/dev') as entries: # list /dev without stat calls
+                return {entry.path for entry in entries if entry.name.startswith(Settings.DEVICE_NAME_PREFIXES)} # USB serial nodes only
+        import serial.tools.list_ports # only needed off Linux, imported on first use
+        return {port.device for port in serial.tools.list_ports.comports()} # every serial port on other systems
+
+    '''
+    Compares snapshots and reports the differences until the task is cancelled.
+
+    Runs as a task on the Runtime loop, so the callbacks run on the loop too.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    async def watch(self):
+        loop = asyncio.get_running_loop() # loop this task runs on
+        linux = sys.platform.startswith('linux') # listing /dev is cheap enough to do at the fast rate
+        scan = self.snapshot if linux else lambda: loop.run_in_executor(None, self.snapshot) # a full port scan is slow, keep it off the loop
+        known = await self.takeSnapshot(scan) or set() # ports present when watching started
+        last_scan = loop.time() # when the ports were last listed
+        while True: # until cancelled
+            await asyncio.sleep(Settings.DEVICE_POLL_INTERVAL) # check again every poll interval
+            if not linux and self.is_connected and self.is_connected() and loop.time() - last_scan < Settings.DEVICE_POLL_INTERVAL_CONNECTED: # connected, no need for a full scan yet
+                continue # a disconnect switches back to the fast rate straight away
+            last_scan = loop.time() # scanning now
+            current = await self.takeSnapshot(scan) # ports present now
+            if current is None: # listing failed
+                continue # try again next interval
+            added = current - known # ports that appeared
+            removed = known - current # ports that went away
+            known = current # remember for the next comparison
+            if removed: # if anything was unplugged
+                Logger.info(f"Serial device removed: {', '.join(sorted(removed))}") # log the removed ports
+                self.on_removed(removed) # report them
+            if added: # if anything was plugged in
+                Logger.info(f"Serial device added: {', '.join(sorted(added))}") # log the new ports
+                self.on_added(added) # report them
+
+    '''
+    Takes a snapshot, logging instead of raising when the ports cannot be listed.
+
+    Parameters:
+        self:
+            instance of object
+        scan:
+            snapshot function, or one returning an awaitable of the snapshot
+    Returns:
+        set of port names, or None on error
+    '''
+    async def takeSnapshot(self, scan):
+        try: # handle errors with grace
+            result = scan() # list the ports
+            return await result if asyncio.isfuture(result) else result # wait for it if it went to a thread
+        except OSError as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error listing serial devices: {e}") # log the error with the error message
+            return None # no snapshot this time
@@ -0,0 +1,170 @@
+import threading
+import time
+from logic.Logger import Logger
+from logic.Settings import Settings
+
+'''
+Decides whether a button press runs its action, so chatter, held keys and impatient repeats do not pile up.
+
+Each button has its own policy (Settings.DISPATCH_POLICY, with per button changes in Settings.DISPATCH_POLICIES):
+    debounce:
+        presses less than this many seconds after the previous press of the same button are ignored
+    throttle:
+        presses less than this many seconds after the button's action last ran are ignored
+    max_in_flight:
+        most runs of the button's action allowed at once, 0 for no limit
+    collapse:
+        whether a press made while the action is at max_in_flight runs once a run finishes, repeats collapsing
+        into that one follow up run, instead of being dropped
+'''
+class DispatchPolicy:
+
+    '''
+    Default constructor for DispatchPolicy.
+
+    Parameters:
+        self:
+            instance of object
+        run_action:
+            called as run_action(command, arrival, on_exit), returns None when the action did not start
+        default:
+            changes to Settings.DISPATCH_POLICY used for every button (optional)
+        overrides:
+            button name -> changes to its policy (default is Settings.DISPATCH_POLICIES)
+    '''
+    def __init__(self, run_action, default=None, overrides=None):
+        self.run_action = run_action # starts the action
+        self.default = dict(Settings.DISPATCH_POLICY, **(default or {})) # policy of buttons without their own
+        self.overrides = Settings.DISPATCH_POLICIES if overrides is None else overrides # per button changes
+        self.lock = threading.Lock() # presses come from the loop, finished actions from worker threads
+        self.states = {} # key -> state of that button, made on its first press
+
+    '''
+    Gets the policy of a button.
+
+    Parameters:
+        self:
+            instance of object
+        button:
+            button name, e.g. "Button 1 pressed"
+    Returns:
+        dictionary with debounce, throttle, max_in_flight and collapse
+    '''
+    def policyFor(self, button):
+        return dict(self.default, **self.overrides.get(button, {})) # its own changes over the default
+
+    '''
+    Runs a button's action unless its policy says to skip this press.
+
+    Parameters:
+        self:
+            instance of object
+        button:
+            button name, used to find its policy
+        command:
+            the action to run
+        arrival:
+            time.perf_counter_ns when the key press arrived (optional)
+        key:
+            what presses are grouped by, e.g. (port, button) so pads do not limit each other (default is the button)
+    Returns:
+        'run', or why the press was skipped: 'debounced', 'throttled', 'collapsed' (will run later), 'dropped' or
+        'rejected' (run_action did not start it, e.g. the action runner was full)
+    '''
+    def dispatch(self, button, command, arrival=None, key=None):
+        key = button if key is None else key # group by button unless told otherwise
+        now = time.monotonic() # one clock read for every check
+        with self.lock: # state is shared with finished
+            state = self.states.get(key) # what this button has been doing
+            if state is None: # first press
+                state = self.states[key] = {'policy': self.policyFor(button), 'last_seen': None, 'last_run': None, 'in_flight': 0, 'pending': None, 'skipped': 0, 'reported': None} # fresh state
+            policy = state['policy'] # its limits
+            last_seen, state['last_seen'] = state['last_seen'], now # every press counts for the debounce
+            if last_seen is not None and now - last_seen < policy['debounce']: # too soon after the last press
+                result = 'debounced' # contact chatter or a key repeat
+            elif state['last_run'] is not None and now - state['last_run'] < policy['throttle']: # too soon after the last run
+                result = 'throttled' # rate limited
+            elif policy['max_in_flight'] and state['in_flight'] >= policy['max_in_flight']: # still busy
+                if policy['collapse']: # run once more when a run finishes
+                    state['pending'] = (command, arrival) # repeats replace each other
+                    result = 'collapsed' # waiting
+                else: # nothing to wait for
+                    result = 'dropped' # skipped
+            else: # allowed
+                state['in_flight'] += 1 # one more run
+                state['last_run'] = now # for the throttle
+                result = 'run' # start it below
+            report = self.noteSkip(state, now) if result != 'run' else None # message when skips are due to be logged
+        if report: # logged outside the lock
+            Logger.info(f"{report} for {button}: {result}", event='skipped', button=button) # say why presses are not running
+        if result == 'run' and not self.start(key, command, arrival): # outside the lock, run_action may take a while
+            result = 'rejected' # allowed by the policy but it did not start
+        return result # return what happened to the press
+
+    '''
+    Counts a skipped press and decides whether it is time to log the skips, at most once a second per button.
+
+    Parameters:
+        self:
+            instance of object
+        state:
+            state of the button, the lock is held
+        now:
+            time.monotonic of the press
+    Returns:
+        text to log, or None
+    '''
+    def noteSkip(self, state, now):
+        state['skipped'] += 1 # one more since the last report
+        if state['reported'] is not None and now - state['reported'] < 1: # logged less than a second ago
+            return None # keep it quiet
+        count, state['skipped'], state['reported'] = state['skipped'], 0, now # reset the count
+        return f"Skipped {count} press{'es' if count != 1 else ''}" # text to log
+
+    '''
+    Runs an action, releasing its slot straight away when it did not start.
+
+    Parameters:
+        self:
+            instance of object
+        key:
+            key of the button
+        command:
+            the action to run
+        arrival:
+            time.perf_counter_ns when the key press arrived, or None
+    Returns:
+        whether the action started
+    '''
+    def start(self, key, command, arrival):
+        try: # handle errors with grace
+            started = self.run_action(command, arrival, lambda: self.finished(key)) # finished is called when it is over
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Failed to run action {command}: {e}") # log error
+            started = None # treat it as not started
+        if started is None: # on_exit will never be called
+            self.finished(key) # free the slot now
+            return False # it did not start
+        return True # on_exit frees the slot
+
+    '''
+    Frees a run of a button's action, and runs the collapsed press if one is waiting.
+
+    Parameters:
+        self:
+            instance of object
+        key:
+            key of the button
+    '''
+    def finished(self, key):
+        with self.lock: # state is shared with dispatch
+            state = self.states[key] # the button
+            state['in_flight'] = max(state['in_flight'] - 1, 0) # one less run
+            pending = state['pending'] # press waiting to run
+            if pending is None or (state['policy']['max_in_flight'] and state['in_flight'] >= state['policy']['max_in_flight']): # nothing waiting or still no room
+                return # nothing to start
+            state['pending'] = None # taken
+            state['in_flight'] += 1 # its run
+            state['last_run'] = time.monotonic() # for the throttle
+        self.start(key, *pending) # run it outside the lock
+
@@ -0,0 +1,219 @@
+import json
+import sys
+import threading
+import time
+from logic.Settings import Settings
+
+'''
+Log-linear latency histogram in the style of HdrHistogram.
+
+Every power of two of nanoseconds is split into SUB_BUCKETS equal buckets, so any recorded value is known to
+within about 3% while the whole range up to minutes fits in roughly a thousand counters. Recording is a few
+integer operations and one uncontended lock.
+'''
+class LatencyHistogram:
+    SUB_BITS = 5 # log2 of the buckets per power of two
+    SUB_BUCKETS = 1 << SUB_BITS # buckets per power of two
+    MAX_EXPONENT = 36 # values past about 2^41 ns (36 minutes) land in the last bucket
+
+    '''
+    Default constructor for LatencyHistogram.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def __init__(self):
+        self.lock = threading.Lock() # stages can be recorded from several worker threads
+        self.counts = [0] * ((self.MAX_EXPONENT + 1) * self.SUB_BUCKETS) # one counter per bucket
+        self.total = 0 # values recorded
+        self.max = 0 # largest value recorded, kept exactly
+
+    '''
+    Works out which bucket a value goes in.
+
+    Parameters:
+        value:
+            nanoseconds
+    Returns:
+        bucket index
+    '''
+    @staticmethod
+    def bucketIndex(value):
+        if value < LatencyHistogram.SUB_BUCKETS: # small values get a bucket each
+            return value # exact
+        exponent = value.bit_length() - LatencyHistogram.SUB_BITS - 1 # how far to shift to keep the top bits
+        index = (exponent + 1) * LatencyHistogram.SUB_BUCKETS + (value >> exponent) - LatencyHistogram.SUB_BUCKETS # power of two, then the bucket inside it
+        return min(index, (LatencyHistogram.MAX_EXPONENT + 1) * LatencyHistogram.SUB_BUCKETS - 1) # clamp huge values
+
+    '''
+    Gets the largest value that lands in a bucket.
+
+    Parameters:
+        index:
+            bucket index
+    Returns:
+        nanoseconds
+    '''
+    @staticmethod
+    def bucketValue(index):
+        if index < LatencyHistogram.SUB_BUCKETS: # small values are exact
+            return index # the value itself
+        exponent = index // LatencyHistogram.SUB_BUCKETS - 1 # power of two of the bucket
+        mantissa = index % LatencyHistogram.SUB_BUCKETS + LatencyHistogram.SUB_BUCKETS # top bits of the values in it
+        return ((mantissa + 1) << exponent) - 1 # top of the bucket, percentiles never under report
+
+    '''
+    Adds a value.
+
+    Parameters:
+        self:
+            instance of object
+        value:
+            nanoseconds
+    '''
+    def record(self, value):
+        value = max(0, int(value)) # clocks never go backwards but be safe
+        index = self.bucketIndex(value) # bucket outside the lock
+        with self.lock: # counters are shared between threads
+            self.counts[index] += 1 # count it
+            self.total += 1 # one more value
+            if value > self.max: # new largest value
+                self.max = value # remember it exactly
+
+    '''
+    Gets the value below which a fraction of the recorded values fall.
+
+    Parameters:
+        self:
+            instance of object
+        fraction:
+            e.g. 0.99 for p99
+    Returns:
+        nanoseconds, 0 if nothing was recorded
+    '''
+    def percentile(self, fraction):
+        with self.lock: # consistent view of the counters
+            counts, total, largest = list(self.counts), self.total, self.max # copy so the walk is outside the lock
+        if not total: # nothing recorded
+            return 0 # nothing to report
+        wanted = max(1, int(fraction * total + 0.999999)) # rank of the value asked for
+        seen = 0 # values passed so far
+        for index, count in enumerate(counts): # buckets from small to large
+            seen += count # values up to this bucket
+            if seen >= wanted: # the value is in this bucket
+                return min(self.bucketValue(index), largest) # never past the real maximum
+        return largest # rounding left it past the end
+
+    '''
+    Forgets every recorded value.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def reset(self):
+        with self.lock: # counters are shared between threads
+            self.counts = [0] * len(self.counts) # clear every bucket
+            self.total = 0 # nothing recorded
+            self.max = 0 # no largest value
+
+
+'''
+Per stage latency of a key press, from the bytes arriving on the serial port to the action being started.
+
+Stages:
+    read: bytes read from the port until the token is returned by SerialManager
+    lookup: finding the mapped action in MacroManager
+    dispatch: handing the action to ActionExecutor
+    spawn: from the hand off until Popen (or the typed action) returned on a worker
+    total: bytes read from the port until Popen returned
+'''
+class LatencyStats:
+    STAGES = ('read', 'lookup', 'dispatch', 'spawn', 'total') # stages in the order a press goes through them
+    histograms = {stage: LatencyHistogram() for stage in STAGES} # one histogram per stage
+
+    '''
+    Records how long a stage took.
+
+    Parameters:
+        stage:
+            one of STAGES
+        nanoseconds:
+            time the stage took, from time.perf_counter_ns
+    '''
+    @staticmethod # static method
+    def record(stage, nanoseconds):
+        if Settings.LATENCY_STATS: # only when enabled
+            LatencyStats.histograms[stage].record(nanoseconds) # add it to the stage's histogram
+
+    '''
+    Gets the count, p50, p99 and max of every stage.
+
+    Returns:
+        dict of stage -> dict with 'count' and 'p50', 'p99', 'max' in milliseconds
+    '''
+    @staticmethod # static method
+    def summary():
+        result = {} # stats per stage
+        for stage in LatencyStats.STAGES: # every stage in order
+            histogram = LatencyStats.histograms[stage] # its histogram
+            result[stage] = {
+                'count': histogram.total, # presses that went through the stage
+                'p50': histogram.percentile(0.50) / 1e6, # median in ms
+                'p99': histogram.percentile(0.99) / 1e6, # 99th percentile in ms
+                'max': histogram.max / 1e6, # worst case in ms
+            }
+        return result # return the stats
+
+    '''
+    Formats a summary as a small table.
+
+    Parameters:
+        summary:
+            dict returned by summary
+    Returns:
+        table text
+    '''
+    @staticmethod # static method
+    def formatSummary(summary):
+        lines = [f"{'stage':<9}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"] # header
+        for stage, stats in summary.items(): # each stage
+            lines.append(f"{stage:<9}{stats['count']:>8}{stats['p50']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}") # one row per stage
+        return "\n".join(lines) # return the table
+
+    '''
+    Writes the summary and the raw buckets to a JSON file.
+
+    Parameters:
+        path:
+            file to write (default is Settings.LATENCY_FILE)
+    Returns:
+        path that was written
+    '''
+    @staticmethod # static method
+    def dump(path=None):
+        path = path or Settings.getLatencyFile() # where to write
+        buckets = {} # non empty buckets per stage, enough to merge dumps later
+        for stage, histogram in LatencyStats.histograms.items(): # every stage
+            with histogram.lock: # consistent view of the counters
+                buckets[stage] = {str(histogram.bucketValue(index)): count for index, count in enumerate(histogram.counts) if count} # top of bucket in ns -> count
+        with open(path, 'w') as f: # open the dump for writing
+            json.dump({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'summary': LatencyStats.summary(), 'buckets': buckets}, f, indent=4) # summary first for people reading it
+        return path # return where it went
+
+    '''
+    Forgets everything recorded, e.g. before a benchmark.
+    '''
+    @staticmethod # static method
+    def reset():
+        for histogram in LatencyStats.histograms.values(): # every stage
+            histogram.reset() # clear it
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else Settings.getLatencyFile() # dump to print, default is the app's
+    with open(path, 'r') as f: # open the dump
+        data = json.load(f) # parse it
+    print(f"Latency dump from {data['time']}") # when it was taken
+    print(LatencyStats.formatSummary(data['summary'])) # print the table
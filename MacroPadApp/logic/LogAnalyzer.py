@@ -0,0 +1,571 @@
+import argparse
+import gzip
+import json
+import mmap
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logic.LogIndex import LogIndex
+from logic.Logger import BatchFileHandler
+from logic.Settings import Settings
+
+'''
+Streams MacroPad.log, filters it and counts the INFO/WARN/ERROR lines, like the LogAnalyzer.rs tool.
+
+Lines are read one at a time so memory use stays the same no matter how big the log is. With Settings.LOG_INDEX
+the sidecar index (see LogIndex) answers level and date counts directly and limits reads to the blocks in range.
+Keyword searches memory map the log and run a case insensitive regex over newline aligned chunks, spread over
+a process pool when the log is big enough. Compressed archives left by log rotation are streamed first, skipping
+the ones that cannot hold lines in the date range.
+'''
+class LogAnalyzer:
+    LEVELS = ('INFO', 'WARN', 'ERROR') # levels that get their own count, anything else is OTHER
+    DATE_PATTERN = re.compile(rb'\d{4}-\d{2}-\d{2}') # first date on a line, e.g. "INFO (2025-04-20 17:09:08): ..."
+    PROGRESS_STEP = 1 << 20 # report progress every this many bytes read
+
+    '''
+    Default constructor for LogAnalyzer.
+
+    Parameters:
+        self:
+            instance of object
+        log_file:
+            path of the log to analyze (default is the one from Settings)
+    '''
+    def __init__(self, log_file=None):
+        self.log_file = log_file or Settings.getLogFile() # log to read
+
+    '''
+    Works out the level of a line from its prefix, the same way classifyLine in LogAnalyzer.rs does.
+
+    Parameters:
+        line:
+            raw bytes of the line
+    Returns:
+        'INFO', 'WARN', 'ERROR' or 'OTHER'
+    '''
+    @staticmethod
+    def classifyLine(line):
+        if line.startswith(b'{"level":"'): # structured line, the level is always the first key
+            line = line[10:] # look at the level value instead
+        if line.startswith(b'INFO'): # if its of type info
+            return 'INFO' # set it to info
+        if line.startswith(b'WARN'): # if its of type warn (covers WARNING)
+            return 'WARN' # set it to warn
+        if line.startswith(b'ERROR'): # if its of type error
+            return 'ERROR' # set it to error
+        return 'OTHER' # if its not any of the others
+
+    '''
+    Reads the log one line at a time.
+
+    Parameters:
+        self:
+            instance of object
+        progress_callback:
+            called with (bytes read, total bytes) as the file is read (optional)
+        cancel_event:
+            threading.Event that stops the read early when set (optional)
+        regions:
+            list of (start offset, end offset or None for end of file) to read instead of the whole file (optional)
+    Returns:
+        generator of raw line bytes without the line ending
+    '''
+    def streamLines(self, progress_callback=None, cancel_event=None, regions=None):
+        size = os.path.getsize(self.log_file) # size of the whole log
+        regions = regions if regions is not None else [(0, None)] # whole file unless told otherwise
+        total = sum((size if stop is None else stop) - begin for begin, stop in regions) # size for the progress report
+        done = 0 # bytes read so far
+        next_report = self.PROGRESS_STEP # when to report progress next
+        with open(self.log_file, 'rb') as f: # binary so nothing is decoded that is not shown
+            for begin, stop in regions: # each stretch of the log to read
+                f.seek(begin) # jump to it
+                position = begin # offset of the next line
+                for line in f: # one line at a time
+                    if stop is not None and position >= stop: # past the end of the stretch
+                        break # on to the next one
+                    position += len(line) # move past the line
+                    done += len(line) # count the bytes read
+                    if done >= next_report: # time for a progress report
+                        next_report = done + self.PROGRESS_STEP # schedule the next one
+                        if cancel_event is not None and cancel_event.is_set(): # asked to stop
+                            return # stop reading
+                        if progress_callback: # someone wants to know
+                            progress_callback(done, total) # report how far along the read is
+                    yield line.rstrip(b'\r\n') # hand out the line
+        if progress_callback: # someone wants to know
+            progress_callback(done, total) # report that the read finished
+
+    '''
+    Finds the compressed archives of the log that can hold lines in a date range.
+
+    An archive is named after the time it was rotated, so its lines are dated between the rotation time of
+    the archive before it and its own.
+
+    Parameters:
+        self:
+            instance of object
+        start:
+            earliest date as bytes or None
+        end:
+            latest date as bytes or None
+    Returns:
+        list of archive paths, oldest first
+    '''
+    def listSegments(self, start, end):
+        segments = [] # archives to read
+        previous = None # date the archive before was rotated, the earliest date this one can hold
+        for stamp, path in BatchFileHandler.listArchives(self.log_file): # every archive, oldest first
+            rotated = f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]}".encode('ascii') # latest date this archive can hold
+            if (start is None or rotated >= start) and (end is None or previous is None or previous <= end): # overlaps the range
+                segments.append(path) # read it
+            previous = rotated # next archive starts where this one ended
+        return segments # return the archives to read
+
+    '''
+    Streams one compressed archive and adds its matching lines to the summary.
+
+    Parameters:
+        self:
+            instance of object
+        path:
+            path of the .gz archive
+        pattern:
+            compiled keyword regex or None
+        level:
+            level to keep or None for all
+        start:
+            earliest date as bytes or None
+        end:
+            latest date as bytes or None
+        fields:
+            prepared field filters or None (see prepareFields)
+        summary:
+            counts to add the matching lines to
+        line_callback:
+            called with every matching line as text (optional)
+        cancel_event:
+            threading.Event that stops the read early when set (optional)
+    '''
+    def scanArchive(self, path, pattern, level, start, end, fields, summary, line_callback, cancel_event):
+        with gzip.open(path, 'rb') as f: # decompress while reading
+            for number, line in enumerate(f): # one line at a time
+                if number % 65536 == 0 and cancel_event is not None and cancel_event.is_set(): # asked to stop
+                    return # stop reading
+                line = line.rstrip(b'\r\n') # drop the line ending
+                if pattern and not pattern.search(line): # keyword missing
+                    continue # skip it
+                line_level = self.filterLine(line, level, start, end, fields) # level of the line if it passes the filters
+                if line_level is None: # filtered out
+                    continue # skip it
+                summary['total'] += 1 # one more matching line
+                summary[line_level] += 1 # count it for its level
+                if line_callback: # someone wants the lines
+                    line_callback(line.decode('utf-8', errors='replace')) # pass the line on as text
+
+    '''
+    Uses the log index to count whole blocks and work out which parts of the log still have to be read.
+
+    Blocks never span more than an hour, so a block is either entirely inside a date range or entirely outside
+    it. Lines without a date are counted apart in the index since they never match a date filter.
+
+    Parameters:
+        self:
+            instance of object
+        level:
+            level to keep or None for all
+        start:
+            earliest date as bytes or None
+        end:
+            latest date as bytes or None
+        count_only:
+            True if only the counts are wanted, so blocks in range are counted from the index instead of read
+        summary:
+            counts to add the blocks counted from the index to
+    Returns:
+        list of (start offset, end offset or None) to read, or None to read the whole log
+    '''
+    def planRegions(self, level, start, end, count_only, summary):
+        index = LogIndex(self.log_file, self.classifyLine) # sidecar index of the log
+        try: # handle errors with grace
+            indexed = index.update() # index anything new since last time
+        except OSError: # gracefully handle errors so program doesnt crash
+            return None # fall back to reading everything
+        regions = [] # stretches still to read
+        for block in index.blocks: # every block in the log
+            if start or end: # a date filter was given
+                if block[2] is None: # only undated lines in this block
+                    continue # skip it
+                date = block[2][:10].encode('ascii') # YYYY-MM-DD of the block
+                if (start and date < start) or (end and date > end): # outside the range
+                    continue # skip it
+                counts = block[3:7] # only dated lines can match
+            else: # no date filter
+                counts = [dated + undated for dated, undated in zip(block[3:7], block[7:11])] # every line counts
+            if level and counts[LogIndex.LEVEL_SLOTS[level]] == 0: # no line of the wanted level
+                continue # skip it
+            if count_only: # the index already has the answer
+                for name, slot in LogIndex.LEVEL_SLOTS.items(): # each level
+                    if level is None or name == level: # level is wanted
+                        summary[name] += counts[slot] # add its lines
+                        summary['total'] += counts[slot] # and to the total
+                continue # no need to read the block
+            if regions and regions[-1][1] == block[0]: # carries on from the previous stretch
+                regions[-1] = (regions[-1][0], block[1]) # grow it
+            else: # gap since the previous stretch
+                regions.append((block[0], block[1])) # start a new one
+        regions.append((indexed, None)) # anything written after the index was updated
+        return regions # return what to read
+
+    '''
+    Filters the log and counts the matching lines per level.
+
+    Parameters:
+        self:
+            instance of object
+        log_type:
+            only keep lines of this level: info, warn or error (optional, anything else keeps all)
+        date_start:
+            only keep lines dated on or after this YYYY-MM-DD date (optional)
+        date_end:
+            only keep lines dated on or before this YYYY-MM-DD date (optional)
+        keyword:
+            only keep lines containing this text, ignoring case (optional)
+        progress_callback:
+            called with (bytes read, total bytes) as the file is read (optional)
+        line_callback:
+            called with every matching line as text (optional)
+        cancel_event:
+            threading.Event that stops the analysis early when set (optional)
+        max_lines:
+            only the last this many matching lines are needed by line_callback (optional, None passes every line)
+        fields:
+            dict of event, button or port values structured lines must have (optional, text lines never match)
+        min_duration:
+            only keep structured lines with a duration of at least this many seconds (optional)
+    Returns:
+        dict with the number of matching lines in 'total' and per level
+    '''
+    def analyze(self, log_type=None, date_start=None, date_end=None, keyword=None, progress_callback=None, line_callback=None, cancel_event=None, max_lines=None, fields=None, min_duration=None):
+        level = (log_type or '').strip().upper() # requested level, if any
+        level = level if level in self.LEVELS else None # unknown levels do not filter, like LogAnalyzer.rs
+        start = date_start.strip().encode('ascii') if date_start and date_start.strip() else None # earliest date as bytes
+        end = date_end.strip().encode('ascii') if date_end and date_end.strip() else None # latest date as bytes
+        needle = keyword.encode('utf-8') if keyword else None # keyword as bytes, matched ignoring case
+        summary = {'total': 0, 'INFO': 0, 'WARN': 0, 'ERROR': 0, 'OTHER': 0} # counts of matching lines
+        fields = self.prepareFields(fields, min_duration) # structured field filters, if any
+        pattern = re.compile(re.escape(needle), re.IGNORECASE) if needle else None # keyword search for archived lines
+        archives = self.listSegments(start, end) # archives that can hold matching lines
+        archive_bytes = sum(os.path.getsize(path) for path in archives) # compressed size for the progress report
+        done = 0 # compressed bytes read so far
+        for path in archives: # oldest first so lines come out in order
+            if cancel_event is not None and cancel_event.is_set(): # asked to stop
+                return summary # return what was counted
+            self.scanArchive(path, pattern, level, start, end, fields, summary, line_callback, cancel_event) # stream the archive
+            done += os.path.getsize(path) # count it as read
+            if progress_callback: # someone wants to know
+                progress_callback(done, archive_bytes + os.path.getsize(self.log_file)) # report how far along the read is
+        if archives and progress_callback: # live log progress follows on from the archives
+            report = progress_callback # the caller's callback
+            progress_callback = lambda read, total: report(archive_bytes + read, archive_bytes + total) # add the archives to both
+        regions = None # read the whole log unless the index narrows it down
+        if Settings.LOG_INDEX: # index enabled
+            regions = self.planRegions(level, start, end, not needle and not line_callback and not fields, summary) # count or narrow down from the index
+        if needle: # keyword search
+            self.searchKeyword(needle, level, start, end, fields, regions, summary, progress_callback, line_callback, cancel_event, max_lines) # search in chunks
+            return summary # return the counts
+
+        for line in self.streamLines(progress_callback, cancel_event, regions): # every line that could match
+            line_level = self.filterLine(line, level, start, end, fields) # level of the line if it passes the filters
+            if line_level is None: # filtered out
+                continue # skip it
+            summary['total'] += 1 # one more matching line
+            summary[line_level] += 1 # count it for its level
+            if line_callback: # someone wants the lines
+                line_callback(line.decode('utf-8', errors='replace')) # pass the line on as text
+        return summary # return the counts
+
+    '''
+    Applies the level and date filters to a line.
+
+    Parameters:
+        line:
+            raw bytes of the line
+        level:
+            level to keep or None for all
+        start:
+            earliest date as bytes or None
+        end:
+            latest date as bytes or None
+        fields:
+            prepared field filters or None (see prepareFields)
+    Returns:
+        level of the line, or None if it is filtered out
+    '''
+    @staticmethod
+    def filterLine(line, level, start, end, fields=None):
+        line_level = LogAnalyzer.classifyLine(line) # level of this line
+        if level and line_level != level: # wrong level
+            return None # filtered out
+        if start or end: # a date filter was given
+            match = LogAnalyzer.DATE_PATTERN.search(line) # find the date on the line
+            if match is None: # lines without a date never match a date filter
+                return None # filtered out
+            date = match.group() # YYYY-MM-DD as bytes, compares in date order
+            if (start and date < start) or (end and date > end): # outside the range
+                return None # filtered out
+        if fields and not LogAnalyzer.matchFields(line, fields): # structured fields do not match
+            return None # filtered out
+        return line_level # line passes
+
+    '''
+    Turns field filters into (name, value, bytes the line must contain) so most lines are rejected without
+    parsing them.
+
+    Parameters:
+        fields:
+            dict of event, button or port values (optional)
+        min_duration:
+            smallest duration in seconds (optional)
+    Returns:
+        tuple of prepared filters, empty if there are none
+    '''
+    @staticmethod
+    def prepareFields(fields, min_duration=None):
+        prepared = [(name, value, json.dumps({name: value}, separators=(',', ':'))[1:-1].encode('utf-8')) for name, value in (fields or {}).items() if value not in (None, '')] # e.g. "event":"executed"
+        if min_duration is not None: # duration filter
+            prepared.append(('duration', float(min_duration), b'"duration":')) # line needs a duration at all
+        return tuple(prepared) # return the filters
+
+    '''
+    Checks the typed fields of a structured line.
+
+    Parameters:
+        line:
+            raw bytes of the line
+        fields:
+            prepared field filters (see prepareFields)
+    Returns:
+        True if every field matches
+    '''
+    @staticmethod
+    def matchFields(line, fields):
+        for _, _, needle in fields: # cheap check first
+            if needle not in line: # field or value missing
+                return False # no need to parse it
+        try: # handle errors with grace
+            record = json.loads(line) # parse the structured line
+        except ValueError: # text line or a broken one
+            return False # text lines have no fields
+        for name, value, _ in fields: # check each field exactly
+            if name == 'duration': # minimum, not an exact value
+                if not isinstance(record.get('duration'), (int, float)) or record['duration'] < value: # too quick or missing
+                    return False # filtered out
+            elif record.get(name) != value: # wrong value
+                return False # filtered out
+        return True # every field matches
+
+    '''
+    Searches one newline aligned chunk of the log for a keyword, runs in a worker process.
+
+    The regex runs over the memory mapped chunk as a whole and only the lines it hits are cut out and
+    filtered, so nothing is copied or lowered for lines without the keyword.
+
+    Parameters:
+        log_file:
+            path of the log
+        begin:
+            offset of the first line of the chunk
+        stop:
+            offset just past the last line of the chunk
+        needle:
+            keyword as bytes
+        level:
+            level to keep or None for all
+        start:
+            earliest date as bytes or None
+        end:
+            latest date as bytes or None
+        fields:
+            prepared field filters or None (see prepareFields)
+        max_lines:
+            most matching lines to return, the last ones are kept (None returns all)
+        line_callback:
+            called with each matching line instead of collecting them, when run in this process (optional)
+    Returns:
+        (counts dict, list of matching lines as text)
+    '''
+    @staticmethod
+    def searchChunk(log_file, begin, stop, needle, level, start, end, fields=None, max_lines=None, line_callback=None):
+        pattern = re.compile(re.escape(needle), re.IGNORECASE) # ASCII case folding, same as bytes.lower()
+        counts = {'total': 0, 'INFO': 0, 'WARN': 0, 'ERROR': 0, 'OTHER': 0} # counts for this chunk
+        lines = deque(maxlen=max_lines) # matching lines, only the last max_lines are kept
+        with open(log_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data: # map the log read only
+            position = begin # where to search from
+            while position < stop: # until the end of the chunk
+                match = pattern.search(data, position, stop) # next hit in the chunk
+                if match is None: # no more hits
+                    break # chunk done
+                line_start = data.rfind(b'\n', begin, match.start()) + 1 or begin # start of the line that was hit
+                line_end = data.find(b'\n', match.end(), stop) # end of that line
+                line_end = stop if line_end < 0 else line_end # last line of the chunk
+                position = line_end + 1 # carry on after the line, a line is counted once
+                line = data[line_start:line_end].rstrip(b'\r') # the line without its ending
+                line_level = LogAnalyzer.filterLine(line, level, start, end, fields) # level of the line if it passes the filters
+                if line_level is None: # filtered out
+                    continue # skip it
+                counts['total'] += 1 # one more matching line
+                counts[line_level] += 1 # count it for its level
+                text = line.decode('utf-8', errors='replace') # line as text
+                if line_callback: # running in this process
+                    line_callback(text) # pass the line on straight away
+                else: # running in a worker
+                    lines.append(text) # send it back with the counts
+        return counts, list(lines) # return this chunk's results
+
+    '''
+    Cuts the parts of the log to search into chunks that start and end on line boundaries.
+
+    Parameters:
+        self:
+            instance of object
+        regions:
+            list of (start offset, end offset or None), or None for the whole log
+    Returns:
+        list of (start offset, end offset) chunks in file order
+    '''
+    def splitChunks(self, regions):
+        size = os.path.getsize(self.log_file) # size of the log right now, later writes are left out
+        chunks = [] # chunks to search
+        with open(self.log_file, 'rb') as f: # used to find line ends
+            for begin, stop in (regions if regions is not None else [(0, None)]): # each stretch to search
+                stop = size if stop is None else min(stop, size) # open ended stretch runs to the end of the log
+                while begin < stop: # until the stretch is covered
+                    cut = min(begin + Settings.ANALYZER_CHUNK_BYTES, stop) # rough end of the chunk
+                    if cut < stop: # not the last chunk
+                        f.seek(cut) # jump to the rough end
+                        f.readline() # and on to the end of that line
+                        cut = min(f.tell(), stop) # chunk ends on a line boundary
+                    chunks.append((begin, cut)) # add the chunk
+                    begin = cut # next chunk starts here
+        return chunks # return the chunks
+
+    '''
+    Searches the log for a keyword, in worker processes when the log is big enough.
+
+    Parameters:
+        self:
+            instance of object
+        needle:
+            keyword as bytes
+        level:
+            level to keep or None for all
+        start:
+            earliest date as bytes or None
+        end:
+            latest date as bytes or None
+        fields:
+            prepared field filters or None (see prepareFields)
+        regions:
+            list of (start offset, end offset or None), or None for the whole log
+        summary:
+            counts to add the matching lines to
+        progress_callback:
+            called with (bytes searched, total bytes) (optional)
+        line_callback:
+            called with every matching line as text (optional)
+        cancel_event:
+            threading.Event that stops the search early when set (optional)
+        max_lines:
+            only the last this many matching lines are needed by line_callback (optional)
+    '''
+    def searchKeyword(self, needle, level, start, end, fields, regions, summary, progress_callback, line_callback, cancel_event, max_lines):
+        chunks = self.splitChunks(regions) # newline aligned chunks to search
+        total = sum(stop - begin for begin, stop in chunks) # bytes to search
+        done = 0 # bytes searched so far
+        workers = min(Settings.ANALYZER_WORKERS or os.cpu_count() or 1, len(chunks)) # no more workers than chunks
+        if total < Settings.ANALYZER_PARALLEL_MIN_BYTES or workers < 2: # not worth starting processes
+            for begin, stop in chunks: # search each chunk here
+                if cancel_event is not None and cancel_event.is_set(): # asked to stop
+                    break # stop searching
+                counts, _ = self.searchChunk(self.log_file, begin, stop, needle, level, start, end, fields, line_callback=line_callback) # lines go straight to the callback
+                self.mergeCounts(summary, counts) # add the chunk's counts
+                done += stop - begin # count the bytes searched
+                if progress_callback: # someone wants to know
+                    progress_callback(done, total) # report how far along the search is
+            return # all chunks searched
+
+        keep = max_lines if line_callback else 0 # lines each worker sends back
+        results = {} # chunk number -> lines, so lines are passed on in file order
+        with ProcessPoolExecutor(max_workers=workers) as pool: # one process per core
+            futures = {pool.submit(self.searchChunk, self.log_file, begin, stop, needle, level, start, end, fields, keep): number for number, (begin, stop) in enumerate(chunks)} # search every chunk
+            for future in as_completed(futures): # as each chunk finishes
+                if cancel_event is not None and cancel_event.is_set(): # asked to stop
+                    for pending in futures: # every chunk
+                        pending.cancel() # drop the ones not started yet
+                    break # stop collecting
+                counts, lines = future.result() # the chunk's results
+                self.mergeCounts(summary, counts) # add the chunk's counts
+                results[futures[future]] = lines # keep its lines for later
+                done += chunks[futures[future]][1] - chunks[futures[future]][0] # count the bytes searched
+                if progress_callback: # someone wants to know
+                    progress_callback(done, total) # report how far along the search is
+        if line_callback: # someone wants the lines
+            for number in sorted(results): # chunks in file order
+                for line in results[number]: # each matching line
+                    line_callback(line) # pass it on
+
+    '''
+    Adds the counts from one chunk to the summary.
+
+    Parameters:
+        summary:
+            counts to add to
+        counts:
+            counts of one chunk
+    '''
+    @staticmethod
+    def mergeCounts(summary, counts):
+        for name, count in counts.items(): # total and each level
+            summary[name] += count # add the chunk's count
+
+    '''
+    Formats a summary the same way LogAnalyzer.rs prints it.
+
+    Parameters:
+        summary:
+            dict returned by analyze
+    Returns:
+        summary text
+    '''
+    @staticmethod
+    def formatSummary(summary):
+        return "\n".join([
+            "----------Summary----------", # separates from other output
+            f"Filtered lines read: {summary['total']}", # filtered lines read in
+            f"INFO lines: {summary['INFO']}", # total info processed
+            f"WARN lines: {summary['WARN']}", # total warn processed
+            f"ERROR lines: {summary['ERROR']}", # total error processed
+        ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze MacroPad.log") # command line options, same as the Rust tool plus an end date
+    parser.add_argument("--type", dest="log_type", help="info, warn or error") # level filter
+    parser.add_argument("--date", dest="date_start", help="first date to include (YYYY-MM-DD)") # start date filter
+    parser.add_argument("--date-end", dest="date_end", help="last date to include (YYYY-MM-DD)") # end date filter
+    parser.add_argument("--keyword", help="text lines must contain, ignoring case") # keyword filter
+    parser.add_argument("--event", help="structured logs only: connect, received, executed or error") # event field filter
+    parser.add_argument("--button", help="structured logs only: button token, e.g. \"Button 1 pressed\"") # button field filter
+    parser.add_argument("--port", help="structured logs only: serial port") # port field filter
+    parser.add_argument("--min-duration", type=float, help="structured logs only: smallest duration in seconds") # duration filter
+    parser.add_argument("--log", dest="log_file", help="log file to read (default is the app log)") # log to read
+    parser.add_argument("--quiet", action="store_true", help="only print the summary") # skip printing lines
+    args = parser.parse_args() # read the options
+
+    analyzer = LogAnalyzer(args.log_file) # set variable analyzer to the LogAnalyzer
+    summary = analyzer.analyze(args.log_type, args.date_start, args.date_end, args.keyword, line_callback=None if args.quiet else print,
+        fields={'event': args.event, 'button': args.button, 'port': args.port}, min_duration=args.min_duration) # run the analysis
+    print() # separates from other output
+    print(LogAnalyzer.formatSummary(summary)) # print the counts
@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import tempfile
+from logic.Logger import Logger
+from logic.Settings import Settings
+
+'''
+Sidecar index of MacroPad.log kept in MacroPad.log.idx.
+
+The log is cut into blocks that never span more than one hour of log time, each block records its byte
+range, the hour of its dated lines and per level line counts. Blocks therefore also map every hour to its
+byte offset. The index is extended incrementally as the log grows and rebuilt if the log is replaced.
+'''
+class LogIndex:
+    VERSION = 1 # layout version of the index file
+    HOUR_PATTERN = re.compile(rb'(\d{4}-\d{2}-\d{2})[ T](\d{2})') # date and hour near the start of a line
+    LEVEL_SLOTS = {'INFO': 0, 'WARN': 1, 'ERROR': 2, 'OTHER': 3} # position of each level in the count lists
+    HEAD_BYTES = 256 # bytes from the start of the log used to notice it was replaced
+
+    '''
+    Default constructor for LogIndex.
+
+    Parameters:
+        self:
+            instance of object
+        log_file:
+            path of the log being indexed
+        classify_line:
+            function returning 'INFO', 'WARN', 'ERROR' or 'OTHER' for a raw line (LogAnalyzer.classifyLine)
+    '''
+    def __init__(self, log_file, classify_line):
+        self.log_file = log_file # log being indexed
+        self.classify_line = classify_line # decides which level count a line goes in
+        self.index_file = log_file + '.idx' # sidecar file next to the log
+        self.reset() # start empty
+
+    '''
+    Forgets everything indexed so far.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def reset(self):
+        self.indexed = 0 # byte offset up to which the log is indexed, always at the end of a line
+        self.head = b'' # first bytes of the log when it was indexed
+        self.blocks = [] # [start, end, hour or None, dated counts x4, undated counts x4] per block
+
+    '''
+    Loads the index file if there is a usable one.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def load(self):
+        self.reset() # fall back to an empty index
+        try: # handle errors with grace
+            with open(self.index_file, 'r') as f: # open the sidecar
+                data = json.load(f) # parse it
+            if data.get('version') == self.VERSION: # same layout as this code writes
+                self.indexed = data['indexed'] # where indexing stopped
+                self.head = bytes.fromhex(data['head']) # start of the log at the time
+                self.blocks = data['blocks'] # block list
+        except (OSError, ValueError, KeyError): # missing or unreadable index
+            self.reset() # rebuild from scratch
+
+    '''
+    Writes the index file atomically.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.index_file)) # folder of the sidecar
+        fd, temp_path = tempfile.mkstemp(prefix='.logindex-', suffix='.tmp', dir=directory) # temporary file next to it
+        try: # handle errors with grace
+            with os.fdopen(fd, 'w') as f: # open the temporary file for writing
+                json.dump({'version': self.VERSION, 'indexed': self.indexed, 'head': self.head.hex(), 'blocks': self.blocks}, f, separators=(',', ':')) # compact, it is only read by code
+            os.replace(temp_path, self.index_file) # swap it in
+        except OSError as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Failed to save log index {self.index_file}: {e}") # log the error with the error message
+            if os.path.exists(temp_path): # leftover temporary file
+                os.remove(temp_path) # clean it up
+
+    '''
+    Indexes whatever was added to the log since the last update.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        byte offset up to which the log is now indexed
+    '''
+    def update(self):
+        self.load() # start from the saved index
+        size = os.path.getsize(self.log_file) # current size of the log
+        with open(self.log_file, 'rb') as f: # binary so offsets are exact
+            head = f.read(min(self.HEAD_BYTES, size)) # start of the log
+            if size < self.indexed or not head.startswith(self.head) or len(self.head) > len(head): # log was rotated, truncated or replaced
+                self.reset() # index it again from the start
+            if size == self.indexed and head == self.head: # nothing new
+                return self.indexed # return early
+            self.head = head # remember the start of the log
+            f.seek(self.indexed) # continue where the last update stopped
+            self.indexLines(f) # index the new lines
+        self.save() # keep the work for next time
+        return self.indexed # return the new offset
+
+    '''
+    Adds lines from an open log to the blocks.
+
+    Parameters:
+        self:
+            instance of object
+        f:
+            log opened in binary mode and positioned at self.indexed
+    '''
+    def indexLines(self, f):
+        position = self.indexed # offset of the next line
+        block = self.blocks[-1] if self.blocks and self.blocks[-1][1] == position else None # last block can keep growing
+        for line in f: # one line at a time
+            if not line.endswith(b'\n'): # line still being written
+                break # index it next time
+            match = self.HOUR_PATTERN.search(line, 0, 64) # date and hour near the start of the line
+            hour = (match.group(1) + b' ' + match.group(2)).decode('ascii') if match else None # e.g. "2025-04-20 17"
+            if block is None or (hour is not None and hour != block[2]) or block[1] - block[0] >= Settings.LOG_INDEX_BLOCK_BYTES: # new hour or block is full
+                block = [position, position, hour if hour is not None else (block[2] if block else None)] + [0] * 8 # undated lines inherit the hour before them
+                self.blocks.append(block) # add the block
+            slot = self.LEVEL_SLOTS[self.classify_line(line)] # which count to increase
+            block[3 + slot + (0 if hour is not None else 4)] += 1 # dated and undated lines are counted apart
+            position += len(line) # move past the line
+            block[1] = position # block now ends after it
+        self.indexed = position # everything before here is indexed
+
+    '''
+    Gets the offset of the first line logged in an hour.
+
+    Parameters:
+        self:
+            instance of object
+        hour:
+            "YYYY-MM-DD HH"
+    Returns:
+        byte offset, or None if nothing was logged in that hour
+    '''
+    def findHour(self, hour):
+        return next((block[0] for block in self.blocks if block[2] == hour), None) # first block of that hour
@@ -1,12 +1,22 @@
+import gzip
+import json
 import logging
-import sys
+import logging.handlers
 import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from logic.Settings import Settings
 
 '''
 Class logger that wraps the built in logger inside of it
 '''
 class Logger:
     logger = None # placeholder for variable _logger
+    async_handler = None # background writer when asynchronous logging is enabled
 
     '''
     Handles the initialization of logger
@@ -19,10 +29,13 @@ class Logger:
             Logger.logger.propagate = False
 
         if not Logger.logger.handlers: # check if handlers are attached, if not add them
-            log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resources', 'MacroPad.log') # get the log path (from MacroPad to resoruces) to update log file
-            file_handler = logging.FileHandler(log_path) # pass the log path (resource folder) to append the already existing log file
+            log_path = Settings.getLogFile() # get the log path (from MacroPad to resoruces) to update log file
+            file_handler = BatchFileHandler(log_path) # pass the log path (resource folder) to append the already existing log file
             file_handler.setLevel(logging.DEBUG) # log everything from debug
-            file_format = logging.Formatter('%(levelname)s (%(asctime)s): %(message)s', datefmt='%Y-%m-%d %H:%M:%S') # define format for logs
+            if Settings.LOG_FORMAT == 'json': # structured records, one JSON object per line
+                file_format = JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S') # typed fields alongside the message
+            else: # plain text lines
+                file_format = logging.Formatter('%(levelname)s (%(asctime)s): %(message)s', datefmt='%Y-%m-%d %H:%M:%S') # define format for logs
             file_handler.setFormatter(file_format) # attach defined format to file writer
 
             console_handler = logging.StreamHandler(sys.stdout) # writes logs to standard output
@@ -30,10 +43,13 @@ class Logger:
             console_format = ColorFormatter() # allow for custom colors in console
             console_handler.setFormatter(console_format) # attach color formatter to console
 
-            Logger.logger.addHandler(file_handler) # add file handler to the logger
-            Logger.logger.addHandler(console_handler) # add console handler to logger
-
-            print("Logger handler count:", len(Logger.logger.handlers))
+            handlers = [file_handler, console_handler] if Settings.LOG_CONSOLE else [file_handler] # console output is optional
+            if Settings.LOG_ASYNC: # if logging should happen off the calling thread
+                Logger.async_handler = AsyncLogHandler(handlers) # background writer that owns the handlers
+                Logger.logger.addHandler(Logger.async_handler) # callers only ever enqueue records
+            else: # otherwise write on the calling thread
+                for handler in handlers: # file and maybe console
+                    Logger.logger.addHandler(handler) # add it to the logger
 
     '''
     Handles the information types of logger
@@ -41,11 +57,14 @@ class Logger:
     Parameters:
         message:
             message associated with the log
+        fields:
+            typed fields for the structured format: event, button, port, duration (optional)
     '''
     @staticmethod # static method
-    def info(message):
-        Logger.initialize() # call initialize
-        Logger.logger.info(message) # log message at info level
+    def info(message, **fields):
+        if Logger.logger is None: # only set the logger up on first use
+            Logger.initialize() # call initialize
+        Logger.logger.info(message, extra={'fields': fields}) # log message at info level
 
     '''
     Handles the warning types of logger
@@ -53,11 +72,14 @@ class Logger:
     Parameters:
         message:
             message associated with the log
+        fields:
+            typed fields for the structured format: event, button, port, duration (optional)
     '''
     @staticmethod # static method
-    def warning(message):
-        Logger.initialize() # call initialize
-        Logger.logger.warning(message) # log message at warning level
+    def warning(message, **fields):
+        if Logger.logger is None: # only set the logger up on first use
+            Logger.initialize() # call initialize
+        Logger.logger.warning(message, extra={'fields': fields}) # log message at warning level
 
     '''
     Handles the error types of logger
@@ -65,11 +87,15 @@ class Logger:
     Parameters:
         message:
             message associated with the log
+        fields:
+            typed fields for the structured format: event, button, port, duration (optional)
     '''
     @staticmethod # static method
-    def error(message):
-        Logger.initialize() # call initialize
-        Logger.logger.error(message) # log message at error level
+    def error(message, **fields):
+        if Logger.logger is None: # only set the logger up on first use
+            Logger.initialize() # call initialize
+        fields.setdefault('event', 'error') # errors are always an error event
+        Logger.logger.error(message, extra={'fields': fields}) # log message at error level
 
     '''
     Handles the debug types of logger
@@ -77,11 +103,363 @@ class Logger:
     Parameters:
         message:
             message associated with the log
+        fields:
+            typed fields for the structured format: event, button, port, duration (optional)
+    '''
+    @staticmethod # static method
+    def debug(message, **fields):
+        if Logger.logger is None: # only set the logger up on first use
+            Logger.initialize() # call initialize
+        Logger.logger.debug(message, extra={'fields': fields}) # log message at debug level
+
+    '''
+    Writes out everything still queued and stops the background writer.
     '''
     @staticmethod # static method
-    def debug(message):
-        Logger.initialize() # call initialize
-        Logger.logger.debug(message) # log message at debug level
+    def shutdown():
+        if Logger.async_handler is not None: # only needed when the background writer is running
+            Logger.async_handler.close() # drain the queue and join the writer thread
+
+
+'''
+File handler that leaves flushing to the caller so a batch of records costs a single flush to disk.
+
+It also rotates the log once it passes Settings.LOG_MAX_BYTES or covers more than Settings.LOG_ROTATE_INTERVAL
+seconds. The old log is gzipped to MacroPad.log.<YYYYmmdd-HHMMSS>.gz, stamped with the time it was rotated, and
+only the newest Settings.LOG_BACKUP_COUNT archives are kept so disk use stays bounded.
+'''
+class BatchFileHandler(logging.handlers.BaseRotatingHandler):
+    DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}') # timestamp near the start of a log line
+
+    '''
+    Default constructor for BatchFileHandler.
+
+    Parameters:
+        self:
+            instance of object
+        filename:
+            path of the live log
+    '''
+    def __init__(self, filename):
+        self.segment_bytes = 0 # size of the live log, kept here since asking the stream would flush it
+        super().__init__(filename, 'a') # open the live log for appending
+        self.segment_start = self.readSegmentStart() # when the first line of the live log was written
+        self.retry_at = 0 # do not try to rotate again before this time after a failed rotation
+
+    '''
+    Opens the live log and notes its size.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        open stream
+    '''
+    def _open(self):
+        stream = super()._open() # open the file like FileHandler does
+        self.segment_bytes = os.path.getsize(self.baseFilename) # size it already has
+        return stream # return the stream
+
+    '''
+    Works out when the live log was started from the date on its first line.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        time in seconds since the epoch, now if the log is empty or has no date on its first line
+    '''
+    def readSegmentStart(self):
+        try: # handle errors with grace
+            with open(self.baseFilename, 'r', errors='replace') as f: # open the live log for reading
+                match = self.DATE_PATTERN.search(f.readline()) # date on the first line
+            if match: # first line has a date
+                return time.mktime(time.strptime(match.group(), '%Y-%m-%d %H:%M:%S')) # return it as a timestamp
+        except (OSError, ValueError): # unreadable log or odd date
+            pass # fall back to now
+        return time.time() # treat the log as started now
+
+    '''
+    Decides if the log has to be rotated before a record is written.
+
+    Parameters:
+        self:
+            instance of object
+        record:
+            LogRecord object to be passed
+    Returns:
+        True if the log should be rotated first
+    '''
+    def shouldRollover(self, record):
+        if record.created < self.retry_at or self.segment_bytes == 0: # waiting after a failure, or nothing to rotate
+            return False # keep writing
+        if Settings.LOG_MAX_BYTES and self.segment_bytes >= Settings.LOG_MAX_BYTES: # log is too big
+            return True # rotate it
+        return bool(Settings.LOG_ROTATE_INTERVAL) and record.created >= self.segment_start + Settings.LOG_ROTATE_INTERVAL # log is too old
+
+    '''
+    Writes a record, rotating the log first if it is due.
+
+    Parameters:
+        self:
+            instance of object
+        record:
+            LogRecord object to be passed
+    '''
+    def emit(self, record):
+        try: # handle errors with grace
+            if self.stream is None: # stream was closed
+                self.stream = self._open() # reopen it
+            if self.shouldRollover(record): # log is too big or too old
+                self.doRollover() # rotate it
+            message = self.format(record) + self.terminator # line to write
+            self.stream.write(message) # buffered, flushBatch writes it out
+            self.segment_bytes += len(message.encode(self.stream.encoding or 'utf-8', errors='replace')) + message.count('\n') * (len(os.linesep) - 1) # bytes on disk, with the newlines text mode writes, without asking the stream
+        except Exception: # gracefully handle errors so program doesnt crash
+            self.handleError(record) # report it the way logging does
+
+    '''
+    Compresses the live log into a new archive and starts a fresh one.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def doRollover(self):
+        self.stream.close() # finish writing the old log
+        self.stream = None # closed
+        stamp = time.strftime('%Y%m%d-%H%M%S') # every line in the archive was written before now
+        archive = f"{self.baseFilename}.{stamp}.gz" # name of the new archive
+        number = 0 # tells apart archives made in the same second
+        while os.path.exists(archive): # name already taken
+            number += 1 # try the next number
+            archive = f"{self.baseFilename}.{stamp}.{number}.gz" # with a number
+        try: # handle errors with grace
+            self.rotate(self.baseFilename, archive) # compress the old log
+        except OSError as e: # gracefully handle errors so program doesnt crash, e.g. the log is open elsewhere on Windows
+            if os.path.exists(archive): # half written archive
+                os.remove(archive) # the live log still has everything
+            self.retry_at = time.time() + 60 # keep writing to the old log for now
+            sys.stderr.write(f"Failed to rotate {self.baseFilename}: {e}\n") # the log itself cannot be used here
+        else: # rotated
+            self.segment_start = time.time() # new log starts now
+            for _, path in self.listArchives(self.baseFilename)[:-Settings.LOG_BACKUP_COUNT or None]: # archives past the limit, oldest first
+                os.remove(path) # remove them
+        self.stream = self._open() # open the fresh (or old) log
+
+    '''
+    Gzips the old log into the archive and removes it.
+
+    Parameters:
+        self:
+            instance of object
+        source:
+            path of the live log
+        dest:
+            path of the archive
+    '''
+    def rotate(self, source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst: # read the log and write the archive
+            shutil.copyfileobj(src, dst) # compress it in pieces
+        stat = os.stat(source) # times of the old log
+        os.utime(dest, (stat.st_atime, stat.st_mtime)) # archive keeps the time of its last line
+        os.remove(source) # the next write starts a fresh log
+
+    '''
+    Finds the compressed archives of a log.
+
+    Parameters:
+        log_file:
+            path of the live log
+    Returns:
+        list of (YYYYmmdd-HHMMSS rotation time, path) oldest first
+    '''
+    @staticmethod
+    def listArchives(log_file):
+        directory, name = os.path.split(os.path.abspath(log_file)) # archives sit next to the log
+        pattern = re.compile(re.escape(name) + r'\.(\d{8}-\d{6})(?:\.(\d+))?\.gz$') # MacroPad.log.<stamp>[.<n>].gz
+        archives = [] # (stamp, number, path)
+        for entry in os.listdir(directory): # every file next to the log
+            match = pattern.match(entry) # is it an archive of this log
+            if match: # it is
+                archives.append((match.group(1), int(match.group(2) or 0), os.path.join(directory, entry))) # note when it was rotated
+        return [(stamp, path) for stamp, _, path in sorted(archives)] # oldest first
+
+    '''
+    Skips the flush the base class does after every record.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def flush(self):
+        pass # flushBatch does the real flush
+
+    '''
+    Flushes every record written since the last flush.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def flushBatch(self):
+        super().flush() # push buffered records to the file
+
+
+'''
+Handler that only enqueues records, a background thread writes them to the real handlers in batches
+'''
+class AsyncLogHandler(logging.Handler):
+
+    '''
+    Default constructor for AsyncLogHandler.
+
+    Parameters:
+        self:
+            instance of object
+        handlers:
+            handlers the background thread writes records to
+    '''
+    def __init__(self, handlers):
+        super().__init__() # set up the base handler
+        self.handlers = handlers # handlers that do the real writing
+        self.queue = queue.Queue(maxsize=Settings.LOG_QUEUE_SIZE) # bounded queue so memory use stays capped
+        self.dropped = 0 # records thrown away because the queue was full
+        self.stop_event = threading.Event() # tells the writer to finish up
+        self.writer_thread = threading.Thread(target=self.writerLoop, name="LogWriter", daemon=True) # thread that does all disk I/O
+        self.writer_thread.start() # start writing in the background
+
+    '''
+    Queues a record without touching the disk.
+
+    Parameters:
+        self:
+            instance of object
+        record:
+            LogRecord object to be passed
+    '''
+    def emit(self, record):
+        try: # handle errors with grace
+            self.queue.put_nowait(record) # hand the record to the writer
+        except queue.Full: # writer has fallen behind
+            if Settings.LOG_DROP_POLICY == 'block': # backpressure, wait for room in the queue
+                self.queue.put(record) # block until the writer catches up
+            else: # otherwise keep the caller fast and lose the record
+                self.dropped += 1 # count it so the loss shows up in the log
+
+    '''
+    Writes queued records and flushes once enough records or time have built up.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def writerLoop(self):
+        pending = 0 # records written but not flushed yet
+        first_pending = 0 # when the oldest unflushed record was written
+        while not self.stop_event.is_set() or not self.queue.empty(): # keep going until stopped and drained
+            timeout = Settings.LOG_FLUSH_INTERVAL # wait as long as the flush interval when nothing is pending
+            if pending: # if there are unflushed records
+                timeout = max(0, first_pending + Settings.LOG_FLUSH_INTERVAL - time.monotonic()) # only wait until they are due
+            try: # handle errors with grace
+                record = self.queue.get(timeout=timeout) # wait for the next record
+                self.writeRecord(record) # hand it to the real handlers
+                if not pending: # first record of a new batch
+                    first_pending = time.monotonic() # start the flush timer
+                pending += 1 # one more record waiting for a flush
+            except queue.Empty: # nothing arrived in time
+                pass # fall through to the flush check
+            if pending and (pending >= Settings.LOG_BATCH_SIZE or time.monotonic() - first_pending >= Settings.LOG_FLUSH_INTERVAL): # batch is full or due
+                self.reportDropped() # note any lost records in the same batch
+                self.flushHandlers() # one flush for the whole batch
+                pending = 0 # batch has been written
+        self.reportDropped() # note any records lost right before stopping
+        self.flushHandlers() # make sure nothing is left in the buffers
+
+    '''
+    Passes a record to every handler whose level allows it.
+
+    Parameters:
+        self:
+            instance of object
+        record:
+            LogRecord object to be passed
+    '''
+    def writeRecord(self, record):
+        for handler in self.handlers: # go through each real handler
+            if record.levelno >= handler.level: # respect the handler level like the logger would
+                handler.handle(record) # format and write the record
+
+    '''
+    Flushes every handler.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def flushHandlers(self):
+        for handler in self.handlers: # go through each real handler
+            try: # handle errors with grace
+                getattr(handler, 'flushBatch', handler.flush)() # batch handlers flush through flushBatch
+            except (OSError, ValueError): # stream was closed or the disk failed, keep the writer alive
+                pass # the next batch will try again
+
+    '''
+    Writes a warning with the number of records lost to a full queue.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def reportDropped(self):
+        if self.dropped: # only when records were lost
+            dropped, self.dropped = self.dropped, 0 # take the count and reset it
+            self.writeRecord(logging.makeLogRecord({'name': "MacroPadLogger", 'levelno': logging.WARNING, 'levelname': 'WARNING', 'msg': f"Dropped {dropped} log records because the log queue was full"})) # log the loss
+
+    '''
+    Stops the writer after it has drained the queue, then closes the real handlers.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def close(self):
+        self.stop_event.set() # ask the writer to finish
+        if self.writer_thread.is_alive() and threading.current_thread() is not self.writer_thread: # never join from the writer itself
+            self.writer_thread.join(timeout=5) # wait for the queue to drain
+        for handler in self.handlers: # go through each real handler
+            handler.close() # release files and streams
+        super().close() # finish closing this handler
+
+
+'''
+Formats a record as one line of JSON for Settings.LOG_FORMAT = 'json'.
+
+Keys are always in the same order, starting with the level and the time, so a line can still be classified
+by its prefix and dated by the text time without parsing it. The epoch time is in "ts".
+'''
+class JsonFormatter(logging.Formatter):
+    FIELDS = ('event', 'button', 'port', 'duration') # typed fields, in the order they are written
+
+    '''
+    Handles turning a record into a JSON line
+
+    Parameters:
+        self:
+            instance of object
+        record:
+            LogRecord object to be passed
+    '''
+    def format(self, record):
+        data = {'level': record.levelname, 'time': self.formatTime(record, self.datefmt), 'ts': round(record.created, 6)} # fixed leading keys
+        fields = getattr(record, 'fields', None) or {} # fields passed to Logger.info and friends
+        for name in self.FIELDS: # known fields first, in a fixed order
+            if fields.get(name) is not None: # only fields that were given
+                data[name] = fields[name] # add it
+        data['msg'] = record.getMessage() # the message text
+        if record.exc_info: # exception attached
+            data['exc'] = self.formatException(record.exc_info) # add the traceback
+        return json.dumps(data, separators=(',', ':'), default=str) # compact single line
 
 
 class ColorFormatter(logging.Formatter):
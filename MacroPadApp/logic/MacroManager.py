@@ -1,48 +1,196 @@
 # macro_manager.py
+import atexit
 import json
 import os
+import tempfile
+import threading
+import weakref
+from logic.BindingEngine import BindingTable
 from logic.Settings import Settings
 from logic.Logger import Logger
 
 '''
 Manages what each macro button should do.
+
+An action is either an external command or a typed action such as "type:hello" that runs inside the app (see ActionRegistry).
 '''
 class MacroManager:
+    instances = weakref.WeakSet() # every live manager, flushed once at exit without being kept alive
+
     '''
     Default constructor.
 
     Parameters:
         self:
             instance of object
+        config_file:
+            path of the macro config to use (default is the one from Settings)
     '''
-    def __init__(self):
-        self.config_file = Settings.getConfigFile() # get the config file from settings (hard coded location)
+    def __init__(self, config_file=None):
+        self.config_file = config_file or Settings.getConfigFile() # get the config file from settings (hard coded location)
+        self.save_lock = threading.Lock() # guards the pending save timer
+        self.save_timer = None # pending debounced save, if any
+        self.bindings_file = os.path.join(os.path.dirname(self.config_file), Settings.BINDINGS_FILE) # chords, sequences and layers next to the macros
+        self.compile_lock = threading.Lock() # one recompile of the bindings at a time
+        self.saved_stamp = None # (mtime, size) of the config after our last save, so reloadActions can skip our own writes
         self.button_actions = self.loadActions() # get all the button actions
+        self.action_index = {} # reverse lookup from the token the device sends to its (button name, action)
+        self.bindings = None # compiled BindingTable, replaced whole on every recompile
+        self.buildIndex() # fill the reverse lookup and compile the bindings from the loaded actions
+        MacroManager.instances.add(self) # never lose an edit still waiting on the debounce at exit, see flushAll
 
     '''
     Loads the macro actions.
 
+    Saves are atomic so the file is never half written, but if it still fails to parse (edited by hand, disk
+    trouble) it is moved aside as .corrupt and the defaults are used so the next save does not overwrite it.
+
     Parameters:
         self:
             instance of object
     '''
     def loadActions(self):
         if os.path.exists(self.config_file): # check if the config to file actually exists
-            with open(self.config_file, 'r') as f: # open file for reading and parse json file
-                return json.load(f) # return results
-        else: # if the file doesn't exist
-            return {f'Button {i} pressed': '' for i in range(1, 10)} # return fresh dictionary with keys with each action starting at empty
+            try: # handle errors with grace
+                with open(self.config_file, 'r') as f: # open file for reading and parse json file
+                    return json.load(f) # return results
+            except (ValueError, OSError) as e: # gracefully handle errors so program doesnt crash
+                Logger.error(f"Could not read {self.config_file}, starting with empty macros: {e}") # log the error with the error message
+                try: # handle errors with grace
+                    os.replace(self.config_file, self.config_file + '.corrupt') # keep the bad file for the user to recover
+                except OSError: # gracefully handle errors so program doesnt crash
+                    pass # nothing more can be done
+        return {f'Button {i} pressed': '' for i in range(1, 10)} # return fresh dictionary with keys with each action starting at empty
+
+    '''
+    Reads the config file after it was changed outside the app.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        button name -> action from the file, or None if it is the file the app last saved or cannot be read
+    '''
+    def readChangedActions(self):
+        try: # handle errors with grace
+            info = os.stat(self.config_file) # details of the file on disk
+            if (info.st_mtime_ns, info.st_size) == self.saved_stamp: # our own save, newer edits may not be in it yet
+                return None # nothing new
+            with open(self.config_file, 'r') as f: # open file for reading
+                loaded = json.load(f) # parse the new actions
+            if not isinstance(loaded, dict): # not a button -> action mapping
+                raise ValueError("expected a JSON object") # report it
+            return loaded # return the actions
+        except (ValueError, OSError) as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Could not reload {self.config_file}, keeping the current macros: {e}") # log the error with the error message
+            return None # keep what is in use
 
     '''
-    Saves whatever's in button_actions back to the file.
+    Reloads the actions after the config file was changed outside the app.
+
+    The new actions are compared with the current ones and swapped in whole, so a listener never sees half
+    of them. If the file cannot be read (missing, or caught half written) the current actions are kept.
+
+    Parameters:
+        self:
+            instance of object
+        recompile:
+            compile the bindings even if no action changed, e.g. because the bindings file changed
+    Returns:
+        button name -> new action for every button whose action changed
+    '''
+    def reloadActions(self, recompile=False):
+        loaded = self.readChangedActions() # None when there is nothing to take
+        current = self.button_actions # actions in use
+        changed = {} # button name -> new action
+        if loaded is not None: # a real outside edit
+            changed = {name: action for name, action in loaded.items() if current.get(name, '') != action} # new or edited buttons
+            changed.update({name: '' for name in current if name not in loaded and current[name]}) # buttons that were removed
+        if changed: # something to swap in
+            index = {name: (name, action) for name, action in loaded.items() if action} # reverse lookup of the new actions
+            self.button_actions = dict(loaded) # swap the new actions in
+            self.action_index = index # and their lookup
+            Logger.info(f"Reloaded {self.config_file}, changed: {', '.join(sorted(changed))}") # log what changed
+        if changed or recompile: # the compiled bindings are out of date
+            self.compileBindings() # swap in a new table, listeners pick it up on their next event
+        return changed # return the changed buttons
+
+    '''
+    Schedules a save of button_actions.
+
+    Edits that arrive within Settings.SAVE_DEBOUNCE of each other are written together in one save, on a
+    timer thread so the caller never waits on the disk.
 
     Parameters:
         self:
             instance of object
     '''
     def saveActions(self):
-        with open(self.config_file, 'w') as f: # open config file for writing
-            json.dump(self.button_actions, f, indent=4) # serialize button_actions into it
+        with self.save_lock: # only one timer at a time
+            if self.save_timer: # a save is already waiting
+                self.save_timer.cancel() # push it back so the burst is written once
+            self.save_timer = threading.Timer(Settings.SAVE_DEBOUNCE, self.flushActions) # save once the edits settle
+            self.save_timer.daemon = True # do not hold the app open, flushPending covers exit
+            self.save_timer.start() # start the countdown
+
+    '''
+    Writes a pending save straight away, used on quit.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def flushPending(self):
+        with self.save_lock: # only one timer at a time
+            if self.save_timer is None: # nothing waiting to be saved
+                return # return early
+            self.save_timer.cancel() # stop the countdown
+            self.save_timer = None # no save pending any more
+        self.flushActions() # write now instead
+
+    '''
+    Writes the pending save of every live manager, registered once with atexit.
+    '''
+    @staticmethod
+    def flushAll():
+        for manager in list(MacroManager.instances): # copy, the set changes as managers are collected
+            manager.flushPending() # write its pending save
+
+    '''
+    Writes button_actions to the config file atomically.
+
+    The actions go to a temporary file in the same folder which is synced to disk and then renamed over the
+    config, so a crash leaves either the old or the new file and never a truncated one.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def flushActions(self):
+        with self.save_lock: # only one timer at a time
+            if threading.current_thread() is self.save_timer: # called by the pending timer itself
+                self.save_timer = None # so the save is no longer pending
+        snapshot = dict(self.button_actions) # copy so edits during the write do not affect it
+        directory = os.path.dirname(os.path.abspath(self.config_file)) # folder of the config file
+        fd, temp_path = tempfile.mkstemp(prefix='.macros-', suffix='.tmp', dir=directory) # temporary file next to the config
+        try: # handle errors with grace
+            with os.fdopen(fd, 'w') as f: # open the temporary file for writing
+                json.dump(snapshot, f, indent=4) # serialize button_actions into it
+                f.flush() # push python's buffer to the OS
+                os.fsync(f.fileno()) # and the OS buffer to the disk
+            os.replace(temp_path, self.config_file) # swap the new file in atomically
+            info = os.stat(self.config_file) # details of what was just written
+            self.saved_stamp = (info.st_mtime_ns, info.st_size) # the config watcher will see this write, it is not an outside edit
+            if hasattr(os, 'O_DIRECTORY'): # directories can only be synced on POSIX
+                dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY) # open the folder
+                try: # handle errors with grace
+                    os.fsync(dir_fd) # make the rename itself durable
+                finally: # always
+                    os.close(dir_fd) # release the folder
+        except OSError as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Failed to save macros to {self.config_file}: {e}") # log the error with the error message
+            if os.path.exists(temp_path): # leftover temporary file
+                os.remove(temp_path) # clean it up
 
     '''
     Method to fetch the actions assigned to a specific button
@@ -69,7 +217,9 @@ class MacroManager:
     '''
     def setActions(self, button_name, action):
         self.button_actions[button_name] = action # modifies action of button in memory
-        self.saveActions() # immediately save everything to the file
+        self.updateIndex(button_name, action) # keep the reverse lookup in step with the change
+        self.compileInBackground() # recompile the bindings without holding up the caller
+        self.saveActions() # save everything to the file once the edits settle
         Logger.info(f"Updated {button_name} to {self.button_actions[button_name]}") # log the update of the button and what its new action is
 
     '''
@@ -80,4 +230,81 @@ class MacroManager:
             instance of object
     '''
     def getAllActions(self):
-        return self.button_actions # return all actions of each button
\ No newline at end of file
+        return self.button_actions # return all actions of each button
+
+    '''
+    Rebuilds the reverse lookup and the compiled bindings from every button action.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def buildIndex(self):
+        self.action_index = {} # start from an empty lookup
+        for button_name, action in self.button_actions.items(): # go through every button and its action
+            self.updateIndex(button_name, action) # add the button to the lookup
+        self.compileBindings() # compile the bindings from the same actions
+
+    '''
+    Compiles the button actions and the bindings file into a new table and swaps it in.
+
+    Listeners keep using the old table until the new one is assigned, and pick it up on their next event.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def compileBindings(self):
+        with self.compile_lock: # the last recompile to run sees the latest actions
+            actions = dict(self.button_actions) # copy so edits during the compile do not affect it
+            try: # handle errors with grace
+                table = BindingTable(actions, BindingTable.loadConfig(self.bindings_file)) # built aside, so events never see half a table
+            except Exception as e: # gracefully handle errors so program doesnt crash
+                Logger.error(f"Could not compile {self.bindings_file}, using button taps only: {e}") # log error
+                table = BindingTable(actions) # the macros on their own
+            self.bindings = table # swap it in with a single assignment
+        Logger.debug(f"Compiled bindings of {self.config_file} into {table.size()} states") # log the size of the table
+
+    '''
+    Compiles the bindings on a background thread.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def compileInBackground(self):
+        threading.Thread(target=self.compileBindings, name="BindingCompiler", daemon=True).start() # compile off the caller's thread
+
+    '''
+    Updates the reverse lookup entry of a single button.
+
+    Parameters:
+        self:
+            instance of object
+        button_name:
+            unique identifier for the button (also the token the device sends when it is pressed)
+        action:
+            macro assigned to the button
+    '''
+    def updateIndex(self, button_name, action):
+        if action: # only buttons with an action can be matched
+            self.action_index[button_name] = (button_name, action) # map the token to its button and action
+        else: # if the action was cleared
+            self.action_index.pop(button_name, None) # remove the token so it reports as unmapped
+
+    '''
+    Finds the button and action mapped to a token received from the device.
+
+    Parameters:
+        self:
+            instance of object
+        token:
+            line received from the device
+    Returns:
+        (button name, action) tuple or None if nothing is mapped
+    '''
+    def lookupAction(self, token):
+        return self.action_index.get(token) # single dictionary lookup no matter how many buttons are mapped
+
+
+atexit.register(MacroManager.flushAll) # one exit hook for every manager
@@ -0,0 +1,153 @@
+from logic.StartupProfile import StartupProfile
+import argparse
+import signal
+import threading
+from logic.ActionExecutor import ActionExecutor
+from logic.ConnectionManager import ConnectionManager
+from logic.DeviceManager import DeviceManager
+from logic.LatencyStats import LatencyStats
+from logic.Logger import Logger
+from logic.MacroManager import MacroManager
+from logic.SerialManager import SerialManager
+from logic.Settings import Settings
+
+'''
+Headless MacroPad: connects to the pad and runs its macros with no window, tray icon or Tk at all.
+
+Only the logic layer is imported so it starts quickly and stays small on machines without a display. Macros
+are edited with the GUI or directly in macros.json.
+'''
+class MacroPadService:
+
+    '''
+    Default constructor for MacroPadService.
+
+    Parameters:
+        self:
+            instance of object
+        config_file:
+            macro config to use (default is the one from Settings)
+    '''
+    def __init__(self, config_file=None):
+        self.status = None # last connection status, for anyone asking
+        self.stop_event = threading.Event() # set when the service should stop
+        self.serial_manager = SerialManager() # initialize the serial manager
+        self.macro_manager = MacroManager(config_file) # initialize the macro manager
+        self.action_executor = ActionExecutor() # initialize the action executor that runs macro commands
+        self.connection_manager = (DeviceManager if Settings.MULTI_DEVICE else ConnectionManager)(self.serial_manager, self.macro_manager, self.updateStatus, self.toggleButtons, self.runAction) # initialize ConnectionManager
+
+    '''
+    Keeps the connection status, logging it when it changes.
+
+    Parameters:
+        self:
+            instance of object
+        message:
+            status of device connection
+    '''
+    def updateStatus(self, message):
+        if message != self.status: # only changes are worth a log line
+            self.status = message # remember it
+            Logger.info(f"Status: {message}") # log the new status
+
+    '''
+    Nothing to enable or disable without a window.
+
+    Parameters:
+        self:
+            instance of object
+        toggled:
+            True/False of whether buttons can be edited or not
+    '''
+    def toggleButtons(self, toggled):
+        pass # no buttons
+
+    '''
+    Run the passed system command
+
+    Parameters:
+        self:
+            instance of object
+        command:
+            the system command to be run
+        arrival:
+            time.perf_counter_ns when the key press arrived, for the latency stats (optional)
+        on_exit:
+            called once the command has finished (optional)
+    Returns:
+        future of the command, None if it was not started
+    '''
+    def runAction(self, command, arrival=None, on_exit=None):
+        try: # handle errors with grace
+            future = self.action_executor.submit(command, arrival=arrival, on_exit=on_exit) # hand the command to the executor so it starts off this thread
+            Logger.info(f"Running command: {command}") # log the action
+            return future # return the future
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Failed to run command {command}: {e}") # log error if the command fails
+
+    '''
+    Runs until stop is called or the process is asked to exit.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def run(self):
+        Logger.info("MacroPad service started.") # log the start
+        self.installSignalHandlers() # stop cleanly on Ctrl+C or a service stop
+        StartupProfile.finish("service") # report the start if profiling
+        try: # handle errors with grace
+            self.connection_manager.connectionManager() # connect, listen and reconnect until stopped
+        finally: # whatever ended the loop
+            self.shutdown() # release everything
+
+    '''
+    Asks the service to stop, safe to call from a signal handler or another thread.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def stop(self):
+        self.stop_event.set() # remember that a stop was asked for
+        self.connection_manager.stop() # ends the connection loop and the listener
+
+    '''
+    Releases the port, saves pending edits and drains the log.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def shutdown(self):
+        Logger.info("MacroPad service stopping.") # log the stop
+        self.macro_manager.flushPending() # write any macro edits still waiting to be saved
+        if self.serial_manager.isConnected(): # checks to see if there is a serial connection
+            self.serial_manager.close() # close the serial connection if so
+        self.action_executor.shutdown() # stop the workers, running commands are left alone
+        Logger.shutdown() # write out everything still queued
+
+    '''
+    Stops on SIGINT/SIGTERM and dumps the latency stats on SIGUSR1 where the platform has it.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def installSignalHandlers(self):
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'): # stop signals, SIGBREAK is Ctrl+Break on Windows
+            if hasattr(signal, name): # not every platform has every signal
+                signal.signal(getattr(signal, name), lambda signum, frame: self.stop()) # stop cleanly
+        if hasattr(signal, 'SIGUSR1'): # POSIX only
+            signal.signal(signal.SIGUSR1, lambda signum, frame: Logger.info(f"Latency stats written to {LatencyStats.dump()}")) # kill -USR1 <pid> dumps the stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MacroPad without a GUI") # command line options
+    parser.add_argument("--config", dest="config_file", help="macro config to use (default is resources/macros.json)") # macro file
+    parser.add_argument("--quiet", action="store_true", help="only write the log file, not the console") # console output
+    args = parser.parse_args() # read the options
+
+    if args.quiet: # no console output wanted
+        Settings.LOG_CONSOLE = False # log file only
+    MacroPadService(args.config_file).run() # run until stopped
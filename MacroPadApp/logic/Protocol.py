@@ -0,0 +1,167 @@
+import struct
+
+'''
+Binary framing used by the firmware once the host switches it out of text mode.
+
+Every event is one fixed size frame, little endian:
+
+    sync (0xA5) | version | type | button | sequence (u16) | timestamp ms (u32) | crc8
+
+The CRC-8 (polynomial 0x07) covers every byte between sync and crc. Host to device commands stay text lines.
+'''
+class Protocol:
+    VERSION = 1 # protocol version this host understands
+    SYNC = 0xA5 # first byte of every frame
+    PRESS = 0x01 # frame type for a button going down
+    RELEASE = 0x02 # frame type for a button coming back up
+    FRAME = struct.Struct('<BBBBHIB') # layout of a whole frame
+    FRAME_SIZE = FRAME.size # bytes in a frame
+    MAX_BUTTONS = 32 # highest button id tokens are built for
+    TOKENS = {} # (type, button) to the text token the rest of the app uses, built once below
+    RELEASE_TOKENS = frozenset() # tokens of release events, which have no macro of their own
+    CRC_TABLE = [] # CRC-8 lookup table, built once below
+
+    '''
+    Builds the CRC table and token lookup, run once at import.
+    '''
+    @staticmethod
+    def buildTables():
+        for value in range(256): # every possible byte
+            crc = value # start from the byte itself
+            for _ in range(8): # one step per bit
+                crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF # shift in the polynomial when the top bit is set
+            Protocol.CRC_TABLE.append(crc) # store the result for this byte
+        for button in range(1, Protocol.MAX_BUTTONS + 1): # every button id
+            Protocol.TOKENS[(Protocol.PRESS, button)] = f"Button {button} pressed" # same token the text protocol sends
+            Protocol.TOKENS[(Protocol.RELEASE, button)] = f"Button {button} released" # token for the release
+        Protocol.RELEASE_TOKENS = frozenset(token for (kind, _), token in Protocol.TOKENS.items() if kind == Protocol.RELEASE) # all release tokens
+
+    '''
+    Calculates the CRC-8 of part of a buffer.
+
+    Parameters:
+        data:
+            bytes or bytearray holding the frame
+        start:
+            index of the first byte to include
+        end:
+            index one past the last byte to include
+    Returns:
+        CRC-8 value
+    '''
+    @staticmethod
+    def crc8(data, start, end):
+        crc = 0 # initial value
+        table = Protocol.CRC_TABLE # local name for speed
+        for index in range(start, end): # every covered byte
+            crc = table[crc ^ data[index]] # one table lookup per byte
+        return crc # return the checksum
+
+    '''
+    Builds a frame, used by tests and the benchmark device stand-in.
+
+    Parameters:
+        kind:
+            PRESS or RELEASE
+        button:
+            button id
+        sequence:
+            frame counter
+        timestamp:
+            device time in milliseconds
+    Returns:
+        frame bytes
+    '''
+    @staticmethod
+    def encodeFrame(kind, button, sequence, timestamp):
+        frame = bytearray(Protocol.FRAME.pack(Protocol.SYNC, Protocol.VERSION, kind, button, sequence & 0xFFFF, timestamp & 0xFFFFFFFF, 0)) # frame with an empty crc
+        frame[-1] = Protocol.crc8(frame, 1, Protocol.FRAME_SIZE - 1) # fill in the crc
+        return bytes(frame) # return the finished frame
+
+    '''
+    Builds the text command that stores a button's action on the device.
+
+    Parameters:
+        button:
+            button number
+        action:
+            its action, empty to clear it
+    Returns:
+        command bytes
+    '''
+    @staticmethod
+    def setCommand(button, action):
+        return f"SET{button}{action}\n".encode('utf-8') # same line in text and binary mode
+
+
+Protocol.buildTables() # fill the lookup tables once
+
+
+'''
+Pulls frames out of a stream of bytes, skipping noise and frames that fail their CRC.
+'''
+class FrameParser:
+
+    '''
+    Default constructor for FrameParser.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def __init__(self):
+        self.buffer = bytearray() # bytes received but not parsed yet
+        self.errors = 0 # bytes skipped while looking for a valid frame
+
+    '''
+    Adds received bytes to the buffer.
+
+    Parameters:
+        self:
+            instance of object
+        data:
+            bytes read from the port
+    '''
+    def feed(self, data):
+        self.buffer += data # keep them until a whole frame is there
+
+    '''
+    Takes the next complete, valid frame out of the buffer.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        (type, button, sequence, timestamp) or None if no whole frame is buffered
+    '''
+    def next(self):
+        buffer = self.buffer # local name for speed
+        while True: # until a frame is found or the buffer runs out
+            start = buffer.find(Protocol.SYNC) # look for the start of a frame
+            if start < 0: # no frame start at all
+                self.errors += len(buffer) # everything buffered was noise
+                buffer.clear() # drop it
+                return None # wait for more bytes
+            if start: # noise before the frame start
+                self.errors += start # count the skipped bytes
+                del buffer[:start] # drop them
+            if len(buffer) < Protocol.FRAME_SIZE: # frame not complete yet
+                return None # wait for more bytes
+            if buffer[1] != Protocol.VERSION or Protocol.crc8(buffer, 1, Protocol.FRAME_SIZE - 1) != buffer[Protocol.FRAME_SIZE - 1]: # not a valid frame
+                self.errors += 1 # count the false sync byte
+                del buffer[:1] # skip it and look for the next one
+                continue # try again
+            _, _, kind, button, sequence, timestamp, _ = Protocol.FRAME.unpack_from(buffer) # read the fields
+            del buffer[:Protocol.FRAME_SIZE] # frame has been consumed
+            return kind, button, sequence, timestamp # return the frame fields
+
+    '''
+    Clears everything buffered, used when a new connection starts.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def reset(self):
+        self.buffer.clear() # drop buffered bytes
+        self.errors = 0 # start counting again
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+from logic.Logger import Logger
+
+'''
+The asyncio event loop the connection, device watching and serial reading run on as tasks.
+
+The GUI starts it in a thread of its own with start, the headless service runs it on the main thread with run.
+Other threads reach it through spawn and callSoon, and stop cancels every task and waits for them to finish,
+so shutting down never leaves a read or a reconnect half done.
+'''
+class Runtime:
+
+    '''
+    Default constructor for Runtime.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def __init__(self):
+        self.loop = None # event loop once started
+        self.thread = None # thread running the loop
+        self.background = False # whether the loop runs in a thread started by start
+        self.lock = threading.Lock() # makes start safe to call from several threads
+
+    '''
+    Starts the event loop in a background thread.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        the running event loop
+    '''
+    def start(self):
+        with self.lock: # only one loop
+            if self.thread is None or not self.thread.is_alive(): # not running yet
+                self.loop = asyncio.new_event_loop() # fresh loop
+                self.background = True # stop waits for this thread
+                self.thread = threading.Thread(target=self.runLoop, name="MacroPadRuntime", daemon=True) # thread that runs it
+                self.thread.start() # start running it
+        return self.loop # return the loop
+
+    '''
+    Runs a coroutine on a new event loop in the calling thread until it finishes or stop is called.
+
+    Parameters:
+        self:
+            instance of object
+        coroutine:
+            main coroutine, e.g. ConnectionManager.connectionLoop()
+    '''
+    def run(self, coroutine):
+        with self.lock: # only one loop
+            self.loop = asyncio.new_event_loop() # fresh loop
+            self.thread = threading.current_thread() # the caller runs it
+            self.background = False # stop must not wait for the caller
+        self.runLoop(coroutine) # run until done or stopped
+
+    '''
+    Runs the loop until stopped, then cancels and waits for whatever is left and closes it.
+
+    Parameters:
+        self:
+            instance of object
+        coroutine:
+            coroutine whose end also ends the loop (optional)
+    '''
+    def runLoop(self, coroutine=None):
+        loop = self.loop # loop owned by this thread
+        asyncio.set_event_loop(loop) # tasks created here find it
+        main_task = None # task of the main coroutine, if any
+        stopWith = lambda task: loop.stop() # ends run_forever once the main coroutine is done
+        try: # handle errors with grace
+            if coroutine is not None: # run until the main coroutine ends
+                main_task = loop.create_task(coroutine) # run it as a task
+                main_task.add_done_callback(stopWith) # stop with it
+            loop.run_forever() # run tasks until stop
+            if main_task is not None: # cancelling it below must not stop the loop mid cleanup
+                main_task.remove_done_callback(stopWith) # already stopping
+            tasks = asyncio.all_tasks(loop) # tasks still running
+            for task in tasks: # each one
+                task.cancel() # ask it to finish
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True)) # let their cleanup run
+            loop.run_until_complete(loop.shutdown_asyncgens()) # close async generators
+            loop.run_until_complete(loop.shutdown_default_executor()) # wait for blocking calls handed to threads
+        except Exception as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Error in runtime loop: {e}") # log error
+        finally: # whatever happened
+            loop.close() # release the loop
+
+    '''
+    Schedules a coroutine on the loop, safe to call from any thread.
+
+    Parameters:
+        self:
+            instance of object
+        coroutine:
+            coroutine to run as a task
+    Returns:
+        concurrent.futures.Future of its result
+    '''
+    def spawn(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop) # thread safe hand off
+
+    '''
+    Runs a plain callback on the loop, safe to call from any thread.
+
+    Parameters:
+        self:
+            instance of object
+        callback:
+            function to call
+        args:
+            passed to the callback
+    Returns:
+        whether it was scheduled, False once the loop is gone
+    '''
+    def callSoon(self, callback, *args):
+        loop = self.loop # may be replaced or closed by another thread
+        if loop is None or loop.is_closed(): # nothing to run it
+            return False # dropped
+        try: # handle errors with grace
+            loop.call_soon_threadsafe(callback, *args) # wake the loop and run it next
+            return True # scheduled
+        except RuntimeError: # closed in between
+            return False # dropped
+
+    '''
+    Stops the loop, cancelling every task, safe to call from any thread or a signal handler.
+
+    Parameters:
+        self:
+            instance of object
+        timeout:
+            longest time in seconds to wait for a background loop to finish
+    '''
+    def stop(self, timeout=5):
+        loop, thread = self.loop, self.thread # what is running
+        if loop is None or loop.is_closed(): # nothing running
+            return # nothing to stop
+        self.callSoon(loop.stop) # run_forever returns and runLoop cleans up
+        if self.background and thread is not threading.current_thread(): # a background loop and not called from it
+            thread.join(timeout) # wait for the cleanup to finish
@@ -1,7 +1,10 @@
 import serial
-import serial.tools.list_ports
 import time
+from concurrent.futures import ThreadPoolExecutor
+from logic.LatencyStats import LatencyStats
 from logic.Logger import Logger
+from logic.Protocol import FrameParser, Protocol
+from logic.Settings import Settings
 
 '''
 Handles the serial data sent and received from device.
@@ -16,12 +19,22 @@ class SerialManager:
             instance of object
         baudrate:
             update tick rate of how fast data is transferred (default is 9600)
+        read_timeout:
+            longest time in seconds a blocking read waits for data before giving control back (default is 0.5)
     '''
-    def __init__(self, baudrate=9600):
+    def __init__(self, baudrate=9600, read_timeout=0.5):
         self.baudrate = baudrate # rate at which data is transferred
+        self.read_timeout = read_timeout # how long a blocking read waits for bytes before returning
         self.serial_port = None # port number that the device will connect to
         self.ser = None # serial object once it connects
         self.connected = False # checks whether serial connection is established (default false)
+        self.read_buffer = bytearray() # holds a partial line until its newline arrives
+        self.last_port = None # last port a MacroPad was found on, probed first on reconnect
+        self.protocol = 0 # 0 for text lines, otherwise the binary protocol version agreed with the device
+        self.frame_parser = FrameParser() # turns received bytes into frames in binary mode
+        self.last_sequence = None # sequence number of the last frame, used to spot lost frames
+        self.last_frame = None # fields of the last frame received
+        self.event_arrival = None # time.perf_counter_ns when the bytes of the last event were read from the port
 
     '''
     Lists all available serial ports on the system.
@@ -33,10 +46,64 @@ class SerialManager:
         list of potential serial ports
     '''
     def listSerialPorts(self):
+        import serial.tools.list_ports # imported on first use, it is slow to load and only needed to look for the pad
         return [port.device for port in serial.tools.list_ports.comports()] # iterable of abailable serial ports then creates a list of device attributes which are names of the serial ports
 
     '''
-    Attempts to automatically connect to a serial port by cycling through available ports.
+    Lists the ports worth probing, most likely first.
+
+    Only ports reporting a known MacroPad VID/PID and the last good port are probed, so modems, GPS units and
+    other boards are never opened or written to. Settings.PROBE_ALL_PORTS widens the probe to every port,
+    known boards first. The last good port is moved to the front.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        list of candidate ports and set of the ports whose VID/PID matched
+    '''
+    def listCandidatePorts(self):
+        import serial.tools.list_ports # imported on first use, it is slow to load and only needed to look for the pad
+        ports = serial.tools.list_ports.comports() # all serial ports with their USB metadata
+        known = {port.device for port in ports if (port.vid, port.pid) in Settings.DEVICE_IDS} # ports that look like a MacroPad board
+        candidates = [port.device for port in ports if Settings.PROBE_ALL_PORTS or port.device in known or port.device == self.last_port] # never write to unknown devices unless asked to
+        candidates.sort(key=lambda device: device not in known) # known boards first, keeping the system order otherwise
+        if self.last_port in candidates: # if the last good port is still around
+            candidates.remove(self.last_port) # take it out of its spot
+            candidates.insert(0, self.last_port) # and try it first
+        return candidates, known # return the ordered ports and the matching ones
+
+    '''
+    Opens a port and asks the device on it to identify itself.
+
+    Parameters:
+        self:
+            instance of object
+        port:
+            port to probe
+    Returns:
+        (serial object, ident reply) or None if the port could not be opened
+    '''
+    def probePort(self, port):
+        try: # handle errors with grace
+            ser = serial.Serial(port, self.baudrate, timeout=Settings.PROBE_TIMEOUT, write_timeout=Settings.PROBE_TIMEOUT) # tries to open the serial port with the specified baudrate
+        except (serial.SerialException, OSError) as e: # gracefully handle errors so program doesnt crash
+            Logger.info(f"Failed to connect to {port}: {e}") # log the error and its error message
+            return None # port cannot be used
+        try: # handle errors with grace
+            ser.reset_input_buffer() # drop anything sent before the probe
+            ser.write(Settings.IDENT_REQUEST) # ask the device what it is
+            reply = ser.read_until(b'\n') # wait at most PROBE_TIMEOUT for the answer
+            return ser, reply # port opened, and what the device answered
+        except (serial.SerialException, OSError) as e: # gracefully handle errors so program doesnt crash
+            Logger.info(f"No answer from {port}: {e}") # log the error and its error message
+            return ser, b'' # opened but did not identify
+
+    '''
+    Attempts to automatically connect to a serial port by probing the available ports.
+
+    Candidate ports (see listCandidatePorts) are probed at the same time. A port that answers the ident request
+    wins, otherwise the first port reporting a known VID/PID is used. Ports that do neither are left alone.
 
     Parameters:
         self:
@@ -45,21 +112,110 @@ class SerialManager:
         whether or not a connection was established
     '''
     def autoConnect(self):
-        ports = self.listSerialPorts() # list of abailable serial ports
-        for port in ports: # for each port in the ports list
-            try: # handle errors with grace
-                ser = serial.Serial(port, self.baudrate, timeout=1) # tries to open the serial port with the specified baudrate
-                time.sleep(2) # pause for 2 seconds to ensure the connection is established
-                ser.flushInput() # flushes the input buffer incase of pre existing data
-                self.ser = ser # set instance ser as ser object
-                self.serial_port = port # set instance serial port as the object port
-                self.connected = True # change connection status to true
-                Logger.info(f"Connected to {self.serial_port}") # log that device is successfully connected with its port number
-                return True # return true
-            except (serial.SerialException, OSError) as e: # gracefully handle errors so program doesnt crash
-                Logger.info(f"Failed to connect to {port}: {e}") # log the error and its error message
-                continue # allow passing of except block
-        return False # default assume there was no connection
+        if self.ser: # a port from a connection that dropped is still open
+            self.close() # release it before probing again
+        candidates, known = self.listCandidatePorts() # ordered list of ports to probe
+        if not candidates: # nothing plugged in
+            return False # no connection possible
+        with ThreadPoolExecutor(max_workers=min(len(candidates), Settings.PROBE_WORKERS)) as pool: # probe ports side by side
+            results = dict(zip(candidates, pool.map(self.probePort, candidates))) # port to probe result, in candidate order
+        chosen = next((port for port, result in results.items() if result and result[1].startswith(Settings.IDENT_REPLY)), None) # first port that identified itself
+        if chosen is None: # no port answered the ident request
+            chosen = next((port for port, result in results.items() if result and port in known), None) # fall back to a port with a known VID/PID
+        for port, result in results.items(): # go through every probed port
+            if result and port != chosen: # opened but not used
+                result[0].close() # release it
+        if chosen is None: # no MacroPad found
+            return False # default assume there was no connection
+        self.usePort(chosen, *results[chosen]) # take over the chosen port
+        return True # return true
+
+    '''
+    Connects to one given port without searching, e.g. a pty standing in for the device.
+
+    The port is still asked to identify itself so the protocol can be negotiated, but it is used even if it
+    does not answer.
+
+    Parameters:
+        self:
+            instance of object
+        port:
+            port to connect to
+    Returns:
+        whether or not a connection was established
+    '''
+    def connect(self, port):
+        if self.ser: # a port from an earlier connection is still open
+            self.close() # release it first
+        result = self.probePort(port) # open it and ask what it is
+        if result is None: # port could not be opened
+            return False # no connection
+        self.usePort(port, *result) # take it over
+        return True # return true
+
+    '''
+    Makes an opened and probed port the current connection.
+
+    Parameters:
+        self:
+            instance of object
+        port:
+            name of the port
+        ser:
+            serial object opened by probePort
+        ident:
+            reply the device gave to the ident request
+    '''
+    def usePort(self, port, ser, ident):
+        ser.timeout = self.read_timeout # switch from the probe timeout to the normal read timeout
+        ser.reset_input_buffer() # flushes the input buffer incase of pre existing data
+        self.ser = ser # set instance ser as ser object
+        self.serial_port = port # set instance serial port as the object port
+        self.last_port = port # remember the port so it is tried first next time
+        self.read_buffer.clear() # drop any partial line left over from a previous connection
+        self.connected = True # change connection status to true
+        Logger.info(f"Connected to {self.serial_port}", event='connect', port=self.serial_port) # log that device is successfully connected with its port number
+        self.negotiateProtocol(ident) # switch to binary frames if the firmware supports them
+
+    '''
+    Asks the device to switch to the binary protocol when its ident reply says it supports it.
+
+    Older firmware does not advertise a protocol, or does not confirm the switch, and stays on text lines.
+    Button lines that arrive before the confirmation are kept for readEvent, and when no confirmation comes
+    the device is told to stay on text lines so both sides agree.
+
+    Parameters:
+        self:
+            instance of object
+        ident:
+            reply the device gave to the ident request
+    '''
+    def negotiateProtocol(self, ident):
+        self.protocol = 0 # text lines until the device agrees otherwise
+        self.frame_parser.reset() # nothing from an old connection
+        self.last_sequence = None # sequence numbering starts over
+        offer = f"PROTO {Protocol.VERSION}".encode('ascii') # what the firmware lists when it can send frames
+        if not Settings.USE_BINARY_PROTOCOL or offer not in ident: # disabled or not supported by this firmware
+            return # stay on text lines
+        try: # handle errors with grace
+            self.ser.timeout = Settings.PROBE_TIMEOUT # do not wait long for the answer
+            self.ser.write(offer + b'\n') # ask for the switch
+            deadline = time.monotonic() + Settings.PROBE_TIMEOUT # the answer gets as long as the ident probe
+            while time.monotonic() < deadline: # a key press may be sent before the answer
+                reply = self.ser.read_until(b'\n') # firmware confirms before sending any frame
+                if not reply: # timed out
+                    break # no answer
+                if reply.startswith(b'OK ' + offer): # switch confirmed
+                    self.protocol = Protocol.VERSION # read frames from now on
+                    break # stop reading lines
+                self.read_buffer += reply # a button line sent before the answer, readEvent hands it out
+            if not self.protocol: # never confirmed
+                self.ser.write(b'PROTO 0\n') # make sure the firmware stays on text lines too
+            self.ser.timeout = self.read_timeout # back to the normal read timeout
+            if self.protocol: # switched
+                Logger.info(f"Using binary protocol version {self.protocol}") # log the protocol in use
+        except (serial.SerialException, OSError) as e: # gracefully handle errors so program doesnt crash
+            Logger.warning(f"Protocol negotiation failed, using text lines: {e}") # log the error and its error message
 
     '''
     Checks whether or not a device is connected or not
@@ -106,23 +262,187 @@ class SerialManager:
     '''
     Reads line of data from the serial port if available.
 
+    In blocking mode the call sleeps inside the serial driver (select on the port on POSIX, an overlapped
+    wait on Windows) until bytes arrive, read_timeout passes or cancelRead is called, so nothing has to
+    poll in_waiting in a loop. Partial lines are kept in read_buffer until the rest arrives.
+
     Parameters:
         self:
             instance of object
+        blocking:
+            wait for data instead of returning straight away when nothing is buffered (default is False)
     Returns:
         line of data sent from device
     '''
-    def readLine(self):
-        if self.isConnected() and self.ser.in_waiting: # if there is a connection and data waiting to be read
-            try: # handle errors with grace
-                line = self.ser.readline().decode('utf-8', errors='ignore').strip() # reads the data and decodes the byte data to a 'UTF-8' string
-                Logger.info(f"Received from serial: {line}") # log that data has been recieved from device with the data that was sent
-                return line # return line of data that was sent from device
-            except serial.SerialException as e: # gracefully handle errors so program doesnt crash
-                Logger.error(f"Serial read error: {e}") # log the error and the error message
-                self.disconnect() # send to disconnect method ot handle the disconnection of device
+    def readLine(self, blocking=False):
+        ser = self.ser # keep a reference in case another thread drops the connection mid read
+        if not self.isConnected(): # nothing to read without a connection
+            return None # return early
+        try: # handle errors with grace
+            while b'\n' not in self.read_buffer: # only touch the port when no full line is already buffered
+                if not blocking and not ser.in_waiting: # in non blocking mode only read when data is waiting
+                    return None # nothing waiting so return early
+                chunk = ser.read(ser.in_waiting or 1) # waits at most read_timeout for the first byte then takes everything waiting
+                if not chunk: # timed out or cancelled before anything arrived
+                    return None # no full line yet
+                self.event_arrival = time.perf_counter_ns() # when the line's bytes came off the wire
+                self.read_buffer += chunk # keep the bytes until the rest of the line arrives
+            end = self.read_buffer.index(b'\n') # end of the oldest complete line
+            data = bytes(self.read_buffer[:end]) # copy the line out of the buffer
+            del self.read_buffer[:end + 1] # drop the line and its newline from the buffer
+            line = data.decode('utf-8', errors='ignore').strip() # decodes the byte data to a 'UTF-8' string
+            Logger.info(f"Received from serial: {line}", event='received', button=line, port=self.serial_port) # log that data has been recieved from device with the data that was sent
+            if self.event_arrival is not None: # bytes were read through this manager
+                LatencyStats.record('read', time.perf_counter_ns() - self.event_arrival) # time from the wire to here
+            return line # return line of data that was sent from device
+        except (serial.SerialException, OSError) as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Serial read error: {e}", port=self.serial_port) # log the error and the error message
+            self.disconnect() # send to disconnect method ot handle the disconnection of device
         return None # 
 
+    '''
+    Reads the next event token from the device in whichever protocol was negotiated.
+
+    Parameters:
+        self:
+            instance of object
+        blocking:
+            wait for data instead of returning straight away when nothing is buffered (default is False)
+    Returns:
+        token such as "Button 1 pressed", or None
+    '''
+    def readEvent(self, blocking=False):
+        if self.protocol and b'\n' not in self.read_buffer: # binary frames were negotiated and no line sent before the switch is left
+            return self.readFrame(blocking) # parse frames
+        return self.readLine(blocking) # plain text lines
+
+    '''
+    Reads whatever the port has waiting into the line buffer or frame parser, for when the port is known to be
+    readable so the read does not wait. readEvent(blocking=False) then hands out the complete events.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        whether the connection is still up
+    '''
+    def fillBuffer(self):
+        ser = self.ser # keep a reference in case another thread drops the connection mid read
+        if not self.isConnected(): # nothing to read without a connection
+            return False # return early
+        try: # handle errors with grace
+            chunk = ser.read(ser.in_waiting or 1) # readable means this returns straight away
+        except (serial.SerialException, OSError) as e: # an unplugged port reads as readable with no data
+            Logger.error(f"Serial read error: {e}", port=self.serial_port) # log the error and the error message
+            self.disconnect() # send to disconnect method ot handle the disconnection of device
+            return False # connection is gone
+        if chunk: # bytes arrived
+            self.event_arrival = time.perf_counter_ns() # when they came off the wire
+            if self.protocol: # binary frames
+                self.frame_parser.feed(chunk) # hand the bytes to the parser
+            else: # text lines
+                self.read_buffer += chunk # keep the bytes until the rest of the line arrives
+        return True # still connected
+
+    '''
+    Gets the file descriptor of the open port, for event loops that can watch it.
+
+    Parameters:
+        self:
+            instance of object
+    Returns:
+        file descriptor, or None where the port has none (Windows) or nothing is open
+    '''
+    def fileno(self):
+        try: # handle errors with grace
+            return self.ser.fileno() if self.ser else None # POSIX ports have one
+        except (AttributeError, serial.SerialException, OSError): # no descriptor on this platform
+            return None # the caller falls back to blocking reads
+
+    '''
+    Reads the next binary frame and turns it into its event token.
+
+    The token comes from a prebuilt table so no decoding or string handling happens per event.
+
+    Parameters:
+        self:
+            instance of object
+        blocking:
+            wait for data instead of returning straight away when nothing is buffered (default is False)
+    Returns:
+        token such as "Button 1 pressed", or None
+    '''
+    def readFrame(self, blocking=False):
+        ser = self.ser # keep a reference in case another thread drops the connection mid read
+        if not self.isConnected(): # nothing to read without a connection
+            return None # return early
+        try: # handle errors with grace
+            frame = self.frame_parser.next() # a frame may already be buffered
+            while frame is None: # read until a whole frame has arrived
+                if not blocking and not ser.in_waiting: # in non blocking mode only read when data is waiting
+                    return None # nothing waiting so return early
+                chunk = ser.read(ser.in_waiting or 1) # waits at most read_timeout for the first byte then takes everything waiting
+                if not chunk: # timed out or cancelled before anything arrived
+                    return None # no frame yet
+                self.event_arrival = time.perf_counter_ns() # when the frame's bytes came off the wire
+                self.frame_parser.feed(chunk) # hand the bytes to the parser
+                frame = self.frame_parser.next() # try again with the new bytes
+        except (serial.SerialException, OSError) as e: # gracefully handle errors so program doesnt crash
+            Logger.error(f"Serial read error: {e}", port=self.serial_port) # log the error and the error message
+            self.disconnect() # send to disconnect method ot handle the disconnection of device
+            return None # no frame
+        kind, button, sequence, _ = frame # fields of the frame
+        if self.last_sequence is not None and sequence != (self.last_sequence + 1) & 0xFFFF: # frames went missing in between
+            Logger.warning(f"Lost {(sequence - self.last_sequence - 1) & 0xFFFF} frame(s) from device") # log the gap
+        self.last_sequence = sequence # remember for the next frame
+        self.last_frame = frame # keep the fields for anyone interested in the device timestamp
+        token = Protocol.TOKENS.get((kind, button)) # table lookup of the token
+        if token is None: # type or button this host does not know
+            Logger.warning(f"Unknown frame type {kind} for button {button}") # log the unknown frame
+            return None # nothing to dispatch
+        Logger.info(f"Received from serial: {token}", event='received', button=token, port=self.serial_port) # log that data has been recieved from device with the data that was sent
+        if self.event_arrival is not None: # bytes were read through this manager
+            LatencyStats.record('read', time.perf_counter_ns() - self.event_arrival) # time from the wire to here
+        return token # return the event token
+
+    '''
+    Wakes up a blocking readLine so the reading thread can stop straight away.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def cancelRead(self):
+        if self.ser and hasattr(self.ser, 'cancel_read'): # cancel_read is only available on some pyserial backends
+            try: # handle errors with grace
+                self.ser.cancel_read() # interrupt the pending read
+            except (serial.SerialException, OSError) as e: # gracefully handle errors so program doesnt crash
+                Logger.error(f"Error cancelling serial read: {e}") # log the error with the error message
+
+    '''
+    Handles a connection that dropped while reading or writing.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def disconnect(self):
+        Logger.warning(f"Lost connection to {self.serial_port}") # log that the device went away
+        self.close() # release the port so a reconnect can reopen it
+
+    '''
+    Flags the connection as down from another thread, e.g. when the device is unplugged.
+
+    The port itself is closed by the next autoConnect so a reader blocked on it is never pulled out from under it.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def markDisconnected(self):
+        self.connected = False # isConnected now reports False
+        self.cancelRead() # wake a blocked reader so it notices straight away
+
     '''
     Handles the disconnection of a device so that there are no lingering problems (zombie ports, leaked data, etc).
 
@@ -5,9 +5,55 @@ Contains the settings (hard coded or global) variables that multiple files will
 '''
 class Settings:
     CONFIG_FILE = 'macros.json'  # .json to hold saved macros
+    BINDINGS_FILE = 'bindings.json'  # .json next to the macros holding chords, tap/hold, sequences and layers (optional)
     SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))  # get the directory of the current script
     RESOURCES_DIR = os.path.join(SCRIPT_DIR, '..', 'resources')  # path to the resources folder
-    LOG_FILE = os.path.join(SCRIPT_DIR, 'MacroPad.log')  # log file path inside the GUI folder
+    LOG_FILE = os.path.join(RESOURCES_DIR, 'MacroPad.log')  # log file path inside the resources folder
+    LOG_FORMAT = 'text'  # 'text' lines or 'json' lines with typed fields (event, button, port, duration)
+    LOG_CONSOLE = True  # also print log records to the console
+    LOG_ASYNC = True  # hand log records to a background writer so callers never wait on the disk
+    LOG_QUEUE_SIZE = 10000  # most log records allowed to wait for the background writer
+    LOG_BATCH_SIZE = 256  # flush the log file once this many records have been written
+    LOG_FLUSH_INTERVAL = 0.5  # or once this many seconds have passed since the first unflushed record
+    LOG_DROP_POLICY = 'drop'  # what to do when the queue is full: 'drop' the new record or 'block' the caller
+    LOG_MAX_BYTES = 5 << 20  # rotate the log once it reaches this size, 0 turns size rotation off
+    LOG_ROTATE_INTERVAL = 7 * 24 * 60 * 60  # or once its first line is this many seconds old, 0 turns time rotation off
+    LOG_BACKUP_COUNT = 10  # compressed archives kept next to the log, older ones are removed
+    DEVICE_IDS = [(0x2341, 0x8036), (0x2341, 0x8037), (0x1B4F, 0x9205), (0x1B4F, 0x9206)]  # USB (VID, PID) pairs of ATmega32U4 boards (Leonardo, Pro Micro)
+    IDENT_REQUEST = b'ID?\n'  # sent to a port to ask if a MacroPad is on the other end
+    IDENT_REPLY = b'MACROPAD'  # start of the firmware's answer to IDENT_REQUEST
+    PROBE_TIMEOUT = 0.3  # seconds a port gets to answer IDENT_REQUEST
+    PROBE_WORKERS = 8  # most ports probed at the same time
+    PROBE_ALL_PORTS = False  # also send IDENT_REQUEST to ports without a DEVICE_IDS VID/PID, e.g. a board with a custom USB id
+    MULTI_DEVICE = False  # connect to every MacroPad plugged in (DeviceManager) instead of only the first one found
+    DEVICE_PROFILES = {}  # USB serial number (or port) of a MacroPad -> its own macro config inside the resources folder, others use macros.json
+    USE_BINARY_PROTOCOL = True  # switch firmware that supports it from text lines to binary frames
+    DEVICE_POLL_INTERVAL = 0.25  # seconds between checks for plugged in or removed serial devices
+    DEVICE_POLL_INTERVAL_CONNECTED = 5.0  # seconds between full port scans off Linux while a device is connected
+    WATCH_CONFIG = True  # reload the macros and bindings when their files are edited outside the app
+    CONFIG_POLL_INTERVAL = 1.0  # seconds between checks for config changes where inotify cannot be used
+    CONFIG_RELOAD_DELAY = 0.2  # seconds a changed config must stay unchanged before it is reloaded
+    DEVICE_NAME_PREFIXES = ('ttyACM', 'ttyUSB')  # /dev names of USB serial devices on Linux
+    ACTION_WORKERS = 4  # threads that start macro commands
+    ACTION_MAX_RUNNING = 16  # most macro commands starting, or running with a timeout, at once, extra presses are skipped
+    ACTION_TIMEOUT = None  # default seconds before a macro command is killed, None lets it run
+    ACTION_REAP_INTERVAL = 0.5  # seconds between checks for finished or timed out macro commands
+    DISPATCH_POLICY = {'debounce': 0.03, 'throttle': 0, 'max_in_flight': 0, 'collapse': False}  # per button limits on presses running their action, see DispatchPolicy, max_in_flight is off as a run lasts until its process exits
+    DISPATCH_POLICIES = {}  # button name, e.g. "Button 1 pressed" -> changes to DISPATCH_POLICY for that button only
+    BINDING_HOLD_TIME = 0.2  # seconds a button must be held for its hold action, unless the bindings file sets hold_time
+    BINDING_SEQUENCE_TIMEOUT = 0.4  # seconds allowed between the steps of a sequence, unless the bindings file sets sequence_timeout
+    ACTION_HTTP_TIMEOUT = 5  # seconds an http:/https: action waits for a response
+    SAVE_DEBOUNCE = 0.5  # seconds to wait for more macro edits before saving them all at once
+    ACTION_PLUGINS = []  # modules imported on first use that register extra action schemes with ActionRegistry
+    UI_TICK_INTERVAL = 0.05  # seconds between the GUI applying updates posted by background threads
+    ANALYZER_MAX_LINES = 1000  # most matching lines the log analyzer window keeps on screen
+    ANALYZER_CHUNK_BYTES = 4 << 20  # size of the pieces a keyword search splits the log into
+    ANALYZER_PARALLEL_MIN_BYTES = 16 << 20  # keyword searches over less than this stay in one process
+    ANALYZER_WORKERS = None  # processes used by a keyword search, None uses one per core
+    LATENCY_STATS = True  # record per stage key press latency histograms (see LatencyStats)
+    LATENCY_FILE = 'latency.json'  # where the latency dump is written inside the resources folder
+    LOG_INDEX = True  # keep MacroPad.log.idx next to the log so date and level queries skip the full read
+    LOG_INDEX_BLOCK_BYTES = 1 << 20  # largest stretch of log one index block covers
 
     if not os.path.exists(RESOURCES_DIR): # ensure that the path to the resources folder exists
         os.makedirs(RESOURCES_DIR) # make the directory to the resources folder
@@ -19,6 +65,13 @@ class Settings:
     def getConfigFile():
         return os.path.join(Settings.RESOURCES_DIR, Settings.CONFIG_FILE)  # Return the path inside the resources folder
 
+    '''
+    Getter for the latency dump file
+    '''
+    @staticmethod
+    def getLatencyFile():
+        return os.path.join(Settings.RESOURCES_DIR, Settings.LATENCY_FILE)  # Return the path inside the resources folder
+
     '''
     Getter for the log file
     '''
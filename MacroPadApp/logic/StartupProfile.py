@@ -0,0 +1,127 @@
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+'''
+Startup profile: how long each module took to import and each part of the app took to set up.
+
+Turned on by the MACROPAD_PROFILE_STARTUP environment variable (CleanRun.py --profile-startup sets it). It
+has to be imported before anything worth timing, so the entry points import it first. While on, every first
+import of a module is timed by wrapping __import__, which gives the same self/cumulative split as
+python -X importtime but only for what the app loads, and mark() times the steps of the app's own setup.
+'''
+class StartupProfile:
+    ENVIRONMENT_VARIABLE = 'MACROPAD_PROFILE_STARTUP' # set to anything but 0 to profile the start
+    REPORT_LIMIT = 25 # slowest imports listed in the report
+    enabled = False # whether imports are being timed
+    started = time.perf_counter() # roughly when the process started the app
+    last_mark = started # end of the previous setup step
+    imports = [] # (module, self seconds, cumulative seconds) of every timed import
+    marks = [] # (step, seconds) of every setup step
+    stacks = threading.local() # imports in progress per thread, for the self time
+    original_import = None # builtins.__import__ before it was wrapped
+
+    '''
+    Starts timing imports.
+    '''
+    @staticmethod # static method
+    def enable():
+        if StartupProfile.enabled: # already on
+            return # nothing to do
+        StartupProfile.enabled = True # remember it is on
+        StartupProfile.original_import = builtins.__import__ # keep the real import
+        builtins.__import__ = StartupProfile.timedImport # time every import from now on
+
+    '''
+    Stops timing imports.
+    '''
+    @staticmethod # static method
+    def disable():
+        if StartupProfile.enabled: # only if it was on
+            builtins.__import__ = StartupProfile.original_import # put the real import back
+            StartupProfile.enabled = False # remember it is off
+
+    '''
+    Stands in for __import__ and times the first import of every module.
+
+    Parameters:
+        name, globals, locals, fromlist, level:
+            same as __import__
+    Returns:
+        whatever __import__ returns
+    '''
+    @staticmethod # static method
+    def timedImport(name, globals=None, locals=None, fromlist=(), level=0):
+        try: # handle errors with grace
+            module = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__')) if level else name # absolute name of the module
+        except Exception: # odd relative import, let the real import report it
+            module = name # time it under the name it was asked for
+        if module in sys.modules: # already loaded, nothing to time
+            return StartupProfile.original_import(name, globals, locals, fromlist, level) # plain import
+        stack = StartupProfile.stacks.__dict__.setdefault('stack', []) # this thread's imports in progress
+        stack.append(0.0) # time spent in imports this one makes
+        begin = time.perf_counter() # start of the import
+        try: # whether it works or not
+            return StartupProfile.original_import(name, globals, locals, fromlist, level) # do the import
+        finally: # record the time
+            cumulative = time.perf_counter() - begin # time including nested imports
+            nested = stack.pop() # part spent in nested imports
+            if stack: # made by another import
+                stack[-1] += cumulative # charge it to the outer one as well
+            StartupProfile.imports.append((module, cumulative - nested, cumulative)) # list.append is thread safe
+
+    '''
+    Records a setup step as taking the time since the previous mark.
+
+    Parameters:
+        step:
+            name of what was just set up
+    '''
+    @staticmethod # static method
+    def mark(step):
+        now = time.perf_counter() # end of this step
+        StartupProfile.marks.append((step, now - StartupProfile.last_mark)) # time since the previous step
+        StartupProfile.last_mark = now # next step starts here
+
+    '''
+    Builds the report text.
+
+    Returns:
+        report text
+    '''
+    @staticmethod # static method
+    def report():
+        lines = [f"Startup took {(StartupProfile.last_mark - StartupProfile.started) * 1000:.1f} ms"] # overall time
+        lines.append(f"{'step':<32}{'ms':>10}") # header of the setup steps
+        for step, seconds in StartupProfile.marks: # each step in order
+            lines.append(f"{step:<32}{seconds * 1000:>10.1f}") # one row per step
+        slowest = sorted(StartupProfile.imports, key=lambda entry: entry[2], reverse=True)[:StartupProfile.REPORT_LIMIT] # slowest imports first
+        lines.append(f"{'import':<32}{'self ms':>10}{'total ms':>10}") # header of the imports
+        for module, self_time, cumulative in slowest: # each slow import
+            lines.append(f"{module:<32}{self_time * 1000:>10.1f}{cumulative * 1000:>10.1f}") # one row per import
+        return "\n".join(lines) # return the report
+
+    '''
+    Writes the report to the log and stderr and stops timing imports, once the app is up.
+
+    Parameters:
+        step:
+            name of the last setup step
+    '''
+    @staticmethod # static method
+    def finish(step):
+        if not StartupProfile.enabled: # not profiling
+            return # nothing to report
+        StartupProfile.mark(step) # close the last step
+        StartupProfile.disable() # later imports are not part of the start
+        report = StartupProfile.report() # build the report
+        print(report, file=sys.stderr) # for whoever launched it
+        from logic.Logger import Logger
+        Logger.info(report) # and for later
+
+
+if os.environ.get(StartupProfile.ENVIRONMENT_VARIABLE, '0') not in ('', '0'): # profiling asked for
+    StartupProfile.enable() # start timing before the app imports anything else
@@ -0,0 +1,263 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import select
+import sys
+import tempfile
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) # add parent directory to sys.path to allow imports
+
+from logic.Settings import Settings
+
+'''
+Benchmark of the key press path with a pty standing in for the MacroPad.
+
+A child process plays the firmware on the master side of a pty: it answers the ident and protocol requests and
+then replays a stream of presses at a fixed rate. The app side is the real SerialManager and ConnectionManager
+listener on the slave side, so every press goes through reading, parsing, logging, lookup and dispatch. Runs
+headless on Linux with no hardware, e.g.
+
+    python tests/benchmark.py --count 5000 --rate 1000 --max-p99-ms 5
+'''
+class Benchmark:
+    PRESS_PATTERN = re.compile(r'Received from serial: Button (\d+) pressed') # presses in a recorded log
+
+    '''
+    Default constructor for Benchmark.
+
+    Parameters:
+        self:
+            instance of object
+        buttons:
+            button numbers to press, in order
+        rate:
+            presses per second, 0 sends them as fast as the pty takes them
+        binary:
+            True to use binary frames, False for text lines
+        command:
+            command to run for every press through ActionExecutor, None only times the dispatch
+    '''
+    def __init__(self, buttons, rate, binary, command=None):
+        self.buttons = buttons # presses to replay
+        self.rate = rate # presses per second
+        self.binary = binary # protocol the fake device speaks
+        self.command = command # real command to run per press, if any
+        self.sent = multiprocessing.Array('q', len(buttons), lock=False) # time.perf_counter_ns each press was written
+        self.received = [] # time.perf_counter_ns each press reached run_action
+        self.done = threading.Event() # set once every press was dispatched
+        self.ready = multiprocessing.Event() # tells the device to start sending
+        self.executor = None # ActionExecutor when a real command is run per press
+
+    '''
+    Reads a press stream out of a MacroPad.log.
+
+    Parameters:
+        log_file:
+            log to read
+    Returns:
+        list of button numbers in the order they were pressed
+    '''
+    @staticmethod
+    def loadButtons(log_file):
+        with open(log_file, 'r', errors='replace') as f: # open the log
+            return [int(match.group(1)) for match in map(Benchmark.PRESS_PATTERN.search, f) if match and 1 <= int(match.group(1)) <= 9] # every recorded press of a mapped button
+
+    '''
+    Plays the firmware on the master side of the pty, runs in a child process.
+
+    Parameters:
+        self:
+            instance of object
+        master:
+            file descriptor of the pty master
+    '''
+    def deviceLoop(self, master):
+        from logic.Protocol import Protocol # imported here so the child does not need the app side
+        ident = b"MACROPAD 1 PROTO 1\n" if self.binary else b"MACROPAD 1\n" # same reply as the firmware
+        pending = b'' # host bytes not handled yet
+        while not self.ready.is_set(): # answer the host until it is listening
+            try: # handle errors with grace
+                readable, _, _ = select.select([master], [], [], 0.05) # wait a little for the host
+                if readable: # host sent something
+                    pending += os.read(master, 1024) # take it
+            except OSError: # host closed the port
+                return # nothing more to do
+            while b'\n' in pending: # whole commands
+                line, pending = pending.split(b'\n', 1) # take one
+                line = line.strip() # drop \r and spaces
+                if line == b'ID?': # ident request
+                    os.write(master, ident) # say what this is
+                elif line == b'PROTO 1' and self.binary: # switch to frames
+                    os.write(master, b'OK PROTO 1\n') # confirm it
+        start = time.perf_counter() # when the replay started
+        for number, button in enumerate(self.buttons): # each press
+            if self.rate: # paced replay
+                delay = start + number / self.rate - time.perf_counter() # until this press is due
+                if delay > 0: # early
+                    time.sleep(delay) # wait for it
+            if self.binary: # frames, a press and its release like the firmware
+                data = Protocol.encodeFrame(Protocol.PRESS, button, (number * 2) & 0xFFFF, 0) + Protocol.encodeFrame(Protocol.RELEASE, button, (number * 2 + 1) & 0xFFFF, 0) # press then release
+            else: # text lines only carry presses
+                data = f"Button {button} pressed\n".encode('ascii') # same line as the firmware
+            self.sent[number] = time.perf_counter_ns() # monotonic clock, comparable across processes on Linux
+            os.write(master, data) # blocks if the host falls behind, like a full USB buffer
+
+    '''
+    Called by ConnectionManager for every mapped press.
+
+    Parameters:
+        self:
+            instance of object
+        command:
+            action mapped to the button
+        arrival:
+            time.perf_counter_ns the bytes were read
+        on_exit:
+            called once the action is over
+    Returns:
+        True, the press always counts as started
+    '''
+    def onAction(self, command, arrival=None, on_exit=None):
+        self.received.append(time.perf_counter_ns()) # when the press was dispatched
+        if len(self.received) == len(self.buttons): # last press
+            self.done.set() # wake the main thread
+        if self.executor is None or self.executor.submit(self.command, arrival=arrival, on_exit=on_exit) is None: # no real command, or it was skipped
+            on_exit() # nothing left running
+        return True # started
+
+    '''
+    Runs the benchmark.
+
+    Parameters:
+        self:
+            instance of object
+        timeout:
+            most seconds to wait for every press
+    Returns:
+        dict of results
+    '''
+    def run(self, timeout):
+        master, slave = os.openpty() # pty pair standing in for the USB serial port
+        tty.setraw(slave) # no echo or line editing in between
+        port = os.ttyname(slave) # name the app opens
+        device = multiprocessing.get_context('fork').Process(target=self.deviceLoop, args=(master,), daemon=True) # fake firmware
+        device.start() # before any app threads exist
+
+        from logic.ActionExecutor import ActionExecutor # app side, imported after the fork
+        from logic.ConnectionManager import ConnectionManager
+        from logic.LatencyStats import LatencyStats
+        from logic.MacroManager import MacroManager
+        from logic.SerialManager import SerialManager
+
+        folder = tempfile.TemporaryDirectory() # throwaway macros, removed once the run is over
+        config = os.path.join(folder.name, 'macros.json') # macros file inside it
+        with open(config, 'w') as f: # every button mapped
+            json.dump({f'Button {i} pressed': f'bench:{i}' for i in range(1, 10)}, f) # actions are never run unless --command is given
+        self.executor = ActionExecutor() if self.command else None # real command runner, if wanted
+        serial_manager = SerialManager() # the real reader
+        connection_manager = ConnectionManager(serial_manager, MacroManager(config), lambda message: None, lambda toggled: None, self.onAction) # the real listener
+        if not serial_manager.connect(port): # open the pty and negotiate
+            raise RuntimeError(f"Could not open {port}") # nothing to measure
+        LatencyStats.reset() # only count the benchmark presses
+        usage_before = resource.getrusage(resource.RUSAGE_SELF) # CPU used so far
+        started = time.perf_counter() # wall clock start
+        connection_manager.runtime.start() # event loop the listener runs on
+        connection_manager.startSerialListener() # start reading
+        self.ready.set() # let the device send
+        finished = self.done.wait(timeout) # wait for every press
+        elapsed = time.perf_counter() - started # wall clock time
+        usage_after = resource.getrusage(resource.RUSAGE_SELF) # CPU used by the end
+        connection_manager.stop() # cancel the listener and wait for the loop to finish
+        serial_manager.close() # release the pty
+        device.join(1) # fake device is done
+        os.close(master) # release the master side
+        folder.cleanup() # remove the throwaway macros
+
+        latencies = sorted(received - sent for sent, received in zip(self.sent, self.received)) # wire to dispatch per press
+        cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime) # app CPU seconds
+        return {
+            'presses': len(self.buttons), # presses sent
+            'dispatched': len(self.received), # presses that reached run_action
+            'complete': finished, # every press arrived in time
+            'protocol': 'binary' if self.binary else 'text', # protocol used
+            'rate': self.rate, # requested rate
+            'events_per_second': len(self.received) / elapsed if elapsed else 0, # achieved rate
+            'latency_ms': {name: self.percentile(latencies, fraction) / 1e6 for name, fraction in (('p50', 0.50), ('p90', 0.90), ('p99', 0.99), ('max', 1.0))}, # device write to dispatch
+            'cpu_percent': 100 * cpu / elapsed if elapsed else 0, # app CPU use while running
+            'max_rss_mb': usage_after.ru_maxrss / 1024, # peak memory, ru_maxrss is in KiB on Linux
+            'stages': LatencyStats.summary(), # per stage breakdown from the app itself
+        }
+
+    '''
+    Gets a percentile from a sorted list.
+
+    Parameters:
+        values:
+            sorted values
+        fraction:
+            e.g. 0.99 for p99
+    Returns:
+        the value, 0 for an empty list
+    '''
+    @staticmethod
+    def percentile(values, fraction):
+        if not values: # nothing measured
+            return 0 # nothing to report
+        return values[min(len(values) - 1, max(0, int(fraction * len(values) + 0.999999) - 1))] # nearest rank
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MacroPad key press path against a pty") # command line options
+    parser.add_argument("--count", type=int, default=2000, help="presses to send (default 2000)") # length of the run
+    parser.add_argument("--rate", type=float, default=500, help="presses per second, 0 for as fast as possible (default 500)") # pacing
+    parser.add_argument("--text", action="store_true", help="use text lines instead of binary frames") # protocol
+    parser.add_argument("--replay", metavar="LOG", help="take the button order from a recorded MacroPad.log") # recorded stream
+    parser.add_argument("--command", help="also run this command per press through ActionExecutor") # real spawns
+    parser.add_argument("--timeout", type=float, default=60, help="most seconds to wait for the run") # safety net
+    parser.add_argument("--json", action="store_true", help="print the results as JSON") # for CI
+    parser.add_argument("--max-p99-ms", type=float, help="fail if the p99 latency is above this") # CI gate
+    parser.add_argument("--min-rate", type=float, help="fail if fewer events per second were handled") # CI gate
+    args = parser.parse_args() # read the options
+
+    if sys.platform != 'linux': # pty and fork are needed
+        sys.exit("The benchmark needs Linux") # stop with a message
+    log_dir = tempfile.TemporaryDirectory() # keep benchmark records out of the real log
+    Settings.LOG_FILE = os.path.join(log_dir.name, 'MacroPad.log') # log inside the throwaway folder
+    Settings.LOG_CONSOLE = False # printing every press would dominate the timings
+    Settings.LOG_INDEX = False # not used here
+    Settings.DISPATCH_POLICY = {'debounce': 0, 'throttle': 0, 'max_in_flight': 0, 'collapse': False} # every press must reach the action runner to be timed
+    buttons = Benchmark.loadButtons(args.replay) if args.replay else list(range(1, 10)) # recorded or round robin presses
+    if not buttons: # nothing to replay
+        sys.exit(f"No presses found in {args.replay}") # stop with a message
+    buttons = [buttons[i % len(buttons)] for i in range(args.count)] # repeat to the requested length
+
+    results = Benchmark(buttons, args.rate, not args.text, args.command).run(args.timeout) # run it
+    if args.json: # machine readable
+        print(json.dumps(results, indent=4)) # dump everything
+    else: # human readable
+        from logic.LatencyStats import LatencyStats
+        print(f"{results['dispatched']}/{results['presses']} presses over {results['protocol']} at {results['rate'] or 'max'}/s") # what was run
+        print(f"events/s: {results['events_per_second']:.1f}") # throughput
+        print("latency ms: " + "  ".join(f"{name} {value:.3f}" for name, value in results['latency_ms'].items())) # end to end latency
+        print(f"cpu: {results['cpu_percent']:.1f}%  max rss: {results['max_rss_mb']:.1f} MiB") # resources
+        print(LatencyStats.formatSummary(results['stages'])) # per stage table
+
+    failures = [] # CI gates that failed
+    if not results['complete']: # presses went missing
+        failures.append("not every press was dispatched") # always a failure
+    if args.max_p99_ms is not None and results['latency_ms']['p99'] > args.max_p99_ms: # too slow
+        failures.append(f"p99 {results['latency_ms']['p99']:.3f} ms > {args.max_p99_ms} ms") # note it
+    if args.min_rate is not None and results['events_per_second'] < args.min_rate: # too few events
+        failures.append(f"{results['events_per_second']:.1f} events/s < {args.min_rate}") # note it
+    for failure in failures: # report each
+        print(f"FAIL: {failure}", file=sys.stderr) # on stderr
+    from logic.Logger import Logger
+    Logger.shutdown() # write out and close the benchmark log
+    log_dir.cleanup() # remove its folder
+    sys.exit(1 if failures else 0) # exit code for CI
@@ -3,6 +3,17 @@ from unittest.mock import patch, MagicMock
 import tkinter as tk
 import sys
 import os
+import gc
+import io
+import json
+import logging
+import signal
+import subprocess
+import tempfile
+import time
+import asyncio
+import threading
+import weakref
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) # add parent directory to sys.path to allow imports
 
@@ -24,18 +35,126 @@ try:
 except ModuleNotFoundError as e:
     print(f"Failed to import SerialManager: {e}") # otheriwse if failed print failed with the error message
 
+try:
+    from logic.Settings import Settings # try to import Settings
+    print("Settings imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import Settings: {e}") # otheriwse if failed print failed with the error message
+
 try:
     from logic.AutoStartManager import AutoStartManager # try to import AutoStartManager
     print("AutoStartManager imported successfully!") # if successful then print success
 except ModuleNotFoundError as e:
     print(f"Failed to import AutoStartManager: {e}") # otheriwse if failed print failed with the error message
 
+try:
+    from logic.ActionRegistry import ActionRegistry # try to import ActionRegistry
+    print("ActionRegistry imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import ActionRegistry: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.Protocol import FrameParser, Protocol # try to import Protocol
+    print("Protocol imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import Protocol: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.Logger import AsyncLogHandler, BatchFileHandler, JsonFormatter, Logger # try to import BatchFileHandler
+    print("BatchFileHandler imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import BatchFileHandler: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.LatencyStats import LatencyHistogram, LatencyStats # try to import LatencyStats
+    print("LatencyStats imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import LatencyStats: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.ActionExecutor import ActionExecutor # try to import ActionExecutor
+    print("ActionExecutor imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import ActionExecutor: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.LogAnalyzer import LogAnalyzer # try to import LogAnalyzer
+    print("LogAnalyzer imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import LogAnalyzer: {e}") # otheriwse if failed print failed with the error message
+
 try:
     from logic.ConnectionManager import ConnectionManager # try to import ConnectionManager
     print("ConnectionManager imported successfully!") # if successful then print success
 except ModuleNotFoundError as e:
     print(f"Failed to import ConnectionManager: {e}") # otheriwse if failed print failed with the error message
 
+try:
+    from logic.BindingEngine import BindingMatcher # try to import BindingEngine
+    print("BindingEngine imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import BindingEngine: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.ConfigWatcher import ConfigWatcher # try to import ConfigWatcher
+    print("ConfigWatcher imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import ConfigWatcher: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.DeviceManager import Device, DeviceManager # try to import DeviceManager
+    print("DeviceManager imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import DeviceManager: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.DispatchPolicy import DispatchPolicy # try to import DispatchPolicy
+    print("DispatchPolicy imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import DispatchPolicy: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.Runtime import Runtime # try to import Runtime
+    print("Runtime imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import Runtime: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.DeviceWatcher import DeviceWatcher # try to import DeviceWatcher
+    print("DeviceWatcher imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import DeviceWatcher: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from logic.MacroPadService import MacroPadService # try to import MacroPadService
+    print("MacroPadService imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import MacroPadService: {e}") # otheriwse if failed print failed with the error message
+
+try:
+    from gui.UIDispatcher import UIDispatcher # try to import UIDispatcher
+    print("UIDispatcher imported successfully!") # if successful then print success
+except ModuleNotFoundError as e:
+    print(f"Failed to import UIDispatcher: {e}") # otheriwse if failed print failed with the error message
+
+'''
+Points the log at a temporary folder so running the tests never writes to or rotates resources/MacroPad.log.
+'''
+def setUpModule():
+    global log_dir # removed again in tearDownModule
+    log_dir = tempfile.TemporaryDirectory() # folder for the log of this test run
+    Settings.LOG_FILE = os.path.join(log_dir.name, 'MacroPad.log') # read when the logger is first used
+
+'''
+Closes the log and removes its temporary folder.
+'''
+def tearDownModule():
+    Logger.shutdown() # write out anything still queued
+    for handler in list(Logger.logger.handlers if Logger.logger else []): # file, console or background handler
+        Logger.logger.removeHandler(handler) # detach it
+        handler.close() # release the log file so the folder can be removed
+    log_dir.cleanup() # remove the folder
+
 '''
 Unit tests for MacroPadApp class covering initialization, execution, and integration with managers.
 '''
@@ -64,21 +183,35 @@ class TestMacroPadApp(unittest.TestCase):
         self.assertIsInstance(app.connection_manager, ConnectionManager) # initialization of ConnectionManager
 
     '''
-    Ensure connection thread starts during app initialization.
+    Ensure connection thread starts once the window has been drawn, not during app initialization.
     '''
     @patch("threading.Thread.start")
     def test_connection_manager_thread_starts(self, mock_thread_start):
         app = MacroPadApp(self.root) # set variable app to the MacroPadApp
+        mock_thread_start.assert_not_called() # nothing started before the first frame
+        app.startBackground() # what the idle callback runs after the first draw
         mock_thread_start.assert_called_once() # run thread for connection
 
     '''
-    Validate that a shell command is executed correctly.
+    Validate that a plain command is started directly without a shell.
     '''
     @patch("subprocess.Popen")
     def test_runAction_runs_command(self, mock_popen):
         app = MacroPadApp(self.root) # set variable app to the MacroPadApp
-        test_cmd = "echo hello" # variable for testing
+        test_cmd = "calc.exe" # variable for testing
+        app.runAction(test_cmd) # pass the test variable
+        app.action_executor.drain(timeout=5) # wait for the executor to start it
+        mock_popen.assert_called_once_with([test_cmd], shell=False) # started directly
+
+    '''
+    Validate that a command using shell features still goes through the shell.
+    '''
+    @patch("subprocess.Popen")
+    def test_runAction_uses_shell_when_needed(self, mock_popen):
+        app = MacroPadApp(self.root) # set variable app to the MacroPadApp
+        test_cmd = "dir > out.txt" # redirect needs the shell
         app.runAction(test_cmd) # pass the test variable
+        app.action_executor.drain(timeout=5) # wait for the executor to start it
         mock_popen.assert_called_once_with(test_cmd, shell=True) # pass it through shell
 
     '''
@@ -129,6 +262,7 @@ class TestMacroPadApp(unittest.TestCase):
         app = MacroPadApp(self.root) # set variable app to the MacroPadApp
         bad_cmd = "badcommand" # create fake bad command
         app.runAction(bad_cmd) # pass the mock variable
+        app.action_executor.drain(timeout=5) # wait for the executor to try it
         mock_logger_error.assert_called_once() # check the call
         self.assertIn("Failed to run command", mock_logger_error.call_args[0][0]) # check if equal
 
@@ -146,6 +280,1024 @@ class TestMacroPadApp(unittest.TestCase):
             app.runAction(cmd) # pass the mock variable
             mock_log.assert_any_call(f"Running command: {cmd}") # check if mock variable is passed
 
+'''
+Unit tests for the MacroManager reverse lookup.
+'''
+class TestMacroManager(unittest.TestCase):
+
+    '''
+    Build a manager with a known set of actions and no file writes.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def setUp(self):
+        self.manager = MacroManager() # set variable manager to the MacroManager
+        self.manager.saveActions = MagicMock() # keep the tests from writing to the real config
+        self.manager.button_actions = {f'Button {i} pressed': '' for i in range(1, 10)} # start with every button empty
+        self.manager.button_actions['Button 1 pressed'] = 'echo one' # map one button
+        self.manager.buildIndex() # rebuild the lookup from the known actions
+
+    '''
+    Ensure a mapped token resolves to its button and action.
+    '''
+    def test_lookup_returns_button_and_action(self):
+        self.assertEqual(self.manager.lookupAction('Button 1 pressed'), ('Button 1 pressed', 'echo one')) # check the mapped button
+        self.assertIsNone(self.manager.lookupAction('Button 2 pressed')) # empty buttons are not mapped
+
+    '''
+    Ensure setActions updates the lookup without a rebuild.
+    '''
+    def test_set_actions_updates_lookup(self):
+        self.manager.setActions('Button 2 pressed', 'echo two') # map a new button
+        self.manager.setActions('Button 1 pressed', '') # clear the old one
+        self.assertEqual(self.manager.lookupAction('Button 2 pressed'), ('Button 2 pressed', 'echo two')) # new mapping is found
+        self.assertIsNone(self.manager.lookupAction('Button 1 pressed')) # cleared mapping is gone
+
+'''
+Unit tests for saving macros to disk.
+'''
+class TestMacroManagerSave(unittest.TestCase):
+
+    '''
+    Point a manager at a config inside a temporary folder.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # folder removed after the test
+        self.addCleanup(self.temp_dir.cleanup) # clean the folder up afterwards
+        self.config_file = os.path.join(self.temp_dir.name, 'macros.json') # config path inside the folder
+        self.manager = MacroManager(self.config_file) # set variable manager to the MacroManager
+
+    '''
+    Ensure a burst of edits is written once and leaves no temporary files.
+    '''
+    def test_burst_of_edits_saved_once(self):
+        with patch.object(self.manager, 'flushActions', wraps=self.manager.flushActions) as mock_flush: # count the writes
+            for i in range(1, 10): # edit every button
+                self.manager.setActions(f'Button {i} pressed', f'echo {i}') # change the action
+            self.manager.flushPending() # write the pending save now
+            mock_flush.assert_called_once() # only one write for the whole burst
+        with open(self.config_file) as f: # read back what was written
+            self.assertEqual(json.load(f)['Button 9 pressed'], 'echo 9') # last edit made it to disk
+        self.assertEqual(os.listdir(self.temp_dir.name), ['macros.json']) # temporary file was renamed over the config
+
+    '''
+    Ensure the exit hook writes pending saves and does not keep managers alive.
+    '''
+    def test_exit_hook_flushes_without_keeping_managers(self):
+        self.manager.setActions('Button 1 pressed', 'echo exit') # edit waiting on the debounce
+        MacroManager.flushAll() # what runs at exit
+        with open(self.config_file) as f: # read back what was written
+            self.assertEqual(json.load(f)['Button 1 pressed'], 'echo exit') # the edit made it to disk
+        manager = MacroManager(self.config_file) # a profile that is dropped again
+        reference = weakref.ref(manager) # watch it without keeping it
+        del manager # drop it
+        gc.collect() # collect it now
+        self.assertIsNone(reference()) # nothing held on to it
+
+    '''
+    Ensure an unreadable config is set aside instead of loaded.
+    '''
+    def test_corrupt_config_moved_aside(self):
+        with open(self.config_file, 'w') as f: # write a truncated config
+            f.write('{"Button 1 pressed": "ca') # cut off half way
+        manager = MacroManager(self.config_file) # load the broken file
+        self.assertEqual(manager.getAction('Button 1 pressed'), '') # defaults were used
+        self.assertTrue(os.path.exists(self.config_file + '.corrupt')) # broken file was kept for recovery
+
+'''
+Unit tests for finding the MacroPad among the serial ports.
+'''
+class TestSerialManager(unittest.TestCase):
+
+    '''
+    Make a port as serial.tools.list_ports reports it.
+
+    Parameters:
+        self:
+            instance of object
+        device:
+            port name
+        vid:
+            USB vendor id, None for ports without one
+        pid:
+            USB product id
+    Returns:
+        stand in for a ListPortInfo
+    '''
+    def makePort(self, device, vid=None, pid=None):
+        port = MagicMock() # stand in for the port info
+        port.device, port.vid, port.pid, port.serial_number = device, vid, pid, None # only the fields that are read
+        return port # return the port
+
+    '''
+    Make an opened port that answers the ident request like the firmware.
+
+    Parameters:
+        self:
+            instance of object
+        args, kwargs:
+            what serial.Serial was called with
+    Returns:
+        stand in for a serial.Serial
+    '''
+    def makeSerial(self, *args, **kwargs):
+        ser = MagicMock() # stand in for the port
+        ser.read_until.return_value = b'MACROPAD\n' # ident reply of text only firmware
+        return ser # return the port
+
+    '''
+    Ensure only ports with a MacroPad VID/PID are opened, so unknown devices are never written to.
+    '''
+    @patch('serial.tools.list_ports.comports')
+    def test_unknown_ports_never_opened(self, mock_comports):
+        vid, pid = Settings.DEVICE_IDS[0] # a known board
+        mock_comports.return_value = [self.makePort('/dev/ttyUSB0', 0x067B, 0x2303), self.makePort('/dev/ttyS0'), self.makePort('/dev/ttyACM0', vid, pid)] # modem, built in port, pad
+        with patch('logic.SerialManager.serial.Serial', side_effect=self.makeSerial) as mock_serial: # record every port opened
+            manager = SerialManager() # fresh manager
+            self.assertTrue(manager.autoConnect()) # the pad is found
+        self.assertEqual([call.args[0] for call in mock_serial.call_args_list], ['/dev/ttyACM0']) # nothing else was opened
+        self.assertEqual(manager.getPort(), '/dev/ttyACM0') # connected to the pad
+
+    '''
+    Ensure a key press sent before the firmware confirms the binary protocol is kept and the switch still happens.
+    '''
+    def test_press_during_negotiation_kept(self):
+        ser = MagicMock() # stand in for the port
+        ser.read_until.side_effect = [b'Button 3 pressed\n', b'OK PROTO 1\n'] # press sent just before the answer
+        ser.in_waiting = 0 # no frames yet
+        manager = SerialManager() # fresh manager
+        manager.usePort('/dev/ttyACM0', ser, b'MACROPAD 1 PROTO 1\n') # firmware that supports frames
+        self.assertEqual(manager.protocol, 1) # switched to frames
+        self.assertEqual(manager.readEvent(), "Button 3 pressed") # the press was not lost
+        self.assertIsNone(manager.readEvent()) # nothing else waiting
+        self.assertNotIn(b'PROTO 0\n', [call.args[0] for call in ser.write.call_args_list]) # the switch was not taken back
+
+    '''
+    Ensure the firmware is told to stay on text lines when it never confirms the binary protocol.
+    '''
+    def test_unconfirmed_protocol_falls_back_to_text(self):
+        ser = MagicMock() # stand in for the port
+        ser.read_until.side_effect = [b'Button 2 pressed\n', b''] # a press, then the answer times out
+        ser.in_waiting = 0 # nothing else arrives
+        manager = SerialManager() # fresh manager
+        manager.usePort('/dev/ttyACM0', ser, b'MACROPAD 1 PROTO 1\n') # firmware that supports frames
+        self.assertEqual(manager.protocol, 0) # still text lines
+        self.assertEqual(ser.write.call_args_list[-1].args[0], b'PROTO 0\n') # both sides agree on text
+        self.assertEqual(manager.readEvent(), "Button 2 pressed") # the press was not lost
+
+    '''
+    Ensure readLine keeps partial lines until their newline arrives and hands out several buffered lines one by one.
+    '''
+    def test_read_line_buffers_partial_lines(self):
+        chunks = [b'Button 1 pre', b'ssed\nButton 2 pressed\n'] # a line split across reads, then two lines at once
+        ser = MagicMock(is_open=True, in_waiting=len(chunks[0])) # stand in for the port
+
+        def read(size): # hands out the next chunk, after which nothing is waiting
+            ser.in_waiting = 0 # everything waiting was read
+            return chunks.pop(0) # the chunk
+
+        ser.read.side_effect = read # reads go through the chunks
+        manager = SerialManager() # fresh manager
+        manager.ser, manager.connected = ser, True # connected to the stand in
+        self.assertIsNone(manager.readLine()) # half a line is not returned
+        ser.in_waiting = len(chunks[0]) # the rest arrives
+        self.assertEqual(manager.readLine(), "Button 1 pressed") # joined with the kept half
+        self.assertEqual(manager.readLine(), "Button 2 pressed") # straight from the buffer
+        self.assertEqual(ser.read.call_count, 2) # the second line needed no read
+        ser.in_waiting = 0 # nothing more waiting
+        self.assertIsNone(manager.readLine()) # nothing left
+
+'''
+Unit tests for typed actions in ActionRegistry.
+'''
+class TestActionRegistry(unittest.TestCase):
+
+    '''
+    Ensure registered schemes resolve to their handler and argument.
+    '''
+    def test_scheme_resolves_to_handler(self):
+        handler = MagicMock() # stand in for a plugin handler
+        ActionRegistry.register('test', handler) # register the scheme
+        self.addCleanup(ActionRegistry.cache.clear) # forget lookups that used it
+        self.addCleanup(ActionRegistry.handlers.pop, 'test', None) # unregister it so other tests do not see it
+        resolved = ActionRegistry.resolve('test:hello') # resolve an action using it
+        self.assertEqual(resolved, (handler, 'hello')) # check handler and argument
+
+    '''
+    Ensure external commands are left for the executor to spawn.
+    '''
+    def test_external_command_not_resolved(self):
+        self.assertIsNone(ActionRegistry.resolve('calc.exe')) # plain program
+        self.assertIsNone(ActionRegistry.resolve('C:\\Windows\\notepad.exe')) # drive letters are not schemes
+        self.assertIsNone(ActionRegistry.resolve('echo $HOME')) # echo that needs the shell
+        self.assertIsNone(ActionRegistry.resolve('echo hello')) # plain echo runs as a normal command too
+
+'''
+Unit tests for the binary frame protocol.
+'''
+class TestProtocol(unittest.TestCase):
+
+    '''
+    Ensure frames split across reads and surrounded by noise are parsed.
+    '''
+    def test_parser_resyncs_and_reassembles(self):
+        parser = FrameParser() # set variable parser to the FrameParser
+        frame = Protocol.encodeFrame(Protocol.PRESS, 2, 7, 1234) # frame for button 2
+        parser.feed(b'noise' + frame[:4]) # noise then half a frame
+        self.assertIsNone(parser.next()) # nothing complete yet
+        parser.feed(frame[4:]) # rest of the frame
+        self.assertEqual(parser.next(), (Protocol.PRESS, 2, 7, 1234)) # whole frame comes out
+        self.assertEqual(Protocol.TOKENS[(Protocol.PRESS, 2)], 'Button 2 pressed') # token matches the text protocol
+
+    '''
+    Ensure frames with a bad CRC are dropped.
+    '''
+    def test_parser_rejects_bad_crc(self):
+        parser = FrameParser() # set variable parser to the FrameParser
+        frame = bytearray(Protocol.encodeFrame(Protocol.PRESS, 1, 0, 0)) # valid frame
+        frame[3] = 5 # corrupt the button id
+        parser.feed(bytes(frame)) # feed the corrupted frame
+        self.assertIsNone(parser.next()) # it is rejected
+
+'''
+Unit tests for the log analyzer.
+'''
+class TestLogAnalyzer(unittest.TestCase):
+
+    '''
+    Write a small log to a temporary folder.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # folder removed after the test
+        self.addCleanup(self.temp_dir.cleanup) # clean the folder up afterwards
+        self.log_file = os.path.join(self.temp_dir.name, 'MacroPad.log') # log path inside the folder
+        with open(self.log_file, 'w') as f: # write sample lines
+            f.write("INFO (2025-04-20 17:09:08): Attempting auto-connect...\n")
+            f.write("WARNING (2025-04-20 17:09:10): No action mapped for Button 3 pressed\n")
+            f.write("ERROR (2025-04-21 08:00:00): Serial read error: device reports readiness\n")
+            f.write("Traceback (most recent call last):\n")
+            f.write("INFO (2025-04-22 09:00:00): Received from serial: Button 1 pressed\n")
+
+    '''
+    Ensure the summary counts every level like LogAnalyzer.rs.
+    '''
+    def test_summary_counts_levels(self):
+        summary = LogAnalyzer(self.log_file).analyze() # no filters
+        self.assertEqual(summary, {'total': 5, 'INFO': 2, 'WARN': 1, 'ERROR': 1, 'OTHER': 1}) # every line counted once
+
+    '''
+    Ensure date range and keyword filters combine.
+    '''
+    def test_date_range_and_keyword(self):
+        lines = [] # matching lines
+        summary = LogAnalyzer(self.log_file).analyze(date_start='2025-04-20', date_end='2025-04-21', keyword='SERIAL', line_callback=lines.append) # filter the log
+        self.assertEqual(summary['total'], 1) # only the error line matches
+        self.assertTrue(lines[0].startswith('ERROR')) # and it was passed to the callback
+
+    '''
+    Ensure counts from the index match a full read and new lines are picked up incrementally.
+    '''
+    def test_index_matches_full_read(self):
+        analyzer = LogAnalyzer(self.log_file) # analyzer over the sample log
+        indexed = analyzer.analyze(log_type='info', date_start='2025-04-20', date_end='2025-04-22') # counted from the index
+        self.assertTrue(os.path.exists(self.log_file + '.idx')) # sidecar was written
+        with patch("logic.LogAnalyzer.Settings.LOG_INDEX", False): # same query without the index
+            self.assertEqual(indexed, analyzer.analyze(log_type='info', date_start='2025-04-20', date_end='2025-04-22')) # same answer
+        with open(self.log_file, 'a') as f: # log keeps growing
+            f.write("ERROR (2025-04-22 10:00:00): Serial read error\n")
+        self.assertEqual(analyzer.analyze(date_start='2025-04-22')['ERROR'], 1) # new line found without a rebuild
+
+    '''
+    Ensure a keyword search split over worker processes matches the single process search, lines in file order.
+    '''
+    def test_parallel_keyword_search(self):
+        analyzer = LogAnalyzer(self.log_file) # analyzer over the sample log
+        single_lines = [] # lines from the single process search
+        single = analyzer.analyze(keyword='button', line_callback=single_lines.append) # search in this process
+        parallel_lines = [] # lines from the worker processes
+        with patch("logic.LogAnalyzer.Settings.ANALYZER_CHUNK_BYTES", 64), patch("logic.LogAnalyzer.Settings.ANALYZER_PARALLEL_MIN_BYTES", 0), patch("logic.LogAnalyzer.Settings.ANALYZER_WORKERS", 2): # tiny chunks over two processes
+            parallel = analyzer.analyze(keyword='button', line_callback=parallel_lines.append, max_lines=10) # search in workers
+        self.assertEqual(single, parallel) # same counts
+        self.assertEqual(single_lines, parallel_lines) # same lines in the same order
+        self.assertEqual(single['total'], 2) # both Button lines, case ignored
+
+    '''
+    Ensure the log rotates into gzip archives, old ones are pruned, and the analyzer reads across all of them.
+    '''
+    def test_rotated_archives_are_analyzed(self):
+        os.remove(self.log_file) # start from an empty log
+        with patch("logic.Logger.Settings.LOG_MAX_BYTES", 200), patch("logic.Logger.Settings.LOG_BACKUP_COUNT", 2): # tiny segments, two archives
+            handler = BatchFileHandler(self.log_file) # rotating handler on the temporary log
+            handler.setFormatter(logging.Formatter('%(levelname)s (%(asctime)s): %(message)s', datefmt='%Y-%m-%d %H:%M:%S')) # same format as the app
+            for number in range(12): # enough lines for a few rotations
+                handler.emit(logging.makeLogRecord({'levelno': logging.INFO, 'levelname': 'INFO', 'msg': f"Received from serial: Button {number} pressed"})) # write a line
+                with patch("logic.Logger.time.strftime", return_value=f"20250420-1700{number:02d}"): # distinct archive names
+                    handler.flushBatch() # write it out
+            handler.close() # release the file
+        archives = BatchFileHandler.listArchives(self.log_file) # archives left
+        self.assertEqual(len(archives), 2) # older ones were pruned
+        lines = [] # every line still kept
+        summary = LogAnalyzer(self.log_file).analyze(keyword='button', line_callback=lines.append) # read archives and the live log
+        self.assertEqual(summary['total'], len(lines)) # every counted line was passed on
+        self.assertTrue(lines[-1].endswith("Button 11 pressed")) # newest line last
+        self.assertEqual([int(line.split()[-2]) for line in lines], list(range(12 - len(lines), 12))) # archives in order, no gaps
+
+    '''
+    Ensure the size kept for rotation counts the bytes written, not the characters.
+    '''
+    def test_segment_size_counts_bytes(self):
+        handler = BatchFileHandler(self.log_file) # rotating handler on the sample log
+        handler.emit(logging.makeLogRecord({'levelno': logging.INFO, 'levelname': 'INFO', 'msg': "Updated Button 1 pressed to type:grüße ✓"})) # non-ASCII macro text
+        handler.flushBatch() # write it out
+        self.assertEqual(handler.segment_bytes, os.path.getsize(self.log_file)) # matches the file on disk
+        handler.close() # release the file
+
+    '''
+    Ensure structured lines keep level and date filtering working and can be filtered on their fields.
+    '''
+    def test_structured_fields(self):
+        formatter = JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S') # structured format
+        records = [
+            ('INFO', "Received from serial: Button 2 pressed", {'event': 'received', 'button': 'Button 2 pressed', 'port': 'COM3'}),
+            ('INFO', "Executed action for Button 2 pressed", {'event': 'executed', 'button': 'Button 2', 'port': 'COM3', 'duration': 0.25}),
+            ('ERROR', "Serial read error: gone", {'event': 'error', 'port': 'COM3'}),
+        ] # one of each event kind
+        with open(self.log_file, 'a') as f: # add them after the text lines
+            for levelname, message, fields in records: # each record
+                record = logging.makeLogRecord({'levelname': levelname, 'msg': message, 'fields': fields, 'created': 1745168948.0}) # 2025-04-20 in any time zone
+                f.write(formatter.format(record) + "\n") # one JSON line
+        analyzer = LogAnalyzer(self.log_file) # analyzer over the mixed log
+        self.assertEqual(analyzer.analyze(log_type='error', date_start='2025-04-20', date_end='2025-04-20')['ERROR'], 1) # level and date still work on JSON lines
+        self.assertEqual(analyzer.analyze(fields={'event': 'executed'})['total'], 1) # event filter
+        self.assertEqual(analyzer.analyze(fields={'port': 'COM3'}, min_duration=0.1)['total'], 1) # duration filter
+        self.assertEqual(analyzer.analyze(keyword='button', fields={'event': 'received'})['total'], 1) # combines with the keyword search
+
+'''
+Unit tests for the background log writer.
+'''
+class TestAsyncLogHandler(unittest.TestCase):
+
+    '''
+    Make a handler that records the messages written to it, and can hold the writer on the first record.
+
+    Parameters:
+        self:
+            instance of object
+        block:
+            whether the first record waits until release is set (default is False)
+    Returns:
+        (handler, messages written, event set once a record arrived, event that lets a held record through)
+    '''
+    def makeRecorder(self, block=False):
+        messages, started, release = [], threading.Event(), threading.Event() # what the writer did
+        if not block: # nothing to wait for
+            release.set() # let every record straight through
+
+        def handle(record): # stands in for writing to a file
+            started.set() # the writer has a record
+            release.wait(5) # hold the writer when asked to
+            messages.append(record.getMessage()) # note the record
+
+        handler = MagicMock(level=logging.NOTSET) # stand in for a real handler
+        handler.handle.side_effect = handle # record what is written
+        return handler, messages, started, release # return the handler and its events
+
+    '''
+    Make a log record.
+
+    Parameters:
+        self:
+            instance of object
+        message:
+            text of the record
+    Returns:
+        LogRecord at info level
+    '''
+    def makeRecord(self, message):
+        return logging.makeLogRecord({'msg': message, 'levelno': logging.INFO, 'levelname': 'INFO'}) # plain info record
+
+    '''
+    Waits until a condition holds or a few seconds have passed.
+
+    Parameters:
+        self:
+            instance of object
+        condition:
+            called with no arguments until it returns True
+    Returns:
+        whether the condition held in time
+    '''
+    def waitFor(self, condition):
+        deadline = time.monotonic() + 5 # give the writer thread some time
+        while not condition() and time.monotonic() < deadline: # not there yet
+            time.sleep(0.01) # check again shortly
+        return condition() # return whether it held
+
+    '''
+    Ensure records that do not fit in a full queue are dropped, counted and reported in the log.
+    '''
+    def test_full_queue_counts_drops(self):
+        recorder, messages, started, release = self.makeRecorder(block=True) # writer is held on the first record
+        with patch.object(Settings, 'LOG_QUEUE_SIZE', 2), patch.object(Settings, 'LOG_DROP_POLICY', 'drop'): # tiny queue, drop when full
+            handler = AsyncLogHandler([recorder]) # background writer
+            handler.emit(self.makeRecord("record 0")) # taken by the writer, which then waits
+            self.assertTrue(started.wait(5)) # writer is busy with it
+            for number in range(1, 6): # two fit in the queue, three do not
+                handler.emit(self.makeRecord(f"record {number}")) # never blocks
+            self.assertEqual(handler.dropped, 3) # every lost record counted
+            release.set() # let the writer carry on
+            handler.close() # drain and stop
+        self.assertEqual(messages[:3], ["record 0", "record 1", "record 2"]) # queued records were written in order
+        self.assertIn("Dropped 3 log records because the log queue was full", messages) # the loss shows up in the log
+        self.assertNotIn("record 3", messages) # dropped records were not written
+
+    '''
+    Ensure closing the handler writes every record still waiting in the queue.
+    '''
+    def test_shutdown_writes_queue(self):
+        recorder, messages, started, release = self.makeRecorder(block=True) # writer is held on the first record
+        handler = AsyncLogHandler([recorder]) # background writer
+        for number in range(100): # far more than the writer has taken
+            handler.emit(self.makeRecord(f"record {number}")) # queued
+        self.assertTrue(started.wait(5)) # writer is busy with the first one
+        self.assertFalse(handler.queue.empty()) # the rest are still waiting
+        release.set() # let the writer carry on
+        handler.close() # drain and stop
+        self.assertEqual(messages, [f"record {number}" for number in range(100)]) # nothing was lost
+        self.assertFalse(handler.writer_thread.is_alive()) # writer has stopped
+        recorder.close.assert_called_once() # real handler was closed after the queue drained
+
+    '''
+    Ensure a handler whose stream was closed does not stop the writer from serving the other handlers.
+    '''
+    def test_closed_stream_keeps_writer_alive(self):
+        stream = io.StringIO() # stream of a console handler
+        broken = logging.StreamHandler(stream) # handler that will fail to write and flush
+        stream.close() # e.g. the console went away
+        recorder, messages, started, release = self.makeRecorder() # healthy handler next to it
+        with patch.object(logging, 'raiseExceptions', False): # the failed write is reported quietly
+            handler = AsyncLogHandler([broken, recorder]) # background writer for both
+            handler.emit(self.makeRecord("first")) # fails on the broken handler
+            self.assertTrue(self.waitFor(lambda: recorder.flushBatch.called)) # the batch was flushed, the broken stream included
+            handler.emit(self.makeRecord("second")) # sent after the failures
+            self.assertTrue(self.waitFor(lambda: "second" in messages)) # still written
+            self.assertTrue(handler.writer_thread.is_alive()) # writer survived
+            handler.close() # drain and stop
+        self.assertEqual(messages, ["first", "second"]) # the healthy handler got everything
+
+'''
+Unit tests for the latency histograms.
+'''
+class TestLatencyStats(unittest.TestCase):
+
+    '''
+    Ensure percentiles stay within the bucket precision and the max is exact.
+    '''
+    def test_percentiles_within_precision(self):
+        histogram = LatencyHistogram() # empty histogram
+        for value in range(1, 100001): # 1 ns .. 100 us
+            histogram.record(value * 1000) # in nanoseconds
+        self.assertAlmostEqual(histogram.percentile(0.50), 50000 * 1000, delta=50000 * 1000 * 0.04) # p50 within ~3%
+        self.assertAlmostEqual(histogram.percentile(0.99), 99000 * 1000, delta=99000 * 1000 * 0.04) # p99 within ~3%
+        self.assertEqual(histogram.max, 100000 * 1000) # max is exact
+
+    '''
+    Ensure a submitted action records the spawn and total stages.
+    '''
+    @patch("subprocess.Popen")
+    def test_executor_records_stages(self, mock_popen):
+        LatencyStats.reset() # start clean
+        executor = ActionExecutor() # executor with the default limits
+        executor.submit("calc.exe", arrival=time.perf_counter_ns()).result() # run a command as if a key was pressed
+        summary = LatencyStats.summary() # stats so far
+        self.assertEqual(summary['spawn']['count'], 1) # hand off was recorded
+        self.assertEqual(summary['total']['count'], 1) # and the wire to Popen time
+        executor.shutdown() # stop the workers
+
+'''
+Unit tests for running macro commands.
+'''
+class TestActionExecutor(unittest.TestCase):
+
+    '''
+    Ensure apps left open do not use up the slots, while commands with a timeout still do.
+    '''
+    @patch("subprocess.Popen")
+    def test_open_apps_do_not_hold_slots(self, mock_popen):
+        mock_popen.return_value.poll.return_value = None # every process stays open
+        executor = ActionExecutor(max_running=2) # room for two commands
+        self.addCleanup(executor.shutdown) # stop the workers afterwards
+        for _ in range(3): # more open apps than slots
+            self.assertIsNotNone(executor.submit("notepad.exe", timeout=0).result()) # no timeout, started anyway
+        self.assertIsNotNone(executor.submit("build.bat", timeout=60).result()) # first timed command
+        self.assertIsNotNone(executor.submit("build.bat", timeout=60).result()) # second timed command
+        self.assertIsNone(executor.submit("build.bat", timeout=60)) # both slots are held by timed commands
+        mock_popen.return_value.poll.return_value = 0 # everything exits so the reaper stops
+
+    '''
+    Ensure commands cancelled by shutdown free their slots and report their exit, so drain returns.
+    '''
+    def test_shutdown_releases_queued_commands(self):
+        started, release = threading.Event(), threading.Event() # hold the only worker
+        ActionRegistry.register('block', lambda argument: started.set() or release.wait(5)) # typed action that waits
+        self.addCleanup(ActionRegistry.cache.clear) # forget lookups that used it
+        self.addCleanup(ActionRegistry.handlers.pop, 'block', None) # unregister it so other tests do not see it
+        with patch.object(Settings, 'ACTION_WORKERS', 1): # one worker so the rest have to queue
+            executor = ActionExecutor(max_running=4) # room for all of them
+        exits = [MagicMock() for _ in range(3)] # on_exit of each command
+        futures = [executor.submit("block:", on_exit=on_exit) for on_exit in exits] # one runs, two queue
+        self.assertTrue(started.wait(5)) # the worker is busy
+        executor.shutdown() # cancels the queued two
+        self.assertTrue(all(future.cancelled() for future in futures[1:])) # they never ran
+        release.set() # let the running one finish
+        self.assertTrue(executor.drain(timeout=5)) # every slot was freed
+        for on_exit in exits: # every command
+            on_exit.assert_called_once() # reported its exit
+        self.assertIsNone(executor.submit("block:")) # nothing is accepted after shutdown
+        self.assertEqual(executor.pending, 0) # and the refused command holds no slot
+
+'''
+Unit tests for the UI update channel.
+'''
+class TestUIDispatcher(unittest.TestCase):
+
+    '''
+    Ensure only the latest update per key runs, in posting order, and nothing runs before a drain.
+    '''
+    def test_updates_coalesce(self):
+        dispatcher = UIDispatcher(MagicMock()) # no real window needed to drain by hand
+        applied = [] # updates that ran
+        for dots in range(1, 4): # an animation posting faster than the ticks
+            dispatcher.post('status', applied.append, f"Connecting{'.' * dots}") # same key every time
+        dispatcher.post('buttons', applied.append, True) # a different key
+        dispatcher.post('status', applied.append, "Connected") # status changes again
+        self.assertEqual(applied, []) # posting never touches the UI
+        self.assertEqual(dispatcher.drain(), 2) # one update per key
+        self.assertEqual(applied, [True, "Connected"]) # latest status, after the buttons it followed
+        self.assertEqual(dispatcher.drain(), 0) # nothing left
+
+'''
+Unit tests for the asyncio runtime.
+'''
+class TestRuntime(unittest.TestCase):
+
+    '''
+    Ensure tasks run on the loop thread and stop cancels them and waits for their cleanup.
+    '''
+    def test_stop_cancels_tasks(self):
+        runtime = Runtime() # fresh runtime
+        runtime.start() # loop in its own thread
+        cleaned_up = [] # filled in by the task's cleanup
+
+        async def forever(): # stands in for the connection loop
+            try: # until cancelled
+                await asyncio.sleep(3600) # never finishes on its own
+            finally: # cancelled by stop
+                cleaned_up.append(True) # note the cleanup ran
+
+        async def whereAmI(): # reports the thread it runs on
+            return runtime.thread is threading.current_thread() # true on the loop thread
+
+        runtime.spawn(forever()) # long running task
+        self.assertTrue(runtime.spawn(whereAmI()).result(timeout=5)) # ran on the loop thread
+        runtime.stop() # cancel everything and wait
+        self.assertEqual(cleaned_up, [True]) # cleanup ran before stop returned
+        self.assertFalse(runtime.thread.is_alive()) # loop thread is gone
+        self.assertFalse(runtime.callSoon(print)) # nothing accepted after stop
+
+'''
+Unit tests for noticing serial devices being plugged in and removed.
+'''
+class TestDeviceWatcher(unittest.TestCase):
+
+    '''
+    Runs a watcher for a short while with a fast poll interval.
+
+    Parameters:
+        self:
+            instance of object
+        watcher:
+            DeviceWatcher to run
+        seconds:
+            how long to let it watch
+    '''
+    def runWatcher(self, watcher, seconds):
+        with patch.object(Settings, 'DEVICE_POLL_INTERVAL', 0.01): # check often so the test is quick
+            with self.assertRaises(asyncio.TimeoutError): # watch only stops when cancelled
+                asyncio.run(asyncio.wait_for(watcher.watch(), seconds)) # watch, then cancel it
+
+    '''
+    Ensure ports that appear and disappear between snapshots are reported.
+    '''
+    def test_reports_added_and_removed_ports(self):
+        on_added, on_removed = MagicMock(), MagicMock() # record the callbacks
+        watcher = DeviceWatcher(on_added, on_removed) # no connection state, always scans
+        snapshots = [{'/dev/ttyACM0'}, {'/dev/ttyACM0', '/dev/ttyACM1'}, {'/dev/ttyACM1'}] # pad plugged in, then the first unplugged
+        watcher.snapshot = lambda: snapshots.pop(0) if len(snapshots) > 1 else snapshots[0] # last snapshot repeats
+        self.runWatcher(watcher, 0.2) # long enough for every snapshot
+        on_added.assert_called_once_with({'/dev/ttyACM1'}) # new pad reported
+        on_removed.assert_called_once_with({'/dev/ttyACM0'}) # unplugged pad reported
+
+    '''
+    Ensure full port scans off Linux stop while a device is connected.
+    '''
+    def test_no_full_scans_while_connected(self):
+        watcher = DeviceWatcher(MagicMock(), MagicMock(), lambda: True) # always connected
+        watcher.snapshot = MagicMock(return_value=set()) # count the scans
+        with patch('logic.DeviceWatcher.sys.platform', 'win32'), patch.object(Settings, 'DEVICE_POLL_INTERVAL_CONNECTED', 60): # comports() platform, long connected interval
+            self.runWatcher(watcher, 0.2) # many fast intervals go by
+        self.assertEqual(watcher.snapshot.call_count, 1) # only the first snapshot was taken
+
+'''
+Unit tests for managing several MacroPads at once.
+'''
+class TestDeviceManager(unittest.TestCase):
+
+    '''
+    Build a macro profile mapping one button to a command, without touching the real config.
+
+    Parameters:
+        self:
+            instance of object
+        command:
+            action for Button 1
+    Returns:
+        the MacroManager
+    '''
+    def makeProfile(self, command):
+        folder = tempfile.TemporaryDirectory() # throwaway folder for the profile
+        self.addCleanup(folder.cleanup) # clean the folder up afterwards
+        manager = MacroManager(os.path.join(folder.name, 'macros.json')) # empty profile in the throwaway folder
+        manager.button_actions['Button 1 pressed'] = command # map button 1
+        manager.buildIndex() # rebuild the lookup
+        return manager # return the profile
+
+    '''
+    Make a device on a fake port using a profile.
+
+    Parameters:
+        self:
+            instance of object
+        port:
+            name of the fake port
+        profile:
+            MacroManager of the device
+    Returns:
+        the Device
+    '''
+    def makeDevice(self, port, profile):
+        serial_manager = MagicMock() # stands in for the connection
+        serial_manager.getPort.return_value = port # the port it is on
+        serial_manager.event_arrival = time.perf_counter_ns() # when its last event was read
+        return Device(port, serial_manager, profile) # the device
+
+    '''
+    Ensure events from several devices go through the shared queue and run each device's own macros.
+    '''
+    def test_events_use_each_devices_profile(self):
+        run_action = MagicMock() # records what would have been run
+        manager = DeviceManager(MagicMock(), self.makeProfile('echo default'), MagicMock(), MagicMock(), run_action) # manager with a default profile
+        first = self.makeDevice('/dev/ttyACM0', manager.macro_manager) # pad on the default profile
+        second = self.makeDevice('/dev/ttyACM1', self.makeProfile('echo second')) # pad with its own profile
+
+        async def scenario(): # runs on a throwaway loop
+            manager.queue = asyncio.Queue() # shared dispatch queue
+            dispatcher = asyncio.get_running_loop().create_task(manager.dispatchLoop()) # the single dispatcher
+            first.queueEvent(manager.queue, 'Button 1 pressed') # press on the first pad
+            second.queueEvent(manager.queue, 'Button 1 pressed') # same button on the second pad
+            await manager.queue.join() # wait until both were dispatched
+            dispatcher.cancel() # done
+
+        asyncio.run(scenario()) # run it
+        self.assertEqual([call.args[0] for call in run_action.call_args_list], ['echo default', 'echo second']) # each pad ran its own action, in order
+
+    '''
+    Ensure discovery keeps pads that identify and pads that only match by VID/PID, and never opens other ports.
+    '''
+    @patch('serial.tools.list_ports.comports')
+    def test_discover_probes_only_known_ports(self, mock_comports):
+        vid, pid = Settings.DEVICE_IDS[0] # a known board
+        ports = [] # what list_ports reports
+        for device, port_vid, port_pid in [('/dev/ttyACM0', vid, pid), ('/dev/ttyACM1', vid, pid), ('/dev/ttyUSB0', 0x067B, 0x2303)]: # new firmware pad, old firmware pad, modem
+            port = MagicMock() # stand in for the port info
+            port.device, port.vid, port.pid, port.serial_number = device, port_vid, port_pid, None # only the fields that are read
+            ports.append(port) # report it
+        mock_comports.return_value = ports # every port on the machine
+
+        def openPort(device, *args, **kwargs): # stands in for serial.Serial
+            ser = MagicMock() # the opened port
+            ser.read_until.return_value = b'MACROPAD\n' if device == '/dev/ttyACM0' else b'' # only the new firmware answers ID?
+            return ser # return the port
+
+        manager = DeviceManager(SerialManager(), MagicMock(), MagicMock(), MagicMock(), MagicMock()) # manager probing with a real SerialManager
+        with patch('logic.SerialManager.serial.Serial', side_effect=openPort) as mock_serial: # record every port opened
+            found = manager.discover(set()) # look for pads
+        self.assertEqual(sorted(device_id for device_id, serial_manager in found), ['/dev/ttyACM0', '/dev/ttyACM1']) # both pads are used
+        self.assertNotIn('/dev/ttyUSB0', [call.args[0] for call in mock_serial.call_args_list]) # the modem was never opened
+
+'''
+Unit tests for debouncing and rate limiting button presses.
+'''
+class TestDispatchPolicy(unittest.TestCase):
+
+    '''
+    Ensure presses arriving within the debounce window of the previous press are ignored.
+    '''
+    def test_debounce_ignores_chatter(self):
+        run_action = MagicMock() # records what was run
+        policy = DispatchPolicy(run_action, default={'debounce': 60, 'throttle': 0, 'max_in_flight': 0, 'collapse': False}, overrides={}) # long window so timing cannot flake
+        results = [policy.dispatch('Button 1 pressed', 'echo 1') for _ in range(3)] # a bouncing contact
+        results.append(policy.dispatch('Button 2 pressed', 'echo 2')) # another button is not affected
+        self.assertEqual(results, ['run', 'debounced', 'debounced', 'run']) # only the first press of each button ran
+        self.assertEqual([call.args[0] for call in run_action.call_args_list], ['echo 1', 'echo 2']) # each action ran once
+
+    '''
+    Ensure presses made while an action is still running collapse into a single follow up run.
+    '''
+    def test_collapse_runs_once_after_finishing(self):
+        exits = [] # on_exit callbacks of the runs started so far
+        run_action = MagicMock(side_effect=lambda command, arrival, on_exit: exits.append(on_exit) or True) # keeps every run going until told
+        policy = DispatchPolicy(run_action, default={'debounce': 0, 'throttle': 0, 'max_in_flight': 1, 'collapse': True}, overrides={}) # one run at a time
+        self.assertEqual(policy.dispatch('Button 1 pressed', 'echo 1'), 'run') # first press runs
+        self.assertEqual([policy.dispatch('Button 1 pressed', 'echo 1') for _ in range(5)], ['collapsed'] * 5) # repeats wait
+        self.assertEqual(run_action.call_count, 1) # nothing else started yet
+        exits[0]() # the first run finishes
+        self.assertEqual(run_action.call_count, 2) # exactly one follow up run
+        exits[1]() # which finishes too
+        self.assertEqual(run_action.call_count, 2) # and nothing more is waiting
+
+    '''
+    Ensure a press the action runner refuses is reported as rejected and does not keep its slot.
+    '''
+    def test_refused_action_is_rejected(self):
+        run_action = MagicMock(return_value=None) # the action runner is full
+        policy = DispatchPolicy(run_action, default={'debounce': 0, 'throttle': 0, 'max_in_flight': 1, 'collapse': False}, overrides={}) # one run at a time
+        self.assertEqual(policy.dispatch('Button 1 pressed', 'echo 1'), 'rejected') # not reported as run
+        run_action.return_value = True # room again
+        self.assertEqual(policy.dispatch('Button 1 pressed', 'echo 1'), 'run') # the slot was freed
+
+'''
+Unit tests for chords, tap/hold, sequences and layers.
+'''
+class TestBindingEngine(unittest.TestCase):
+
+    '''
+    Build a profile with bindings in a throwaway folder and a matcher following it.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def setUp(self):
+        self.matcher = self.makeMatcher({
+            'base': {'1+2': 'echo chord', '3': {'tap': 'echo tap', 'hold': 'layer:fn'}, '4 5': 'echo sequence'},
+            'fn': {'1': 'echo fn'},
+        }) # one of each kind
+
+    '''
+    Write bindings to a throwaway folder and make a matcher following them.
+
+    Parameters:
+        self:
+            instance of object
+        layers:
+            layer name -> bindings, as in bindings.json
+    Returns:
+        BindingMatcher of the profile
+    '''
+    def makeMatcher(self, layers):
+        temp_dir = tempfile.TemporaryDirectory() # keeps the real config untouched
+        self.addCleanup(temp_dir.cleanup) # clean the folder up afterwards
+        with open(os.path.join(temp_dir.name, 'bindings.json'), 'w') as f: # bindings next to the macros
+            json.dump({'hold_time': 0.2, 'sequence_timeout': 0.4, 'layers': layers}, f) # fixed timings
+        self.manager = MacroManager(os.path.join(temp_dir.name, 'macros.json')) # compiles on load
+        return BindingMatcher(self.manager) # follows presses and releases
+
+    '''
+    Feed timed events to the matcher.
+
+    Parameters:
+        self:
+            instance of object
+        events:
+            list of (time, button, 'pressed' or 'released')
+    Returns:
+        list of the actions run
+    '''
+    def feed(self, events):
+        ran = [] # actions in order
+        for now, button, kind in events: # every event
+            fired, mapped = self.matcher.feed(f"Button {button} {kind}", now) # follow it
+            ran += [action for label, action in fired] # keep what ran
+        return ran # return the actions
+
+    '''
+    Ensure two buttons pressed together run the chord and not either button.
+    '''
+    def test_chord(self):
+        self.assertEqual(self.feed([(0, 1, 'pressed'), (0.01, 2, 'pressed'), (0.05, 1, 'released'), (0.06, 2, 'released')]), ['echo chord']) # chord only
+
+    '''
+    Ensure a short press taps, and holding switches layer until released.
+    '''
+    def test_tap_and_held_layer(self):
+        self.assertEqual(self.feed([(0, 3, 'pressed'), (0.05, 3, 'released')]), ['echo tap']) # quick press
+        self.assertEqual(self.feed([(1, 3, 'pressed'), (1.3, 1, 'pressed'), (1.35, 1, 'released')]), ['echo fn']) # held past hold_time, fn layer is in use
+        self.assertEqual(self.feed([(1.4, 3, 'released'), (2, 1, 'pressed'), (2.05, 1, 'released')]), []) # back on base, button 1 alone is unbound there
+
+    '''
+    Ensure a sequence runs once its last step is pressed, and a timed out one does nothing.
+    '''
+    def test_sequence(self):
+        self.assertEqual(self.feed([(0, 4, 'pressed'), (0.05, 4, 'released'), (0.1, 5, 'pressed')]), ['echo sequence']) # both steps in time
+        self.assertEqual(self.feed([(1, 4, 'pressed'), (1.05, 4, 'released'), (2, 5, 'pressed')]), []) # too slow
+
+    '''
+    Ensure a button rolled in while a chord is pending runs the tap that was down and then its own action.
+    '''
+    def test_rolled_press_during_chord(self):
+        self.matcher = self.makeMatcher({'base': {'1': 'echo one', '1+2': 'echo chord', '3': 'echo three'}}) # 1 could still become the chord
+        self.assertEqual(self.feed([(0, 1, 'pressed'), (0.02, 3, 'pressed'), (0.05, 1, 'released'), (0.07, 3, 'released')]), ['echo one', 'echo three']) # neither press is lost
+        self.assertEqual(self.feed([(1, 1, 'pressed'), (1.01, 2, 'pressed'), (1.05, 1, 'released'), (1.06, 2, 'released')]), ['echo chord']) # the chord still works
+
+'''
+Unit tests for reloading the macro config when it is edited outside the app.
+'''
+class TestConfigReload(unittest.TestCase):
+
+    '''
+    Build a saved profile in a throwaway folder.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # keeps the real config untouched
+        self.addCleanup(self.temp_dir.cleanup) # clean the folder up afterwards
+        self.config = os.path.join(self.temp_dir.name, 'macros.json') # config inside the folder
+        self.manager = MacroManager(self.config) # starts empty
+        self.manager.setActions('Button 1 pressed', 'echo one') # one mapped button
+        self.manager.flushPending() # saved straight away
+
+    '''
+    Ensure only the buttons edited in the file are reported and swapped in, and our own saves are skipped.
+    '''
+    def test_reload_reports_only_changes(self):
+        self.assertEqual(self.manager.reloadActions(), {}) # the file is our own save
+        edited = dict(self.manager.getAllActions(), **{'Button 1 pressed': '', 'Button 3 pressed': 'echo three'}) # clear one, map another
+        with open(self.config, 'w') as f: # edit it like a text editor would
+            json.dump(edited, f) # write the new actions
+        self.assertEqual(self.manager.reloadActions(), {'Button 1 pressed': '', 'Button 3 pressed': 'echo three'}) # just the two edits
+        self.assertIsNone(self.manager.lookupAction('Button 1 pressed')) # cleared button is unmapped
+        self.assertEqual(self.manager.lookupAction('Button 3 pressed'), ('Button 3 pressed', 'echo three')) # new one is live
+        fired, mapped = BindingMatcher(self.manager).feed('Button 3 pressed', 0) # compiled bindings follow the reload
+        self.assertEqual(fired, [('Button 3 pressed', 'echo three')]) # runs the new action
+
+    '''
+    Ensure a half written file keeps the current actions.
+    '''
+    def test_reload_keeps_actions_on_bad_file(self):
+        with open(self.config, 'w') as f: # caught mid write
+            f.write('{"Button 1 pressed": ') # not valid JSON yet
+        self.assertEqual(self.manager.reloadActions(), {}) # nothing changed
+        self.assertEqual(self.manager.getAction('Button 1 pressed'), 'echo one') # still mapped
+
+    '''
+    Ensure the polling fallback notices a file being written.
+    '''
+    def test_polling_notices_writes(self):
+        watcher = ConfigWatcher(lambda: [self.config], None) # no callback needed for polling
+        watcher.stamps = {os.path.abspath(self.config): (0, 0)} # an older version was seen
+        watcher.pollFiles() # compare with the file on disk
+        self.assertEqual(watcher.pending, {os.path.abspath(self.config)}) # reported once settled
+
+'''
+Unit tests for the headless service.
+'''
+class TestMacroPadService(unittest.TestCase):
+
+    '''
+    Make a service on a macro config inside a temporary folder, without touching the pads or the test log.
+
+    Parameters:
+        self:
+            instance of object
+    '''
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # folder removed after the test
+        self.addCleanup(self.temp_dir.cleanup) # clean the folder up afterwards
+        self.config_file = os.path.join(self.temp_dir.name, 'macros.json') # config path inside the folder
+        self.service = MacroPadService(self.config_file) # service under test
+        self.service.serial_manager.autoConnect = MagicMock(return_value=False) # never probe real ports
+        log_shutdown = patch('logic.MacroPadService.Logger.shutdown') # the rest of the suite still logs
+        log_shutdown.start() # keep the log open
+        self.addCleanup(log_shutdown.stop) # until the test is over
+
+    '''
+    Ensure importing the service loads no GUI packages, which is what keeps it quick to start.
+    '''
+    def test_import_skips_gui_packages(self):
+        code = "import sys, logic.MacroPadService; print('GUI packages:', ' '.join(sorted({'tkinter', '_tkinter', 'pystray', 'PIL'} & set(sys.modules))) or 'none')" # list the GUI packages loaded
+        result = subprocess.run([sys.executable, '-c', code], cwd=os.path.join(os.path.dirname(__file__), '..'), capture_output=True, text=True, timeout=60) # fresh interpreter
+        self.assertEqual(result.returncode, 0, result.stderr) # imported fine
+        self.assertIn("GUI packages: none", result.stdout.splitlines()) # none of them were loaded
+
+    '''
+    Ensure stop ends run from another thread and the service shuts down.
+    '''
+    def test_stop_ends_run(self):
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK', 'SIGUSR1'): # handlers run installs
+            if hasattr(signal, name): # not every platform has every signal
+                self.addCleanup(signal.signal, getattr(signal, name), signal.getsignal(getattr(signal, name))) # put the test runner's back
+        with patch.object(self.service, 'shutdown', wraps=self.service.shutdown) as mock_shutdown: # watch for the shutdown
+            timer = threading.Timer(0.3, self.service.stop) # stop once the loop is running
+            timer.start() # start the countdown
+            started = time.monotonic() # when run was called
+            self.service.run() # returns once stopped
+            timer.join() # the stop has finished
+        self.assertLess(time.monotonic() - started, 10) # stopped promptly
+        self.assertTrue(self.service.stop_event.is_set()) # the stop was seen
+        mock_shutdown.assert_called_once() # everything was released
+
+    '''
+    Ensure shutdown writes macro edits still waiting on the save debounce.
+    '''
+    def test_shutdown_flushes_pending_macros(self):
+        self.service.macro_manager.setActions('Button 1 pressed', 'echo saved') # edit waiting on the debounce
+        self.service.shutdown() # stop straight away
+        with open(self.config_file) as f: # read back what was written
+            self.assertEqual(json.load(f)['Button 1 pressed'], 'echo saved') # the edit made it to disk
+
+'''
+Unit tests for the startup profile and the imports the GUI entry point defers.
+'''
+class TestStartupProfile(unittest.TestCase):
+
+    '''
+    Runs Python code in a fresh interpreter from the app folder, as the entry points are run.
+
+    Parameters:
+        self:
+            instance of object
+        code:
+            code to run
+        args:
+            command line arguments, in sys.argv[1:]
+        env:
+            extra environment variables (optional)
+    Returns:
+        CompletedProcess with the text output
+    '''
+    def runPython(self, code, *args, env=None):
+        result = subprocess.run([sys.executable, '-c', code, *args], cwd=os.path.join(os.path.dirname(__file__), '..'), env=dict(os.environ, **(env or {})), capture_output=True, text=True, timeout=60) # nothing loaded yet
+        self.assertEqual(result.returncode, 0, result.stderr) # ran fine
+        return result # return the output
+
+    '''
+    Ensure the profile variable CleanRun.py --profile-startup sets times imports and steps, and finish reports once.
+    '''
+    def test_profile_records_steps_and_reports_once(self):
+        log_dir = tempfile.TemporaryDirectory() # keep the report out of the real log
+        self.addCleanup(log_dir.cleanup) # clean the folder up afterwards
+        code = "\n".join([
+            "import sys",
+            "from logic.StartupProfile import StartupProfile",
+            "from logic.Settings import Settings",
+            "Settings.LOG_FILE, Settings.LOG_CONSOLE = sys.argv[1], False",
+            "import colorsys",
+            "StartupProfile.mark('managers')",
+            "StartupProfile.finish('window')",
+            "StartupProfile.finish('window')",
+            "print('steps:', ' '.join(step for step, seconds in StartupProfile.marks))",
+            "print('timed:', any(module == 'colorsys' for module, self_time, total in StartupProfile.imports))",
+            "print('enabled:', StartupProfile.enabled)",
+        ]) # a start with two steps that finishes twice
+        result = self.runPython(code, os.path.join(log_dir.name, 'MacroPad.log'), env={'MACROPAD_PROFILE_STARTUP': '1'}) # profiling on from the start
+        lines = result.stdout.splitlines() # what it printed
+        self.assertIn("steps: managers window", lines) # both steps recorded in order
+        self.assertIn("timed: True", lines) # the import was timed
+        self.assertIn("enabled: False", lines) # import timing stopped at the finish
+        self.assertEqual(result.stderr.count("Startup took"), 1) # reported once
+
+    '''
+    Ensure importing the GUI entry point leaves the extra windows, the tray icon packages and winreg for later.
+    '''
+    def test_gui_defers_imports(self):
+        deferred = ['gui.InfoWindow', 'gui.LogAnalyzerWindow', 'logic.LogAnalyzer', 'pystray', 'PIL', 'winreg'] # loaded on first use
+        result = self.runPython(f"import sys, gui.MacroPadGUI; print('loaded:', ' '.join(sorted(set({deferred!r}) & set(sys.modules))) or 'none')") # import only, no window
+        self.assertIn("loaded: none", result.stdout.splitlines()) # none of them were loaded
+
 '''
 Main entry to run tests.
 '''
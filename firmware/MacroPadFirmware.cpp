@@ -6,29 +6,174 @@ const int num_buttons = 9; // total number of buttons
 
 char key_chars[] = {'1', '2', '3', '4', '5', '6', '7', '8', '9'}; // characters/keys to send for each button
 
-bool button_state[num_buttons]; // to keep track of button state
-bool last_button_state[num_buttons]; // to keep track of last button state
+bool button_state[num_buttons]; // to keep track of the debounced button state
+unsigned long last_change_ms[num_buttons]; // when each button last changed state, for its debounce window
+unsigned int debounce_ms[num_buttons] = {5, 5, 5, 5, 5, 5, 5, 5, 5}; // debounce window of each button in milliseconds, raise it for a noisy switch
+
+const unsigned long scan_interval_us = 500; // scan every button every 0.5 ms (2 kHz)
+unsigned long last_scan_us = 0; // when the last scan happened
+
+// pending button events, filled by the scan and drained to the host without blocking
+struct ButtonEvent {
+  byte type; // frame_press or frame_release
+  byte button; // button id starting at 1
+  unsigned long time_ms; // when the edge was seen
+};
+const byte event_queue_size = 32; // must be a power of two
+ButtonEvent event_queue[event_queue_size]; // ring buffer of events
+byte event_head = 0; // next slot to write
+byte event_tail = 0; // next slot to send
+unsigned int events_dropped = 0; // events lost because the queue was full
+
+const char ident_reply[] = "MACROPAD 1 PROTO 1"; // answer to the host's "ID?" probe, lists the binary protocol versions supported
+
+// binary event frame: sync | version | type | button | sequence (u16) | timestamp ms (u32) | crc8, little endian
+const byte frame_sync = 0xA5; // first byte of every frame
+const byte protocol_version = 1; // version of the frame layout
+const byte frame_press = 0x01; // frame type for a button going down
+const byte frame_release = 0x02; // frame type for a button coming back up
+bool binary_mode = false; // text lines until the host asks for frames
+unsigned int frame_sequence = 0; // counts frames so the host can spot lost ones
+char command_buffer[64]; // holds a command from the host until its newline arrives
+int command_length = 0; // number of characters in command_buffer
 
 void setup() {
   for(int i=0;i<num_buttons;i++){ // for each button
     pinMode(button_pins[i], INPUT_PULLUP); //
     button_state[i] = HIGH; // initialize assuming buttons are not pressed
-    last_button_state[i] = HIGH; // set last state as HIGH
+    last_change_ms[i] = 0; // no change seen yet
   }
   Keyboard.begin(); // start listening
+  Serial.begin(9600); // serial link to the host app
 }
 
-void loop() {
-  for(int i=0;i<num_buttons;i++){ // for each button 
-    button_state[i] = digitalRead(button_pins[i]); // read current state of the button (LOW when pressed)
+// reads commands from the host without blocking and answers the ident probe
+void readHostCommands() {
+  while(Serial.available() > 0){ // for each byte waiting from the host
+    char c = Serial.read(); // take the next byte
+    if(c == '\n'){ // end of a command
+      command_buffer[command_length] = '\0'; // terminate the string
+      if(strcmp(command_buffer, "ID?") == 0){ // host is probing for the pad
+        binary_mode = false; // a new host session always starts in text mode
+        Serial.println(ident_reply); // tell it what we are
+      }else if(strcmp(command_buffer, "PROTO 1") == 0){ // host asks for binary frames
+        Serial.println("OK PROTO 1"); // confirm in text before the first frame
+        binary_mode = true; // send frames from now on
+        frame_sequence = 0; // number frames from zero for this session
+      }else if(strcmp(command_buffer, "PROTO 0") == 0){ // host asks for text lines
+        binary_mode = false; // send text from now on
+      }
+      command_length = 0; // start the next command
+    }else if(c != '\r' && command_length < (int)sizeof(command_buffer) - 1){ // skip carriage returns and keep the byte if there is room
+      command_buffer[command_length++] = c; // keep the byte
+    }
+  }
+}
+
+// CRC-8 with polynomial 0x07 over len bytes
+byte crc8(const byte *data, int len) {
+  byte crc = 0; // initial value
+  for(int i=0;i<len;i++){ // for each byte
+    crc ^= data[i]; // mix the byte in
+    for(int bit=0;bit<8;bit++){ // one step per bit
+      crc = (crc & 0x80) ? (byte)((crc << 1) ^ 0x07) : (byte)(crc << 1); // shift in the polynomial when the top bit is set
+    }
+  }
+  return crc; // return the checksum
+}
+
+// tells the host about a button event, as a frame or a text line depending on the mode
+void sendEvent(byte type, byte button, unsigned long now) {
+  if(binary_mode){ // host asked for frames
+    byte frame[11]; // whole frame
+    frame[0] = frame_sync; // start of frame
+    frame[1] = protocol_version; // layout version
+    frame[2] = type; // press or release
+    frame[3] = button; // button id starting at 1
+    frame[4] = frame_sequence & 0xFF; // sequence low byte
+    frame[5] = (frame_sequence >> 8) & 0xFF; // sequence high byte
+    frame[6] = now & 0xFF; // timestamp, lowest byte first
+    frame[7] = (now >> 8) & 0xFF;
+    frame[8] = (now >> 16) & 0xFF;
+    frame[9] = (now >> 24) & 0xFF;
+    frame[10] = crc8(frame + 1, 9); // checksum of everything between sync and crc
+    Serial.write(frame, sizeof(frame)); // send it in one go
+    frame_sequence++; // next frame number
+  }else if(type == frame_press){ // text mode only reports presses
+    Serial.print("Button "); // same line format the host has always matched
+    Serial.print(button);
+    Serial.println(" pressed");
+  }
+}
+
+// bytes sendEvent writes for an event in the current mode, so it is only called when they fit without blocking
+int eventBytes(byte type) {
+  if(binary_mode){ // host asked for frames
+    return 11; // one whole frame
+  }
+  return type == frame_press ? 18 : 0; // "Button N pressed\r\n", text mode does not report releases
+}
+
+// adds an event to the queue, counting it as dropped if the queue is full
+void queueEvent(byte type, byte button, unsigned long now) {
+  byte next = (event_head + 1) & (event_queue_size - 1); // slot after the head
+  if(next == event_tail){ // queue is full
+    events_dropped++; // count the lost event
+    if(binary_mode){ // frames carry a sequence number
+      frame_sequence++; // skip a number so the host sees the gap
+    }
+    return;
+  }
+  event_queue[event_head].type = type; // store the event
+  event_queue[event_head].button = button;
+  event_queue[event_head].time_ms = now;
+  event_head = next; // publish it
+}
+
+// reads every button once and queues an event for each debounced edge
+void scanButtons() {
+  unsigned long now = millis(); // time of this scan
+  for(int i=0;i<num_buttons;i++){ // for each button
+    bool reading = digitalRead(button_pins[i]); // read current state of the button (LOW when pressed)
+    if(reading == button_state[i]){ // no change
+      continue;
+    }
+    if(now - last_change_ms[i] < debounce_ms[i]){ // still bouncing from the last change
+      continue; // ignore it
+    }
+    button_state[i] = reading; // accept the first edge straight away, later bounces fall inside the window
+    last_change_ms[i] = now; // start the debounce window
+    queueEvent(reading == LOW ? frame_press : frame_release, i + 1, now); // LOW is pressed
+  }
+}
 
-    if(button_state[i] != last_button_state[i] && button_state[i] == LOW){ // check if button state has changed (HIGH -> LOW)
-      Keyboard.press(key_chars[i]); // press the corresponding key
-    }else if(button_state[i] != last_button_state[i] && button_state[i] == HIGH){ // check if button state has changed (LOW -> HIGH)
-      Keyboard.release(key_chars[i]); // release the corresponding key
+// sends the key for every queued event, and tells the host when the USB buffer has room, never waits
+void drainEvents() {
+  while(event_tail != event_head){ // something queued
+    ButtonEvent &event = event_queue[event_tail]; // oldest event
+    if(event.type == frame_press){ // button went down
+      Keyboard.press(key_chars[event.button - 1]); // press the corresponding key, even when the host app is not reading
+    }else{ // button came up
+      Keyboard.release(key_chars[event.button - 1]); // release the corresponding key
     }
+    if(Serial && Serial.availableForWrite() >= eventBytes(event.type)){ // host has the port open and its buffer has room for the whole message
+      sendEvent(event.type, event.button, event.time_ms); // tell the host
+    }else if(Serial){ // host connected but its buffer is full
+      events_dropped++; // count the lost serial event, the key itself was still sent
+      if(binary_mode){ // frames carry a sequence number
+        frame_sequence++; // skip a number so the host sees the gap
+      }
+    }
+    event_tail = (event_tail + 1) & (event_queue_size - 1); // event has been handled
+  }
+}
 
-    last_button_state[i] = button_state[i]; // update last button state
+void loop() {
+  unsigned long now_us = micros(); // current time
+  if(now_us - last_scan_us >= scan_interval_us){ // time for the next scan
+    last_scan_us = now_us; // remember when it happened
+    scanButtons(); // read the buttons, no delay() anywhere so the loop keeps spinning
   }
-  delay(50); // delay for debouncing
+  drainEvents(); // send what the scan found
+  readHostCommands(); // answer anything the host sent
 }